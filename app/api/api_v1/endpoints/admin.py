@@ -1,47 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.db.session import get_db
-from app.models.models import User, Wallet, Transaction, TransactionStatus, TransactionType, CurrencyType
-from app.schemas.schemas import AdminStats, TopUser, TransactionInDB
+from app.models.models import User, UserTxSummary, Transaction, TransactionStatus, TransactionType, CurrencyType, from_minor_units
+from app.schemas.schemas import AdminStats, TopUser, TransactionInDB, UserBalancesPage, VolumeSeries
 from app.api.deps import get_current_admin_user
-from app.services.fraud_detection import FraudDetectionService
-from datetime import datetime, timedelta
+from app.api.pagination import decode_cursor, encode_cursor
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.fraud_detection import FraudDetectionService, clear_flag
+from app.services.fraud_queue import fraud_queue
+from app.services.leaderboard import top_by_currency, top_by_total, top_k_streamed
+from app.services.balances import WalletBusy
+from app.services.system_counters import (
+    FLAGGED_TRANSACTIONS, TRANSACTIONS, USERS, WALLETS, read_counters, volume_counter
+)
+from app.services.transaction_hooks import cancel_transaction, complete_transaction
+from app.services.transaction_export import EXPORT_FORMATS
+from app.services.user_balances import balances_page, export_balances
+from app.services.checkpoints import get_checkpoint
+from app.services.volume_rollups import (
+    BUCKET_WIDTH, DEFAULT_SERIES_SPAN, MAX_SERIES_BUCKETS, ROLLUPS, VOLUME_ROLLUP_CHECKPOINT,
+    record_rollup_changes, rollup_row, volume_series
+)
+from datetime import datetime, timedelta, timezone
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Dashboards poll the stats from many tabs; they share one computation per TTL
+stats_cache = TTLCache(maxsize=1, ttl=settings.ADMIN_STATS_CACHE_TTL_SECONDS)
+
+
+def compute_admin_stats(db: Session) -> AdminStats:
+    """System-wide statistics from the maintained counters, in one small query"""
+    counters = read_counters(db)
+    return AdminStats(
+        total_users=counters[USERS],
+        total_transactions=counters[TRANSACTIONS],
+        total_volume={
+            currency.value: from_minor_units(counters[volume_counter(currency)], currency)
+            for currency in CurrencyType
+        },
+        flagged_transactions=counters[FLAGGED_TRANSACTIONS],
+        active_wallets=counters[WALLETS]
+    )
+
 @router.get("/stats", response_model=AdminStats)
 def get_admin_stats(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get system-wide statistics"""
+    """Get system-wide statistics, at most ADMIN_STATS_CACHE_TTL_SECONDS old"""
     try:
-        total_users = db.query(func.count(User.id)).filter(User.is_deleted == False).scalar() or 0
-        total_transactions = db.query(func.count(Transaction.id)).scalar() or 0
-        
-        # Calculate total volume per currency
-        total_volume = {}
-        for currency in CurrencyType:
-            volume = db.query(func.sum(Transaction.amount)).filter(
-                Transaction.currency == currency,
-                Transaction.status == TransactionStatus.COMPLETED
-            ).scalar() or 0
-            total_volume[currency.value] = float(volume)  # Ensure float value
-        
-        flagged_transactions = db.query(func.count(Transaction.id)).filter(
-            Transaction.is_flagged == True
-        ).scalar() or 0
-        
-        return AdminStats(
-            total_users=total_users,
-            total_transactions=total_transactions,
-            total_volume=total_volume,
-            flagged_transactions=flagged_transactions
-        )
+        return stats_cache.get_or_compute("stats", lambda: compute_admin_stats(db))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching admin stats: {str(e)}")
 
@@ -77,26 +92,40 @@ def get_flagged_transactions(
             detail=f"Error retrieving flagged transactions: {str(e)}"
         )
 
-@router.get("/user-balances", response_model=List[Dict[str, Any]])
+@router.get("/user-balances", response_model=UserBalancesPage)
 def get_user_balances(
     current_admin: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    currency: Optional[CurrencyType] = None,
+    min_balance: Optional[float] = None,
+    stream: bool = False
 ):
-    """Get total balances for all users"""
+    """
+    Get balances for all users, a page at a time, or streamed as NDJSON with stream=true.
+    currency narrows the balances to one currency; min_balance (which needs it) keeps users holding at least that much.
+    """
     try:
-        users = db.query(User).filter(User.is_deleted == False).all()
-        balances = []
-        
-        for user in users:
-            wallet = db.query(Wallet).filter(Wallet.user_id == user.id).first()
-            if wallet:
-                balances.append({
-                    "user_id": user.id,
-                    "email": user.email,
-                    "balances": wallet.balances
-                })
-        
-        return balances
+        if min_balance is not None and currency is None:
+            raise HTTPException(status_code=422, detail="min_balance needs a currency")
+        if stream:
+            logger.info(f"Admin {current_admin.id} exporting user balances")
+            return StreamingResponse(
+                export_balances(db.get_bind(), currency, min_balance),
+                media_type=EXPORT_FORMATS["ndjson"],
+                headers={"Content-Disposition": "attachment; filename=user-balances.ndjson"}
+            )
+
+        before = decode_cursor(cursor, (User.id,))[0] if cursor else None
+        items = balances_page(db, limit + 1, before, currency, min_balance)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]["user_id"])
+        return {"items": items, "next_cursor": next_cursor}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving user balances: {str(e)}")
         raise HTTPException(
@@ -104,51 +133,99 @@ def get_user_balances(
             detail=f"Error retrieving user balances: {str(e)}"
         )
 
+@router.get("/volume-series", response_model=VolumeSeries)
+def get_volume_series(
+    current_admin: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db),
+    granularity: str = "hour",  # or "day"
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    currency: Optional[CurrencyType] = None,
+    type: Optional[TransactionType] = None,
+    status_filter: Optional[TransactionStatus] = Query(None, alias="status")
+):
+    """
+    Transaction count, volume and flagged count per time bucket and currency,
+    read from the hourly or daily rollups. Defaults to the last 48 hours or
+    30 days; the latest transactions show up once the rollup job has run.
+    """
+    try:
+        if granularity not in ROLLUPS:
+            raise HTTPException(status_code=422, detail="Invalid granularity. Must be 'hour' or 'day'")
+        if start is not None and start.tzinfo is not None:
+            start = start.astimezone(timezone.utc).replace(tzinfo=None)
+        if end is not None and end.tzinfo is not None:
+            end = end.astimezone(timezone.utc).replace(tzinfo=None)
+        end = end or datetime.utcnow()
+        start = start or end - DEFAULT_SERIES_SPAN[granularity]
+        if start >= end:
+            raise HTTPException(status_code=422, detail="start must be before end")
+        if (end - start) / BUCKET_WIDTH[granularity] > MAX_SERIES_BUCKETS:
+            raise HTTPException(
+                status_code=422, detail=f"Range spans more than {MAX_SERIES_BUCKETS} {granularity} buckets"
+            )
+
+        mark = get_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT)
+        return {
+            "granularity": granularity,
+            "as_of": mark.last_created_at if mark else None,
+            "points": volume_series(db, granularity, start, end, currency, type, status_filter)
+        }
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error retrieving volume series: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving volume series: {str(e)}"
+        )
+
 @router.get("/top-users", response_model=List[Dict[str, Any]])
 def get_top_users(
     current_admin: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db),
     by: str = "balance",  # or "volume"
-    limit: int = 10
+    limit: int = 10,
+    currency: Optional[CurrencyType] = None,
+    currencies: Optional[str] = Query(None, description="Comma-separated currencies to total on the fly, e.g. USD,EUR")
 ):
-    """Get top users by balance or transaction volume"""
+    """
+    Get top users by balance or transaction volume.
+    By balance: the FX-normalized total across currencies, or the balance in
+    one currency; currencies= totals an ad-hoc set with a streamed top-k.
+    """
     try:
         if by == "balance":
-            # Get users with highest total balance across all currencies
-            users = db.query(User).join(Wallet).order_by(
-                func.jsonb_array_length(Wallet.balances).desc()
-            ).limit(limit).all()
-            
-            return [
-                {
-                    "user_id": user.id,
-                    "email": user.email,
-                    "total_balance": sum(
-                        float(amount) for amount in user.wallet.balances.values()
-                    )
-                }
-                for user in users
-            ]
+            if currencies:
+                try:
+                    selected = [CurrencyType(code.strip().upper()) for code in currencies.split(",") if code.strip()]
+                except ValueError as ve:
+                    raise HTTPException(status_code=422, detail=str(ve))
+                return top_k_streamed(db, selected, limit)
+            if currency is not None:
+                return top_by_currency(db, currency, limit)
+            return top_by_total(db, limit)
         else:  # by volume
-            # Get users with highest transaction volume
-            users = db.query(
-                User,
-                func.count(Transaction.id).label('transaction_count')
-            ).join(
-                Transaction,
-                (User.id == Transaction.sender_id) | (User.id == Transaction.receiver_id)
-            ).group_by(User.id).order_by(
-                func.count(Transaction.id).desc()
+            # Get users with highest transaction volume, from the maintained summaries
+            transaction_count = func.sum(
+                UserTxSummary.sent_count + UserTxSummary.received_count
+            ).label('transaction_count')
+            users = db.query(User.id, User.email, transaction_count).join(
+                UserTxSummary, UserTxSummary.user_id == User.id
+            ).group_by(User.id, User.email).order_by(
+                transaction_count.desc()
             ).limit(limit).all()
             
             return [
                 {
-                    "user_id": user.id,
-                    "email": user.email,
+                    "user_id": user_id,
+                    "email": email,
                     "transaction_count": count
                 }
-                for user, count in users
+                for user_id, email, count in users
             ]
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving top users: {str(e)}")
         raise HTTPException(
@@ -159,13 +236,16 @@ def get_top_users(
 @router.get("/fraud-scan", response_model=List[Dict[str, Any]])
 def run_fraud_scan(
     current_admin: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    engine: Optional[str] = None
 ):
     """Run fraud detection scan on recent transactions"""
     try:
         fraud_service = FraudDetectionService(db)
-        suspicious_transactions = fraud_service.scan_recent_transactions()
+        suspicious_transactions = fraud_service.scan_recent_transactions(engine=engine)
         return suspicious_transactions
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e:
         logger.error(f"Error running fraud scan: {str(e)}")
         raise HTTPException(
@@ -173,6 +253,29 @@ def run_fraud_scan(
             detail=f"Error running fraud scan: {str(e)}"
         )
 
+@router.get("/fraud-scan/graph", response_model=List[Dict[str, Any]])
+def run_transfer_graph_scan(
+    current_admin: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Flag transfer cycles and fan-in/fan-out patterns"""
+    try:
+        fraud_service = FraudDetectionService(db)
+        return fraud_service.scan_transfer_graph()
+    except Exception as e:
+        logger.error(f"Error running transfer graph scan: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error running transfer graph scan: {str(e)}"
+        )
+
+@router.get("/fraud-queue", response_model=Dict[str, Any])
+def get_fraud_queue_stats(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get depth and lag of the background fraud check queue"""
+    return fraud_queue.stats()
+
 @router.post("/transactions/{transaction_id}/review")
 def review_transaction(
     transaction_id: int,
@@ -180,7 +283,12 @@ def review_transaction(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Review a flagged transaction"""
+    """
+    Review a flagged transaction.
+    Approving clears the flag and completes a pending transaction, moving
+    its funds. Rejecting cancels the transaction and, if it completed, moves
+    its funds back and reverses its ledger entries.
+    """
     try:
         transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
         if not transaction:
@@ -192,26 +300,29 @@ def review_transaction(
         if action not in ["approve", "reject"]:
             raise HTTPException(status_code=400, detail="Invalid action. Must be 'approve' or 'reject'")
         
-        if action == "approve":
-            transaction.status = TransactionStatus.COMPLETED
-            transaction.is_flagged = False
-            transaction.flag_reason = None
-            
-            # Process the transaction
-            currency = transaction.currency.value
-            if transaction.transaction_type == TransactionType.TRANSFER:
-                sender_wallet = db.query(Wallet).filter(Wallet.user_id == transaction.sender_id).first()
-                receiver_wallet = db.query(Wallet).filter(Wallet.user_id == transaction.receiver_id).first()
-                
-                if sender_wallet and receiver_wallet:
-                    sender_wallet.balances[currency] = sender_wallet.balances.get(currency, 0) - transaction.amount
-                    receiver_wallet.balances[currency] = receiver_wallet.balances.get(currency, 0) + transaction.amount
-        else:  # reject
-            transaction.status = TransactionStatus.REJECTED
-            transaction.is_flagged = False
+        if not clear_flag(db, transaction_id):
+            raise HTTPException(status_code=409, detail="Transaction was reviewed concurrently")
+        reviewed = rollup_row(transaction)
+
+        try:
+            if action == "approve":
+                if transaction.status == TransactionStatus.PENDING:
+                    complete_transaction(db, transaction)
+                transaction.flag_reason = None
+            else:  # reject
+                cancel_transaction(db, transaction)
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=f"Cannot {action} transaction: {str(ve)}")
+        record_rollup_changes(db, [reviewed], [reviewed._replace(is_flagged=False, status=transaction.status)])
         
         db.commit()
         return {"message": f"Transaction {action}d successfully"}
+    except HTTPException as he:
+        db.rollback()
+        raise he
+    except WalletBusy as wb:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(wb))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error reviewing transaction: {str(e)}") 
\ No newline at end of file
@@ -6,6 +6,7 @@ from app.db.session import get_db
 from app.models.models import User, Wallet
 from app.schemas.schemas import UserCreate, UserInDB, Token
 from app.api.deps import get_current_active_user
+from app.services.system_counters import USERS, WALLETS, bump_counters
 
 router = APIRouter()
 
@@ -26,6 +27,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         full_name=user.full_name
     )
     db.add(db_user)
+    bump_counters(db, {USERS: 1})
     db.commit()
     db.refresh(db_user)
     
@@ -41,6 +43,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         }
     )
     db.add(wallet)
+    bump_counters(db, {WALLETS: 1})
     db.commit()
     
     return db_user
@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.db.session import get_db
-from app.models.models import User, Wallet, Transaction, TransactionType, TransactionStatus, CurrencyType
-from app.schemas.schemas import TransactionCreate, TransactionInDB, TransactionUpdate
+from app.models.models import (
+    User, Wallet, Transaction, TransactionType, TransactionStatus, CurrencyType, from_minor_units, to_minor_units
+)
+from app.schemas.schemas import (
+    TransactionCreate, TransactionInDB, TransactionUpdate, TransactionPage,
+    TransactionBatchCreate, TransactionBatchResult
+)
 from app.api.deps import get_current_user, get_current_admin_user
-from app.services.fraud_detection import FraudDetectionService
+from app.api.pagination import after_cursor, page_of, paginate
+from app.core.config import settings
+from app.services.transaction_hooks import cancel_transaction, on_transactions_pending, on_transactions_committed
+from app.services.transaction_export import EXPORT_FORMATS, export_transactions
+from app.services.fraud_detection import ScanRow, clear_flag, flag_for_review
+from app.services.system_counters import WALLETS, bump_counters
+from app.services.volume_rollups import record_rollup_changes, rollup_row
+from app.services.balances import WalletBusy, apply_delta, bump_versions, claim_wallet, deposit, transfer, withdraw
+from app.services.idempotency import (
+    IdempotencyKeyReused, cache_response, key_locks, request_hash, save_response, stored_response
+)
 from datetime import datetime
 import logging
 import traceback
@@ -13,6 +31,23 @@ import traceback
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+PAGE_KEYS = (Transaction.created_at, Transaction.id)
+
+
+def _party_transactions_page(db: Session, user_id: int, limit: int, cursor: Optional[str]) -> dict:
+    """
+    A page of the transactions a user sent or received.
+    Each side is paged on its own so it can seek its own index, then the two are merged.
+    """
+    legs = [
+        after_cursor(db.query(Transaction).filter(column == user_id), PAGE_KEYS, cursor).limit(limit + 1).all()
+        for column in (Transaction.sender_id, Transaction.receiver_id)
+    ]
+    # Deposits and withdrawals show up on both sides
+    merged = {transaction.id: transaction for leg in legs for transaction in leg}
+    rows = sorted(merged.values(), key=lambda t: (t.created_at, t.id), reverse=True)
+    return page_of(rows[:limit + 1], PAGE_KEYS, limit)
+
 @router.get("/debug/user/{user_id}", response_model=Dict[str, Any])
 def debug_user(
     user_id: int,
@@ -49,17 +84,18 @@ def debug_user(
             detail=f"Error checking user: {str(e)}"
         )
 
-@router.get("/admin/all", response_model=List[TransactionInDB])
+@router.get("/admin/all", response_model=TransactionPage)
 def get_all_transactions(
     current_admin: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
 ):
-    """Get all transactions (admin only)"""
+    """Get all transactions, newest first (admin only)"""
     try:
-        transactions = db.query(Transaction).order_by(Transaction.created_at.desc()).offset(skip).limit(limit).all()
-        return transactions
+        return paginate(db.query(Transaction), PAGE_KEYS, limit, cursor)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving all transactions: {str(e)}")
         raise HTTPException(
@@ -67,19 +103,47 @@ def get_all_transactions(
             detail=f"Error retrieving transactions: {str(e)}"
         )
 
-@router.get("/admin/user/{user_id}", response_model=List[TransactionInDB])
+@router.get("/admin/export")
+def export_all_transactions(
+    current_admin: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    currency: Optional[CurrencyType] = None,
+    type: Optional[TransactionType] = None
+):
+    """Stream transactions as NDJSON or CSV, optionally filtered (admin only)"""
+    criteria = []
+    if start:
+        criteria.append(Transaction.created_at >= start)
+    if end:
+        criteria.append(Transaction.created_at < end)
+    if currency:
+        criteria.append(Transaction.currency == currency)
+    if type:
+        criteria.append(Transaction.type == type)
+
+    logger.info(f"Admin {current_admin.id} exporting transactions as {format}")
+    return StreamingResponse(
+        export_transactions(db.get_bind(), criteria, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=transactions.{format}"}
+    )
+
+@router.get("/admin/user/{user_id}", response_model=TransactionPage)
 def get_user_transactions(
     user_id: int,
     current_admin: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
 ):
-    """Get all transactions for a specific user (admin only)"""
+    """Get transactions for a specific user, newest first (admin only)"""
     try:
-        transactions = db.query(Transaction).filter(
-            (Transaction.sender_id == user_id) |
-            (Transaction.receiver_id == user_id)
-        ).order_by(Transaction.created_at.desc()).all()
-        return transactions
+        return _party_transactions_page(db, user_id, limit, cursor)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving user transactions: {str(e)}")
         raise HTTPException(
@@ -94,7 +158,12 @@ def update_transaction(
     current_admin: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Update a transaction (admin only)"""
+    """
+    Update a transaction (admin only).
+    Flag changes and cancellations go through the same paths as a review, so
+    counters, summaries, ledger and volume rollups follow; a transaction can be cancelled
+    or failed here but not completed.
+    """
     try:
         transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
         if not transaction:
@@ -103,16 +172,50 @@ def update_transaction(
                 detail="Transaction not found"
             )
 
-        # Update transaction fields
-        for field, value in transaction_update.dict(exclude_unset=True).items():
-            setattr(transaction, field, value)
+        changes = transaction_update.dict(exclude_unset=True)
+        before = rollup_row(transaction)
+        new_status = changes.get("status")
+        if new_status not in (None, transaction.status, TransactionStatus.CANCELLED, TransactionStatus.FAILED):
+            raise HTTPException(
+                status_code=422,
+                detail="Transactions can only be cancelled or failed by an update"
+            )
+
+        is_flagged = before.is_flagged
+        if changes.get("is_flagged") is True and not transaction.is_flagged:
+            reason = changes.get("flag_reason") or transaction.flag_reason or "Flagged by admin"
+            if not flag_for_review(db, transaction_id, reason):
+                raise HTTPException(status_code=409, detail="Transaction was flagged concurrently")
+            is_flagged = True
+        elif changes.get("is_flagged") is False and transaction.is_flagged:
+            if not clear_flag(db, transaction_id):
+                raise HTTPException(status_code=409, detail="Transaction was reviewed concurrently")
+            is_flagged = False
+            if "flag_reason" in changes:
+                transaction.flag_reason = changes["flag_reason"]
+        elif "flag_reason" in changes:
+            transaction.flag_reason = changes["flag_reason"]
+
+        if new_status is not None and new_status != transaction.status:
+            try:
+                cancel_transaction(db, transaction, new_status)
+            except ValueError as ve:
+                raise HTTPException(status_code=400, detail=f"Cannot cancel transaction: {str(ve)}")
+        after = before._replace(is_flagged=is_flagged, status=transaction.status)
+        if after != before:
+            record_rollup_changes(db, [before], [after])
 
         db.commit()
         db.refresh(transaction)
         return transaction
     except HTTPException as he:
+        db.rollback()
         raise he
+    except WalletBusy as wb:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(wb))
     except Exception as e:
+        db.rollback()
         logger.error(f"Error updating transaction: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -154,6 +257,7 @@ def admin_create_transaction(
                 created_at=datetime.utcnow()
             )
             db.add(user_wallet)
+            bump_counters(db, {WALLETS: 1})
             db.commit()
             db.refresh(user_wallet)
             logger.info(f"Created new wallet for user {user.id}")
@@ -173,26 +277,27 @@ def admin_create_transaction(
         )
 
         # Process transaction
-        currency = transaction.currency.value
-        if transaction.type == TransactionType.DEPOSIT:
-            user_wallet.balances[currency] = user_wallet.balances.get(currency, 0) + transaction.amount
-        elif transaction.type == TransactionType.WITHDRAWAL:
-            if user_wallet.balances.get(currency, 0) < transaction.amount:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient {currency} balance. Current balance: {user_wallet.balances.get(currency, 0)}"
-                )
-            user_wallet.balances[currency] = user_wallet.balances.get(currency, 0) - transaction.amount
+        try:
+            if transaction.type == TransactionType.DEPOSIT:
+                deposit(db, user_wallet.id, transaction.currency, transaction.amount)
+            elif transaction.type == TransactionType.WITHDRAWAL:
+                withdraw(db, user_wallet.id, transaction.currency, transaction.amount)
+        except ValueError as ve:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
 
         db.add(new_transaction)
+        on_transactions_pending(db, new_transaction)
         db.commit()
         db.refresh(new_transaction)
+        on_transactions_committed(new_transaction)
         
         logger.info(f"Admin created transaction {new_transaction.id} for user {user.id}")
         return new_transaction
 
     except HTTPException as he:
         raise he
+    except WalletBusy as wb:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(wb))
     except Exception as e:
         logger.error(f"Error creating transaction: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -201,21 +306,22 @@ def admin_create_transaction(
             detail=f"Error creating transaction: {str(e)}"
         )
 
-@router.get("/", response_model=List[TransactionInDB])
+@router.get("/", response_model=TransactionPage)
 def get_transactions(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
 ):
-    """Get user's transactions"""
+    """Get user's transactions, newest first"""
     try:
-        transactions = db.query(Transaction).filter(
-            (Transaction.sender_id == current_user.id) |
-            (Transaction.receiver_id == current_user.id)
-        ).order_by(Transaction.created_at.desc()).all()
+        page = _party_transactions_page(db, current_user.id, limit, cursor)
         
-        logger.info(f"Retrieved {len(transactions)} transactions for user {current_user.id}")
-        return transactions
+        logger.info(f"Retrieved {len(page['items'])} transactions for user {current_user.id}")
+        return page
         
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving transactions: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -228,9 +334,32 @@ def get_transactions(
 def create_transaction(
     transaction: TransactionCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Create a new transaction; retries with the same Idempotency-Key get the first response back"""
+    if not idempotency_key:
+        return _create_transaction(transaction, current_user, db)
+
+    fingerprint = request_hash(transaction.model_dump(mode="json"))
+    # Concurrent duplicates wait for the first request instead of running twice
+    with key_locks.hold((current_user.id, idempotency_key)):
+        try:
+            replay = stored_response(db, current_user.id, idempotency_key, fingerprint)
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if replay is not None:
+            logger.info(f"Replaying transaction {replay['id']} for Idempotency-Key {idempotency_key}")
+            return replay
+        return _create_transaction(transaction, current_user, db, idempotency_key, fingerprint)
+
+def _create_transaction(
+    transaction: TransactionCreate,
+    current_user: User,
+    db: Session,
+    idempotency_key: Optional[str] = None,
+    fingerprint: Optional[str] = None
 ):
-    """Create a new transaction"""
     try:
         logger.info(f"Creating transaction: {transaction.dict()}")
         logger.info(f"Current user ID: {current_user.id}")
@@ -242,113 +371,254 @@ def create_transaction(
                 detail="Transaction amount must be greater than 0"
             )
 
-        # Get sender's wallet
-        sender_wallet = db.query(Wallet).filter(Wallet.user_id == current_user.id).first()
-        if not sender_wallet:
-            logger.error(f"Sender wallet not found for user {current_user.id}")
+        user_id = current_user.id
+        receiver_id = user_id
+        if transaction.type == TransactionType.TRANSFER:
+            if not transaction.receiver_email:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Receiver email is required for transfer transactions"
+                )
+            # Sender's wallet, receiver and receiver's wallet in one joined query
+            parties = db.query(User.id, User.email, Wallet.id).outerjoin(
+                Wallet, Wallet.user_id == User.id
+            ).filter(or_(User.id == user_id, User.email == transaction.receiver_email)).all()
+            sender_wallet_id = next((wallet_id for party_id, _, wallet_id in parties if party_id == user_id), None)
+            receiver = next(
+                ((party_id, wallet_id) for party_id, email, wallet_id in parties if email == transaction.receiver_email), None
+            )
+        else:
+            sender_wallet_id = db.query(Wallet.id).filter(Wallet.user_id == user_id).scalar()
+        if sender_wallet_id is None:
+            logger.error(f"Sender wallet not found for user {user_id}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Sender wallet not found"
             )
-        logger.info(f"Found sender wallet: {sender_wallet.id}")
+        logger.info(f"Found sender wallet: {sender_wallet_id}")
+        receiver_wallet_id = sender_wallet_id
 
         # Handle different transaction types
         if transaction.type == TransactionType.TRANSFER:
-            if not transaction.receiver_email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Receiver email is required for transfer transactions"
-                )
-            
-            # Get receiver by email
-            receiver = db.query(User).filter(User.email == transaction.receiver_email).first()
-            if not receiver:
+            if receiver is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Receiver with email {transaction.receiver_email} not found"
                 )
-            
-            # Get receiver's wallet
-            receiver_wallet = db.query(Wallet).filter(Wallet.user_id == receiver.id).first()
-            if not receiver_wallet:
-                # Create wallet for receiver if it doesn't exist
-                receiver_wallet = Wallet(
-                    user_id=receiver.id,
-                    created_at=datetime.utcnow()
-                )
-                db.add(receiver_wallet)
-                db.commit()
-                db.refresh(receiver_wallet)
-                logger.info(f"Created new wallet for receiver {receiver.id}")
-
-            # Check if sender has sufficient balance
-            currency = transaction.currency.value
-            if sender_wallet.balances.get(currency, 0) < transaction.amount:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient {currency} balance. Current balance: {sender_wallet.balances.get(currency, 0)}"
-                )
+            receiver_id, receiver_wallet_id = receiver
+            if receiver_wallet_id is None:
+                # Create wallet for receiver if it doesn't exist; it commits with the transfer
+                receiver_wallet_id = db.execute(
+                    insert(Wallet).values(user_id=receiver_id, created_at=datetime.utcnow()).returning(Wallet.id)
+                ).scalar_one()
+                bump_counters(db, {WALLETS: 1})
+                logger.info(f"Created new wallet for receiver {receiver_id}")
 
-            # Create transfer transaction
-            new_transaction = Transaction(
-                sender_id=current_user.id,
-                receiver_id=receiver.id,
-                sender_wallet_id=sender_wallet.id,
-                receiver_wallet_id=receiver_wallet.id,
-                amount=transaction.amount,
-                currency=transaction.currency,
-                type=transaction.type,
-                description=transaction.description,
-                created_at=datetime.utcnow(),
-                status=TransactionStatus.COMPLETED
-            )
-
-            # Update balances
-            sender_wallet.balances[currency] = sender_wallet.balances.get(currency, 0) - transaction.amount
-            receiver_wallet.balances[currency] = receiver_wallet.balances.get(currency, 0) + transaction.amount
+            # Update balances; the debit is refused in the database if the sender can't cover it
+            try:
+                transfer(db, sender_wallet_id, receiver_wallet_id, transaction.currency, transaction.amount)
+            except ValueError as ve:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
 
         else:  # DEPOSIT or WITHDRAWAL
             # For deposit/withdrawal, use the same wallet for sender and receiver
-            if transaction.type == TransactionType.WITHDRAWAL:
-                currency = transaction.currency.value
-                if sender_wallet.balances.get(currency, 0) < transaction.amount:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Insufficient {currency} balance. Current balance: {sender_wallet.balances.get(currency, 0)}"
-                    )
-                sender_wallet.balances[currency] = sender_wallet.balances.get(currency, 0) - transaction.amount
-            else:  # DEPOSIT
-                currency = transaction.currency.value
-                sender_wallet.balances[currency] = sender_wallet.balances.get(currency, 0) + transaction.amount
-
-            # Create self-transaction
-            new_transaction = Transaction(
-                sender_id=current_user.id,
-                receiver_id=current_user.id,
-                sender_wallet_id=sender_wallet.id,
-                receiver_wallet_id=sender_wallet.id,
+            try:
+                if transaction.type == TransactionType.WITHDRAWAL:
+                    withdraw(db, sender_wallet_id, transaction.currency, transaction.amount)
+                else:  # DEPOSIT
+                    deposit(db, sender_wallet_id, transaction.currency, transaction.amount)
+            except ValueError as ve:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+        # The row comes back from the INSERT itself, so nothing is reloaded after the commit
+        new_transaction = db.execute(
+            insert(Transaction).values(
+                sender_id=user_id,
+                receiver_id=receiver_id,
+                sender_wallet_id=sender_wallet_id,
+                receiver_wallet_id=receiver_wallet_id,
                 amount=transaction.amount,
                 currency=transaction.currency,
                 type=transaction.type,
                 description=transaction.description,
                 created_at=datetime.utcnow(),
                 status=TransactionStatus.COMPLETED
-            )
+            ).returning(*Transaction.__table__.columns)
+        ).one()
 
-        db.add(new_transaction)
-        db.commit()
-        db.refresh(new_transaction)
+        on_transactions_pending(db, new_transaction)
+        if idempotency_key:
+            response = TransactionInDB.model_validate(new_transaction, from_attributes=True).model_dump(mode="json")
+            save_response(db, current_user.id, idempotency_key, fingerprint, response, new_transaction.id)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another process committed the same key first; its transaction stands, ours is rolled back
+            db.rollback()
+            try:
+                replay = stored_response(db, current_user.id, idempotency_key, fingerprint) if idempotency_key else None
+            except IdempotencyKeyReused as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            if replay is None:
+                raise
+            return replay
+        if idempotency_key:
+            cache_response(user_id, idempotency_key, fingerprint, response)
+        on_transactions_committed(new_transaction)
         
-        logger.info(f"Created transaction {new_transaction.id} from user {current_user.id}")
+        logger.info(f"Created transaction {new_transaction.id} from user {user_id}")
         return new_transaction
 
     except HTTPException as he:
         logger.error(f"HTTP error in transaction creation: {he.detail}")
         raise he
+    except WalletBusy as wb:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(wb))
     except Exception as e:
         logger.error(f"Error creating transaction: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating transaction: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/batch", response_model=TransactionBatchResult)
+def create_transactions_batch(
+    batch: TransactionBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create many transactions from the current user in one commit.
+
+    Receivers and their wallets are resolved with one IN query and balances
+    are checked in memory in submission order against a snapshot of the
+    sender's wallet, claimed by compare-and-swap on its version. Items that
+    fail validation are reported and skipped; the rest are inserted together
+    and their net effect lands as one UPDATE per wallet and currency.
+    """
+    try:
+        items = batch.transactions
+        if len(items) > settings.MAX_BATCH_TRANSACTIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"A batch may hold at most {settings.MAX_BATCH_TRANSACTIONS} transactions"
+            )
+        logger.info(f"Creating batch of {len(items)} transactions for user {current_user.id}")
+
+        sender_wallet = db.query(Wallet).filter(Wallet.user_id == current_user.id).first()
+        if not sender_wallet:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Sender wallet not found"
+            )
+
+        emails = {item.receiver_email for item in items if item.type == TransactionType.TRANSFER and item.receiver_email}
+        receivers = {}
+        if emails:
+            for user, wallet in db.query(User, Wallet).outerjoin(
+                Wallet, Wallet.user_id == User.id
+            ).filter(User.email.in_(emails)).all():
+                receivers[user.email] = (user, wallet)
+
+        # Receivers without a wallet get one in the same commit
+        missing = [(email, Wallet(user_id=user.id, created_at=datetime.utcnow()))
+                   for email, (user, wallet) in receivers.items() if wallet is None]
+        if missing:
+            db.add_all([wallet for _, wallet in missing])
+            db.flush()
+            bump_counters(db, {WALLETS: len(missing)})
+            for email, wallet in missing:
+                receivers[email] = (receivers[email][0], wallet)
+
+        def plan(balances):
+            """Check every item against a snapshot of the sender's balances, in submission order"""
+            sender_balances = dict(balances)
+            deltas = {}  # (wallet_id, currency) -> net change in minor units
+            results, pending = [], []
+            for index, item in enumerate(items):
+                currency = item.currency
+                receiver, receiver_wallet = current_user, sender_wallet
+                error = None
+                if item.amount <= 0:
+                    error = "Transaction amount must be greater than 0"
+                elif item.type == TransactionType.TRANSFER:
+                    if not item.receiver_email:
+                        error = "Receiver email is required for transfer transactions"
+                    elif item.receiver_email not in receivers:
+                        error = f"Receiver with email {item.receiver_email} not found"
+                    else:
+                        receiver, receiver_wallet = receivers[item.receiver_email]
+                if not error:
+                    try:
+                        amount_minor = to_minor_units(item.amount, currency)
+                    except ValueError as ve:
+                        error = str(ve)
+                if not error and item.type != TransactionType.DEPOSIT and sender_balances.get(currency, 0) < amount_minor:
+                    balance = from_minor_units(sender_balances.get(currency, 0), currency)
+                    error = f"Insufficient {currency.value} balance. Current balance: {balance}"
+                if error:
+                    results.append({"index": index, "success": False, "error": error})
+                    continue
+
+                if item.type != TransactionType.DEPOSIT:
+                    sender_balances[currency] = sender_balances.get(currency, 0) - amount_minor
+                    key = (sender_wallet.id, currency)
+                    deltas[key] = deltas.get(key, 0) - amount_minor
+                if item.type != TransactionType.WITHDRAWAL:
+                    if receiver_wallet.id == sender_wallet.id:
+                        sender_balances[currency] = sender_balances.get(currency, 0) + amount_minor
+                    key = (receiver_wallet.id, currency)
+                    deltas[key] = deltas.get(key, 0) + amount_minor
+
+                pending.append((index, Transaction(
+                    sender_id=current_user.id,
+                    receiver_id=receiver.id,
+                    sender_wallet_id=sender_wallet.id,
+                    receiver_wallet_id=receiver_wallet.id,
+                    amount=item.amount,
+                    currency=item.currency,
+                    type=item.type,
+                    description=item.description,
+                    created_at=datetime.utcnow(),
+                    status=TransactionStatus.COMPLETED
+                )))
+                results.append({"index": index, "success": True})
+            return results, pending, deltas
+
+        # Re-planned from a fresh snapshot if another request spends from the wallet meanwhile
+        results, pending, deltas = claim_wallet(db, sender_wallet.id, plan)
+
+        transactions = [transaction for _, transaction in pending]
+        if transactions:
+            for (wallet_id, currency), delta in sorted(deltas.items()):
+                apply_delta(db, wallet_id, currency, delta)
+            bump_versions(db, [wallet_id for wallet_id, _ in deltas if wallet_id != sender_wallet.id])
+            db.add_all(transactions)
+            on_transactions_pending(db, *transactions)
+            db.flush()
+
+        # Snapshot what the post-commit hooks need before commit expires the objects
+        ids = {index: transaction.id for index, transaction in pending}
+        committed = [ScanRow(t.id, t.sender_id, t.receiver_id, t.amount, t.type, t.created_at) for t in transactions]
+        db.commit()
+        on_transactions_committed(*committed)
+
+        for result in results:
+            result["transaction_id"] = ids.get(result["index"])
+        logger.info(f"Created {len(transactions)} of {len(items)} batch transactions for user {current_user.id}")
+        return {"created": len(transactions), "failed": len(items) - len(transactions), "results": results}
+
+    except HTTPException as he:
+        raise he
+    except WalletBusy as wb:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(wb))
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error creating transaction batch: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error creating transaction batch: {str(e)}"
+        )
@@ -6,6 +6,7 @@ from app.models.models import User
 from app.schemas.schemas import UserCreate, UserUpdate, UserInDB
 from app.api.deps import get_current_user, get_current_admin_user
 from app.core.security import get_password_hash
+from app.services.system_counters import USERS, bump_counters
 import logging
 
 router = APIRouter()
@@ -108,6 +109,7 @@ def create_user(
             is_admin=False
         )
         db.add(user)
+        bump_counters(db, {USERS: 1})
         db.commit()
         db.refresh(user)
         return user
@@ -166,7 +168,9 @@ def delete_user(
                 detail="User not found"
             )
         
-        user.is_deleted = True
+        if not user.is_deleted:
+            user.is_deleted = True
+            bump_counters(db, {USERS: -1})
         db.commit()
         return {"message": "User deleted successfully"}
     except Exception as e:
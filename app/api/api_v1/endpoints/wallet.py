@@ -3,7 +3,10 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_current_user, get_db
 from app.models.models import User, Wallet
 from app.schemas.schemas import WalletInDB
-from datetime import datetime
+from app.services.ledger import balances_as_of
+from app.services.system_counters import WALLETS, bump_counters
+from datetime import datetime, timezone
+from typing import Optional
 import logging
 
 router = APIRouter()
@@ -12,9 +15,10 @@ logger = logging.getLogger(__name__)
 @router.get("/", response_model=WalletInDB)
 def get_wallet(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    as_of: Optional[datetime] = None
 ):
-    """Get user's wallet"""
+    """Get user's wallet, with its balances as they stood at as_of if given"""
     try:
         # Get or create wallet
         wallet = db.query(Wallet).filter(Wallet.user_id == current_user.id).first()
@@ -26,6 +30,7 @@ def get_wallet(
                 created_at=datetime.utcnow()
             )
             db.add(wallet)
+            bump_counters(db, {WALLETS: 1})
             db.commit()
             db.refresh(wallet)
             logger.info(f"Created new wallet for user {current_user.id}")
@@ -37,6 +42,11 @@ def get_wallet(
             logger.info(f"Updated created_at for wallet {wallet.id}")
         
         logger.info(f"Retrieved wallet for user {current_user.id}")
+        if as_of is not None:
+            if as_of.tzinfo is not None:
+                as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+            wallet_out = WalletInDB.model_validate(wallet, from_attributes=True)
+            return wallet_out.model_copy(update={"balances": balances_as_of(db, wallet.id, as_of)})
         return wallet
         
     except Exception as e:
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+import base64
+import json
+
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor for the keyset position just after a row"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> tuple:
+    """Decode a cursor back into values for the keyset columns"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("wrong number of keys")
+        return tuple(
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, payload)
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def after_cursor(query: Query, columns: Sequence, cursor: Optional[str]) -> Query:
+    """Newest-first keyset order over columns, resuming after the cursor"""
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    return query.order_by(*(column.desc() for column in columns))
+
+
+def paginate(query: Query, columns: Sequence, limit: int, cursor: Optional[str] = None) -> dict:
+    """
+    One page of a newest-first keyset scan.
+
+    The filter seeks straight to the cursor, so deep pages cost the same as
+    the first one when columns are backed by an index.
+    """
+    rows = after_cursor(query, columns, cursor).limit(limit + 1).all()
+    return page_of(rows, columns, limit)
+
+
+def page_of(rows: list, columns: Sequence, limit: int) -> dict:
+    """Trim limit + 1 newest-first rows to a page and its next cursor"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(*(getattr(last, column.key) for column in columns))
+    return {"items": rows, "next_cursor": next_cursor}
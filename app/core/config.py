@@ -37,10 +37,57 @@ class Settings(BaseSettings):
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
+
+    # Pagination
+    DEFAULT_PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 500
+    EXPORT_BATCH_SIZE: int = 1000  # Rows fetched per round trip when streaming exports
+
+    # Transactions
+    MAX_BATCH_TRANSACTIONS: int = 5000  # Items accepted by POST /transactions/batch
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24  # How long a replayed Idempotency-Key returns the stored response
+    IDEMPOTENCY_CACHE_SIZE: int = 10000  # Responses kept in the in-process front cache
+    IDEMPOTENCY_CACHE_TTL_SECONDS: int = 600
+    WALLET_CAS_MAX_RETRIES: int = 5  # Re-reads of a wallet whose version changed under a debit
+    WALLET_CAS_BACKOFF_MS: int = 5  # Base of the jittered exponential backoff between retries
+    LEDGER_SNAPSHOT_INTERVAL_MINUTES: int = 60  # Bounds the entries replayed for GET /wallet/?as_of=
+    LEDGER_SNAPSHOT_SETTLE_SECONDS: float = 5.0  # Ledger entries younger than this wait for the next snapshot
+    ADMIN_STATS_CACHE_TTL_SECONDS: float = 10.0  # How stale GET /admin/stats may be
+    SYSTEM_COUNTER_SHARDS: int = 8  # Rows each admin stats counter is spread over, to spread write contention
+    VOLUME_ROLLUP_INTERVAL_MINUTES: int = 5  # How far the volume series may lag behind
+    VOLUME_ROLLUP_SETTLE_SECONDS: float = 5.0  # Transactions younger than this wait for the next rollup run
+    FX_BASE_CURRENCY: str = "USD"  # Currency the balance leaderboard totals are kept in
+    # Units of FX_BASE_CURRENCY per unit of each currency; after changing them run python -m app.services.leaderboard --recompute
+    FX_RATES: Dict[str, float] = {"USD": 1.0, "EUR": 1.08, "GBP": 1.27, "JPY": 0.0067, "INR": 0.012, "BONUS": 0.0}
     
     # Fraud Detection
     SUSPICIOUS_TRANSACTION_THRESHOLD: float = 10000.0  # $10,000
     MAX_TRANSACTIONS_PER_HOUR: int = 50
+    FRAUD_MAX_DAILY_TRANSACTIONS: int = 10
+    FRAUD_LARGE_WITHDRAWAL_AMOUNT: float = 1000.0
+    FRAUD_LARGE_TRANSFER_AMOUNT: float = 500.0
+    FRAUD_RAPID_TRANSFER_COUNT: int = 3  # Transfers within the window below
+    FRAUD_RAPID_TRANSFER_WINDOW_MINUTES: int = 5
+    FRAUD_VOLUME_LIMIT: float = 2000.0  # Amount sent or received within the window below
+    FRAUD_VOLUME_WINDOW_MINUTES: int = 60
+    FRAUD_WINDOW_BUCKET_SECONDS: int = 1  # Resolution of the in-memory fraud windows
+    FRAUD_SCAN_ENGINE: str = "sweep"  # serial, sweep, parallel or vectorized
+    FRAUD_SCAN_WORKERS: int = 4  # Processes (and sender partitions) for the parallel scan
+    FRAUD_SCAN_INTERVAL_MINUTES: int = 1  # Scheduled scans are incremental
+    FRAUD_SCAN_SETTLE_SECONDS: float = 5.0  # Transactions younger than this wait for the next incremental scan
+    FRAUD_QUEUE_ENABLED: bool = True  # Check committed transactions in background workers
+    FRAUD_QUEUE_MAX_SIZE: int = 10000
+    FRAUD_QUEUE_WORKERS: int = 2
+    FRAUD_QUEUE_BATCH_SIZE: int = 100
+    FRAUD_QUEUE_BATCH_WAIT_MS: int = 50
+    FRAUD_GRAPH_WINDOW_HOURS: int = 24  # Transfers kept in the transfer graph
+    FRAUD_GRAPH_HALF_LIFE_MINUTES: int = 360  # Decay of transfer graph edge weights
+    FRAUD_GRAPH_MIN_EDGE_WEIGHT: float = 50.0  # Lighter (decayed) edges are ignored
+    FRAUD_GRAPH_FAN_IN: int = 10  # Distinct senders to one receiver
+    FRAUD_GRAPH_FAN_OUT: int = 10  # Distinct receivers from one sender
+    FRAUD_GRAPH_MAX_DEGREE: int = 1000  # Hubs above this are not expanded in cycle search
+    FRAUD_ZSCORE_THRESHOLD: float = 4.0  # Standard deviations from the user's usual amount
+    FRAUD_ZSCORE_MIN_COUNT: int = 10  # Transactions needed before a user's amounts are scored
     
     # Email settings
     SMTP_TLS: bool = True
@@ -1,2 +1,2 @@
 from app.db.base_class import Base
-from app.models.models import User, Wallet, Transaction 
\ No newline at end of file
+from app.models.models import User, Wallet, WalletBalance, Transaction, LedgerEntry, WalletBalanceSnapshot, JobCheckpoint, UserAmountStats, UserTxSummary, SystemCounter, IdempotencyKey, VolumeRollupHourly, VolumeRollupDaily 
\ No newline at end of file
@@ -1,8 +1,11 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.db.base_class import Base
 from app.db.session import engine
+from app.db.migrations import upgrade_database
 from app.models.models import User, Wallet, Transaction  # Import all models
 from app.core.security import get_password_hash
+from app.services.system_counters import USERS, WALLETS, bump_counters, seed_counters
 from app.core.config import settings
 
 def init_db(reset: bool = False):
@@ -14,12 +17,16 @@ def init_db(reset: bool = False):
     if reset:
         print("Dropping all tables...")
         Base.metadata.drop_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
     
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    upgrade_database(engine)
     
     # Create admin user only if reset is True or admin doesn't exist
     db = Session(engine)
+    seed_counters(db)
+    db.commit()
     admin_email = "admin@example.com"
     admin_password = "admin123"  # You should change this in production
     
@@ -34,12 +41,14 @@ def init_db(reset: bool = False):
             is_active=True
         )
         db.add(admin)
+        bump_counters(db, {USERS: 1})
         db.commit()
         db.refresh(admin)
         
         # Create wallet for admin
         admin_wallet = Wallet(user_id=admin.id)
         db.add(admin_wallet)
+        bump_counters(db, {WALLETS: 1})
         db.commit()
         print("Admin user created successfully!")
     else:
@@ -0,0 +1,35 @@
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = settings.BASE_DIR / "alembic.ini"
+# What create_all built before migrations existed
+BASELINE_REVISION = "0001"
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(settings.BASE_DIR / "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def upgrade_database(bind: Engine, revision: str = "head") -> None:
+    """
+    Run the Alembic migrations up to revision.
+    Databases that create_all built before migrations existed are stamped at the baseline first;
+    the revisions after it skip whatever such a database already has.
+    """
+    with bind.begin() as conn:
+        config = alembic_config(conn)
+        tables = inspect(conn).get_table_names()
+        if "alembic_version" not in tables and "users" in tables:
+            logger.info(f"Adopting a database built without migrations at revision {BASELINE_REVISION}")
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, revision)
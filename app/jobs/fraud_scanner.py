@@ -3,13 +3,13 @@ from app.services.fraud_detection import FraudDetectionService
 from app.core.logger import logger
 
 def scan_for_fraud():
-    """Scan for fraudulent transactions"""
+    """Scan transactions committed since the last run for fraud"""
     try:
         db = SessionLocal()
         fraud_service = FraudDetectionService(db)
-        fraud_service.scan_recent_transactions()
-        stats = fraud_service.get_fraud_stats()
-        logger.info(f"Fraud scan completed. Stats: {stats}")
+        flagged = fraud_service.scan_new_transactions()
+        flagged += fraud_service.scan_transfer_graph()
+        logger.info(f"Fraud scan completed. Flagged {len(flagged)} new transactions")
     except Exception as e:
         logger.error(f"Error during fraud scan: {str(e)}")
     finally:
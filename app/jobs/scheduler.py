@@ -1,18 +1,21 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from app.jobs.fraud_scanner import scan_for_fraud
 from app.core.logger import logger
+from app.core.config import settings
 
 def start_scheduler():
     """Start the background scheduler"""
     scheduler = BackgroundScheduler()
     
-    # Schedule fraud scanner to run daily at midnight
+    # Incremental fraud scan; each run only covers new transactions
     scheduler.add_job(
         scan_for_fraud,
-        trigger=CronTrigger(hour=0, minute=0),
+        trigger=IntervalTrigger(minutes=settings.FRAUD_SCAN_INTERVAL_MINUTES),
         id='fraud_scanner',
-        name='Daily fraud scan',
+        name='Incremental fraud scan',
+        max_instances=1,
+        coalesce=True,
         replace_existing=True
     )
     
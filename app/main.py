@@ -2,8 +2,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.api_v1.api import api_router
 from app.core.config import settings
-from app.db.session import engine
-from app.models.models import Base
+from app.db.session import engine, SessionLocal
+from app.db.migrations import upgrade_database
+from app.services.fraud_engine import fraud_engine
+from app.services.fraud_queue import fraud_queue
+from app.services.transfer_graph import transfer_graph
 import logging
 
 # Configure logging
@@ -41,13 +44,31 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def startup_event():
     """Initialize database and start scheduler on startup"""
     try:
-        # Create database tables
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully")
+        # Bring the schema up to date
+        upgrade_database(engine)
+        logger.info("Database migrations applied successfully")
     except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
+        logger.error(f"Error applying database migrations: {e}")
         raise
 
+    # Warm the in-memory fraud windows and transfer graph from recent transactions
+    db = SessionLocal()
+    try:
+        fraud_engine.rebuild(db)
+        transfer_graph.rebuild(db)
+    except Exception as e:
+        logger.error(f"Error rebuilding fraud engine: {e}")
+    finally:
+        db.close()
+
+    if settings.FRAUD_QUEUE_ENABLED:
+        fraud_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let the fraud check workers finish their current batch"""
+    fraud_queue.stop()
+
 @app.get("/")
 def root():
     return {
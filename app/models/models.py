@@ -1,8 +1,11 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Enum, JSON
+from sqlalchemy import BigInteger, Boolean, CheckConstraint, Column, ForeignKey, Index, Integer, String, Float, DateTime, Enum, JSON, case, cast
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from decimal import Decimal, ROUND_HALF_EVEN
 import enum
 from app.db.base_class import Base
+from app.core.config import settings
 from datetime import datetime
 
 class TransactionType(str, enum.Enum):
@@ -24,6 +27,32 @@ class CurrencyType(str, enum.Enum):
     INR = "INR"
     BONUS = "BONUS"
 
+# Decimal places per currency; balances are stored as integers in these minor units
+MINOR_UNIT_EXPONENTS = {CurrencyType.JPY: 0}
+DEFAULT_MINOR_UNIT_EXPONENT = 2
+
+def minor_unit_exponent(currency) -> int:
+    return MINOR_UNIT_EXPONENTS.get(CurrencyType(currency), DEFAULT_MINOR_UNIT_EXPONENT)
+
+def to_minor_units(amount, currency, strict: bool = True) -> int:
+    """Convert a major-unit amount to integer minor units; strict rejects finer precision than the currency has"""
+    exponent = minor_unit_exponent(currency)
+    value = Decimal(str(amount))
+    quantized = value.quantize(Decimal(1).scaleb(-exponent), rounding=ROUND_HALF_EVEN)
+    if strict and quantized != value:
+        raise ValueError(f"{CurrencyType(currency).value} amounts have at most {exponent} decimal places")
+    return int(quantized.scaleb(exponent))
+
+def from_minor_units(amount_minor: int, currency) -> float:
+    return amount_minor / 10 ** minor_unit_exponent(currency)
+
+def to_base_minor_units(amount_minor: int, currency) -> int:
+    """Minor units of currency converted at FX_RATES to minor units of FX_BASE_CURRENCY"""
+    currency = CurrencyType(currency)
+    rate = Decimal(str(settings.FX_RATES.get(currency.value, 0)))
+    scale = minor_unit_exponent(settings.FX_BASE_CURRENCY) - minor_unit_exponent(currency)
+    return int((Decimal(amount_minor) * rate).scaleb(scale).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -60,28 +89,73 @@ class Wallet(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
-    balances = Column(JSON, default=lambda: {
-        "USD": 0.0,
-        "EUR": 0.0,
-        "GBP": 0.0,
-        "JPY": 0.0,
-        "INR": 0.0,
-        "BONUS": 0.0
-    })
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every balance change; debits compare-and-swap on it
+    # Sum of the balances in FX_BASE_CURRENCY minor units, moved with every balance change, for the leaderboard
+    total_balance_minor = Column(BigInteger, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_deleted = Column(Boolean, default=False)
     deleted_at = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # The balance leaderboard reads it richest first with LIMIT k
+        Index("ix_wallets_total_balance_minor", "total_balance_minor"),
+    )
+
     # Relationships
     user = relationship("User", back_populates="wallet")
+    balance_rows = relationship("WalletBalance", back_populates="wallet", cascade="all, delete-orphan", lazy="selectin")
     sent_transactions = relationship("Transaction", back_populates="sender_wallet", foreign_keys="Transaction.sender_wallet_id")
     received_transactions = relationship("Transaction", back_populates="receiver_wallet", foreign_keys="Transaction.receiver_wallet_id")
 
-    def __init__(self, **kwargs):
+    def __init__(self, balances: dict = None, **kwargs):
         super().__init__(**kwargs)
         if not self.created_at:
             self.created_at = datetime.utcnow()
+        # Every wallet starts with a row per currency so balance updates never need an insert
+        if not self.balance_rows:
+            balances = balances or {}
+            self.balance_rows = [
+                WalletBalance(currency=currency, amount_minor=to_minor_units(balances.get(currency.value, 0), currency))
+                for currency in CurrencyType
+            ]
+        self.total_balance_minor = sum(to_base_minor_units(row.amount_minor, row.currency) for row in self.balance_rows)
+
+    @property
+    def balances(self) -> dict:
+        """Balance per currency code in major units, as the API has always returned them"""
+        balances = {currency.value: 0.0 for currency in CurrencyType}
+        for row in self.balance_rows:
+            balances[row.currency.value] = row.amount
+        return balances
+
+class WalletBalance(Base):
+    __tablename__ = "wallet_balances"
+
+    # One row per wallet and currency, in integer minor units (cents; whole yen for JPY)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    currency = Column(Enum(CurrencyType), primary_key=True)
+    amount_minor = Column(BigInteger, nullable=False, default=0)
+
+    wallet = relationship("Wallet", back_populates="balance_rows")
+
+    __table_args__ = (
+        CheckConstraint("amount_minor >= 0", name="ck_wallet_balances_non_negative"),
+        # Per-currency leaderboard
+        Index("ix_wallet_balances_currency_amount", "currency", "amount_minor"),
+    )
+
+    @hybrid_property
+    def amount(self) -> float:
+        return from_minor_units(self.amount_minor or 0, self.currency)
+
+    @amount.expression
+    def amount(cls):
+        scale = case(
+            *[(cls.currency == currency, 10 ** exponent) for currency, exponent in MINOR_UNIT_EXPONENTS.items()],
+            else_=10 ** DEFAULT_MINOR_UNIT_EXPONENT
+        )
+        return cast(cls.amount_minor, Float) / scale
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -98,6 +172,7 @@ class Transaction(Base):
     description = Column(String, nullable=True)
     is_flagged = Column(Boolean, default=False)
     flag_reason = Column(String, nullable=True)
+    reviewed_at = Column(DateTime(timezone=True), nullable=True)  # Set by an admin review; automated scans leave it be
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_deleted = Column(Boolean, default=False)
@@ -107,4 +182,122 @@ class Transaction(Base):
     sender = relationship("User", back_populates="sent_transactions", foreign_keys=[sender_id])
     receiver = relationship("User", back_populates="received_transactions", foreign_keys=[receiver_id])
     sender_wallet = relationship("Wallet", back_populates="sent_transactions", foreign_keys=[sender_wallet_id])
-    receiver_wallet = relationship("Wallet", back_populates="received_transactions", foreign_keys=[receiver_wallet_id]) 
\ No newline at end of file
+    receiver_wallet = relationship("Wallet", back_populates="received_transactions", foreign_keys=[receiver_wallet_id])
+
+    __table_args__ = (
+        # Keyset pagination over (created_at, id), overall and per party
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+        Index("ix_transactions_sender_created_at_id", "sender_id", "created_at", "id"),
+        Index("ix_transactions_receiver_created_at_id", "receiver_id", "created_at", "id"),
+        # Flagged transactions are few; the admin list and counts read only those
+        Index(
+            "ix_transactions_flagged_created_at", "created_at",
+            sqlite_where=is_flagged == True,
+            postgresql_where=is_flagged == True
+        ),
+        # Completed volume per currency
+        Index("ix_transactions_currency_status", "currency", "status"),
+    )
+
+class LedgerEntry(Base):
+    __tablename__ = "ledger_entries"
+
+    # Append-only: each transaction writes one debit (negative) and one credit (positive) that sum to zero.
+    # wallet_id is NULL for the world outside the system, the other side of deposits and withdrawals.
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)  # NULL for opening balances
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=True)
+    currency = Column(Enum(CurrencyType), nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Replaying one wallet's entries after a snapshot
+        Index("ix_ledger_entries_wallet_currency_id", "wallet_id", "currency", "id"),
+        Index("ix_ledger_entries_transaction_id", "transaction_id"),
+    )
+
+class WalletBalanceSnapshot(Base):
+    __tablename__ = "wallet_balance_snapshots"
+
+    # A wallet's balance in one currency including every ledger entry up to last_entry_id
+    id = Column(Integer, primary_key=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=False)
+    currency = Column(Enum(CurrencyType), nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)
+    last_entry_id = Column(Integer, nullable=False)
+    taken_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_wallet_balance_snapshots_wallet_taken_at", "wallet_id", "taken_at"),
+    )
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_transaction_id = Column(Integer, nullable=False, default=0)
+    last_created_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserAmountStats(Base):
+    __tablename__ = "user_amount_stats"
+
+    # Running count/mean/M2 (Welford) of the amounts a user moves, per currency
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    currency = Column(Enum(CurrencyType), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserTxSummary(Base):
+    __tablename__ = "user_tx_summary"
+
+    # Lifetime activity per user and currency, updated in the same commit as each transaction.
+    # Transfers count as sent for the sender and received for the receiver; deposits as received, withdrawals as sent.
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    currency = Column(Enum(CurrencyType), primary_key=True)
+    sent_count = Column(Integer, nullable=False, default=0)
+    sent_volume = Column(Float, nullable=False, default=0.0)
+    received_count = Column(Integer, nullable=False, default=0)
+    received_volume = Column(Float, nullable=False, default=0.0)
+    last_activity_at = Column(DateTime(timezone=True), nullable=True)
+
+class SystemCounter(Base):
+    __tablename__ = "system_counters"
+
+    # System-wide totals for the admin stats, updated in the same commit as the rows they count.
+    # Each counter is spread over SYSTEM_COUNTER_SHARDS rows so concurrent writers rarely queue on one row; its value is the sum.
+    name = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class _VolumeRollup:
+    # Transactions per time bucket, currency, type and status, for volume-over-time charts.
+    # Folded in incrementally by the volume rollup job, past a job_checkpoints high-water mark.
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    currency = Column(Enum(CurrencyType), primary_key=True)
+    type = Column(Enum(TransactionType), primary_key=True)
+    status = Column(Enum(TransactionStatus), primary_key=True)
+    tx_count = Column(BigInteger, nullable=False, default=0)
+    volume_minor = Column(BigInteger, nullable=False, default=0)
+    flagged_count = Column(BigInteger, nullable=False, default=0)
+
+class VolumeRollupHourly(_VolumeRollup, Base):
+    __tablename__ = "volume_rollup_hourly"
+
+class VolumeRollupDaily(_VolumeRollup, Base):
+    __tablename__ = "volume_rollup_daily"
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # Stored response for a client's Idempotency-Key, replayed on retries
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
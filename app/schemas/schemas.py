@@ -105,14 +105,53 @@ class TransactionInDB(TransactionBase):
             datetime: lambda v: v.isoformat()
         }
 
+class TransactionBatchCreate(BaseModel):
+    transactions: List[TransactionCreate]
+
+class TransactionBatchItemResult(BaseModel):
+    index: int  # Position in the submitted list
+    success: bool
+    transaction_id: Optional[int] = None
+    error: Optional[str] = None
+
+class TransactionBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[TransactionBatchItemResult]
+
+class TransactionPage(BaseModel):
+    items: List[TransactionInDB]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page
+
 # Admin schemas
 class AdminStats(BaseModel):
     total_users: int
     total_transactions: int
-    total_volume: float
+    total_volume: Dict[str, float]  # Completed volume per currency
     flagged_transactions: int
     active_wallets: int
 
+class UserBalances(BaseModel):
+    user_id: int
+    email: str
+    balances: Dict[str, float]
+
+class UserBalancesPage(BaseModel):
+    items: List[UserBalances]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page
+
+class VolumePoint(BaseModel):
+    bucket_start: datetime
+    currency: str
+    tx_count: int
+    volume: float
+    flagged_count: int
+
+class VolumeSeries(BaseModel):
+    granularity: str
+    as_of: Optional[datetime] = None  # Created time of the last transaction rolled up
+    points: List[VolumePoint]
+
 class TopUser(BaseModel):
     user_id: int
     email: str
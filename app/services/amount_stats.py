@@ -0,0 +1,119 @@
+from math import sqrt
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.models.models import Transaction, TransactionStatus, UserAmountStats
+from app.core.config import settings
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def welford_add(count: int, mean: float, m2: float, amount: float) -> tuple[int, float, float]:
+    """Fold one amount into running (count, mean, M2)"""
+    count += 1
+    delta = amount - mean
+    mean += delta / count
+    m2 += delta * (amount - mean)
+    return count, mean, m2
+
+
+def welford_remove(count: int, mean: float, m2: float, amount: float) -> tuple[int, float, float]:
+    """Take one amount back out of running (count, mean, M2)"""
+    if count <= 1:
+        return 0, 0.0, 0.0
+    previous = (count * mean - amount) / (count - 1)
+    m2 -= (amount - mean) * (amount - previous)
+    return count - 1, previous, max(m2, 0.0)
+
+
+def record_amounts(db: Session, transactions) -> None:
+    """
+    Fold transactions' amounts into their senders' running stats.
+    Called before the transactions commit, so both land in the same commit.
+    """
+    completed = [t for t in transactions if t.status == TransactionStatus.COMPLETED and t.amount]
+    if not completed:
+        return
+    keys = {(t.sender_id, t.currency) for t in completed}
+    existing = db.query(UserAmountStats).filter(
+        UserAmountStats.user_id.in_({user_id for user_id, _ in keys})
+    ).with_for_update().all()
+    stats = {(row.user_id, row.currency): row for row in existing}
+
+    created = False
+    for transaction in completed:
+        key = (transaction.sender_id, transaction.currency)
+        row = stats.get(key)
+        if row is None:
+            row = stats[key] = UserAmountStats(user_id=key[0], currency=key[1], count=0, mean=0.0, m2=0.0)
+            db.add(row)
+            created = True
+        row.count, row.mean, row.m2 = welford_add(row.count, row.mean, row.m2, transaction.amount)
+    if created:
+        # Sessions don't autoflush; make new rows visible to the next lookup
+        db.flush()
+
+
+def record_amount(db: Session, transaction: Transaction) -> None:
+    record_amounts(db, [transaction])
+
+
+def amount_zscore(stats: Optional[UserAmountStats], amount: float, min_count: int = None) -> Optional[float]:
+    """
+    How many standard deviations an amount sits from the user's other amounts.
+
+    The stats already include every committed transaction, so the amount is
+    taken back out first (leave-one-out). None when there is too little history.
+    """
+    min_count = min_count or settings.FRAUD_ZSCORE_MIN_COUNT
+    if stats is None or not amount:
+        return None
+    count, mean, m2 = welford_remove(stats.count, stats.mean, stats.m2, amount)
+    if count < min_count:
+        return None
+    std = sqrt(m2 / (count - 1))
+    if std == 0:
+        return None if amount == mean else float("inf")
+    return (amount - mean) / std
+
+
+def rebuild_amount_stats(db: Session, batch_size: int = 10000) -> int:
+    """Recompute every user's stats from the transactions table in one streaming pass"""
+    rows = db.query(
+        Transaction.sender_id,
+        Transaction.currency,
+        Transaction.amount
+    ).filter(
+        Transaction.status == TransactionStatus.COMPLETED,
+        Transaction.amount > 0
+    ).order_by(Transaction.id).yield_per(batch_size)
+
+    state = {}
+    for sender_id, currency, amount in rows:
+        key = (sender_id, currency)
+        state[key] = welford_add(*state.get(key, (0, 0.0, 0.0)), amount)
+
+    db.query(UserAmountStats).delete(synchronize_session=False)
+    db.bulk_insert_mappings(UserAmountStats, [
+        {"user_id": sender_id, "currency": currency, "count": count, "mean": mean, "m2": m2}
+        for (sender_id, currency), (count, mean, m2) in state.items()
+    ])
+    db.commit()
+    logger.info(f"Rebuilt amount stats for {len(state)} user/currency pairs")
+    return len(state)
+
+
+if __name__ == "__main__":
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Recompute per-user amount statistics from transactions")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows fetched per round trip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        rebuild_amount_stats(db, batch_size=args.batch_size)
+    finally:
+        db.close()
@@ -0,0 +1,171 @@
+from typing import Callable, Dict, Iterable, Tuple, TypeVar
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from app.models.models import CurrencyType, TransactionType, Wallet, WalletBalance, from_minor_units, to_base_minor_units, to_minor_units
+from app.core.config import settings
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class InsufficientFunds(ValueError):
+    """A debit would take the balance below zero"""
+
+    def __init__(self, currency: CurrencyType, balance: float):
+        self.currency = CurrencyType(currency)
+        self.balance = balance
+        super().__init__(f"Insufficient {self.currency.value} balance. Current balance: {balance}")
+
+
+class WalletBusy(Exception):
+    """The wallet kept changing between read and write; the caller may try again"""
+
+
+def get_balance(db: Session, wallet_id: int, currency: CurrencyType) -> float:
+    amount_minor = db.execute(
+        select(WalletBalance.amount_minor).where(
+            WalletBalance.wallet_id == wallet_id,
+            WalletBalance.currency == currency
+        )
+    ).scalar()
+    return from_minor_units(amount_minor or 0, currency)
+
+
+def wallet_snapshot(db: Session, wallet_id: int) -> Tuple[int, Dict[CurrencyType, int]]:
+    """A wallet's version and balances in minor units, read in one statement (not from the session)"""
+    rows = db.execute(
+        select(Wallet.version, WalletBalance.currency, WalletBalance.amount_minor).outerjoin(
+            WalletBalance, WalletBalance.wallet_id == Wallet.id
+        ).where(Wallet.id == wallet_id)
+    ).all()
+    if not rows:
+        raise LookupError(f"Wallet {wallet_id} not found")
+    return rows[0][0], {currency: amount for _, currency, amount in rows if currency is not None}
+
+
+def claim_wallet(db: Session, wallet_id: int, decide: Callable[[Dict[CurrencyType, int]], T]) -> T:
+    """
+    Run decide on a snapshot of the wallet's balances, then claim the wallet
+    by compare-and-swap on its version. If another writer bumped the version
+    in between, the snapshot is re-read and decide runs again, with jittered
+    exponential backoff, up to WALLET_CAS_MAX_RETRIES times.
+
+    Returns what decide returned; exceptions from decide propagate.
+    """
+    for attempt in range(settings.WALLET_CAS_MAX_RETRIES + 1):
+        version, balances = wallet_snapshot(db, wallet_id)
+        outcome = decide(balances)
+        result = db.execute(
+            update(Wallet).where(Wallet.id == wallet_id, Wallet.version == version).values(version=version + 1),
+            execution_options={"synchronize_session": False}
+        )
+        if result.rowcount == 1:
+            return outcome
+        logger.info(f"Wallet {wallet_id} changed since version {version}, retrying (attempt {attempt + 1})")
+        time.sleep(random.uniform(0, settings.WALLET_CAS_BACKOFF_MS * 2 ** attempt) / 1000)
+    raise WalletBusy(f"Wallet {wallet_id} is busy, please retry")
+
+
+def bump_versions(db: Session, wallet_ids: Iterable[int]) -> None:
+    """Mark wallets as changed without a compare, for credits that can't overdraw"""
+    wallet_ids = sorted(set(wallet_ids))
+    if wallet_ids:
+        db.execute(
+            update(Wallet).where(Wallet.id.in_(wallet_ids)).values(version=Wallet.version + 1),
+            execution_options={"synchronize_session": False}
+        )
+
+
+def apply_delta(db: Session, wallet_id: int, currency: CurrencyType, delta_minor: int) -> None:
+    """
+    Change a balance in place with one statement, leaving the version alone:
+    UPDATE ... SET amount_minor = amount_minor + :d [WHERE amount_minor >= -:d]
+    The wallet's FX-normalized total moves by the same amount in the base currency.
+    """
+    statement = update(WalletBalance).where(
+        WalletBalance.wallet_id == wallet_id,
+        WalletBalance.currency == currency
+    ).values(amount_minor=WalletBalance.amount_minor + delta_minor)
+    if delta_minor < 0:
+        # Still guarded, in case something changed the balance without going through the version
+        statement = statement.where(WalletBalance.amount_minor >= -delta_minor)
+    balance = db.execute(
+        statement.returning(WalletBalance.amount_minor), execution_options={"synchronize_session": False}
+    ).scalar()
+    if balance is None:
+        if delta_minor < 0:
+            raise InsufficientFunds(currency, get_balance(db, wallet_id, currency))
+        # Wallets created before wallet_balances existed may lack a row
+        db.execute(insert(WalletBalance).values(wallet_id=wallet_id, currency=currency, amount_minor=delta_minor))
+        balance = delta_minor
+
+    # Converting the balance before and after, rather than the delta, rounds the same way a recompute does
+    delta_base = to_base_minor_units(balance, currency) - to_base_minor_units(balance - delta_minor, currency)
+    if delta_base:
+        db.execute(
+            update(Wallet).where(Wallet.id == wallet_id).values(total_balance_minor=Wallet.total_balance_minor + delta_base),
+            execution_options={"synchronize_session": False}
+        )
+
+
+def credit_minor(db: Session, wallet_id: int, currency: CurrencyType, amount_minor: int) -> None:
+    apply_delta(db, wallet_id, currency, amount_minor)
+    bump_versions(db, [wallet_id])
+
+
+def debit_minor(db: Session, wallet_id: int, currency: CurrencyType, amount_minor: int) -> None:
+    def check(balances):
+        balance = balances.get(CurrencyType(currency), 0)
+        if balance < amount_minor:
+            raise InsufficientFunds(currency, from_minor_units(balance, currency))
+
+    claim_wallet(db, wallet_id, check)
+    apply_delta(db, wallet_id, currency, -amount_minor)
+
+
+def deposit(db: Session, wallet_id: int, currency: CurrencyType, amount: float) -> None:
+    credit_minor(db, wallet_id, currency, to_minor_units(amount, currency))
+
+
+def withdraw(db: Session, wallet_id: int, currency: CurrencyType, amount: float) -> None:
+    debit_minor(db, wallet_id, currency, to_minor_units(amount, currency))
+
+
+def transfer(db: Session, sender_wallet_id: int, receiver_wallet_id: int, currency: CurrencyType, amount: float) -> None:
+    """
+    Move funds between wallets; the caller commits both sides together.
+    The wallet with the lower id is written first, so transfers in opposite
+    directions queue on the same row instead of deadlocking.
+    """
+    amount_minor = to_minor_units(amount, currency)
+    if receiver_wallet_id < sender_wallet_id:
+        bump_versions(db, [receiver_wallet_id])
+        debit_minor(db, sender_wallet_id, currency, amount_minor)
+        apply_delta(db, receiver_wallet_id, currency, amount_minor)
+    else:
+        debit_minor(db, sender_wallet_id, currency, amount_minor)
+        credit_minor(db, receiver_wallet_id, currency, amount_minor)
+
+
+def apply_transaction(db: Session, transaction) -> None:
+    """Move a transaction's funds; InsufficientFunds if the paying side can't cover it"""
+    if transaction.type == TransactionType.TRANSFER:
+        transfer(db, transaction.sender_wallet_id, transaction.receiver_wallet_id, transaction.currency, transaction.amount)
+    elif transaction.type == TransactionType.DEPOSIT:
+        deposit(db, transaction.receiver_wallet_id, transaction.currency, transaction.amount)
+    else:  # WITHDRAWAL
+        withdraw(db, transaction.sender_wallet_id, transaction.currency, transaction.amount)
+
+
+def undo_transaction(db: Session, transaction) -> None:
+    """Move a completed transaction's funds back; InsufficientFunds if the receiving side has spent them"""
+    if transaction.type == TransactionType.TRANSFER:
+        transfer(db, transaction.receiver_wallet_id, transaction.sender_wallet_id, transaction.currency, transaction.amount)
+    elif transaction.type == TransactionType.DEPOSIT:
+        withdraw(db, transaction.receiver_wallet_id, transaction.currency, transaction.amount)
+    else:  # WITHDRAWAL
+        deposit(db, transaction.sender_wallet_id, transaction.currency, transaction.amount)
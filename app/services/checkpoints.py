@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.models.models import JobCheckpoint
+
+
+def get_checkpoint(db: Session, name: str, for_update: bool = False) -> Optional[JobCheckpoint]:
+    """
+    Return the persisted high-water mark for a job, if it has run before.
+    for_update locks the row until the caller commits, for writers that must not interleave with the job.
+    """
+    query = db.query(JobCheckpoint).filter(JobCheckpoint.name == name)
+    if for_update:
+        query = query.with_for_update()
+    return query.first()
+
+
+def advance_checkpoint(db: Session, name: str, last_transaction_id: int, last_created_at: datetime = None) -> JobCheckpoint:
+    """
+    Move a job's high-water mark forward.
+    The caller commits, so the mark lands in the same commit as the job's work.
+    """
+    checkpoint = get_checkpoint(db, name)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=name, last_transaction_id=0)
+        db.add(checkpoint)
+    if last_transaction_id > (checkpoint.last_transaction_id or 0):
+        checkpoint.last_transaction_id = last_transaction_id
+        checkpoint.last_created_at = last_created_at
+    return checkpoint
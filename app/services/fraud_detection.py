@@ -1,65 +1,263 @@
+from collections import namedtuple
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.models import Transaction, TransactionStatus, TransactionType, CurrencyType
+from itertools import repeat
+from operator import attrgetter
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import and_, case, func, or_, update
+from app.models.models import Transaction, TransactionStatus, TransactionType, CurrencyType, UserAmountStats
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, make_engine
+from app.services.fraud_engine import SlidingWindowFraudEngine, fraud_engine, to_epoch
+from app.services.fraud_rules import RuleSet, scheduled_fraud_rules
+from app.services.checkpoints import get_checkpoint, advance_checkpoint
+from app.services.transfer_graph import TransferGraph, transfer_graph
+from app.services.amount_stats import amount_zscore
+from app.services.system_counters import FLAGGED_TRANSACTIONS, bump_counters
+from app.services.volume_rollups import RollupRow, record_rollup_changes, rollup_columns
 import logging
 
 logger = logging.getLogger(__name__)
 
+SCAN_WINDOW = timedelta(hours=24)
+SCAN_ENGINES = ("serial", "sweep", "parallel", "vectorized")
+FRAUD_SCAN_CHECKPOINT = "fraud_scan"
+DAILY_SCAN_CHECKPOINT = "daily_fraud_scan"
+UNUSUAL_AMOUNT_REASON = "Unusual amount for this user"
+# Above this many senders an incremental scan aggregates over everyone instead of an IN list
+MAX_SENDER_FILTER = 1000
+# Transactions per flagging UPDATE
+FLAG_CHUNK = 500
+
+ScanRow = namedtuple("ScanRow", "id sender_id receiver_id amount type created_at currency", defaults=(None,))
+
+
+def flag_transactions(db: Session, reasons: dict) -> int:
+    """
+    Flag transactions given as id -> reason and count them in the system
+    counters and volume rollups. Ones already flagged are skipped and keep
+    their first reason, and ones an admin has reviewed stay as reviewed.
+    Returns how many were newly flagged; the caller commits.
+    """
+    table = Transaction.__table__
+    ids = sorted(reasons)
+    flagged = []
+    for start in range(0, len(ids), FLAG_CHUNK):
+        chunk = ids[start:start + FLAG_CHUNK]
+        flagged.extend(map(RollupRow._make, db.execute(
+            update(table).where(
+                table.c.id.in_(chunk), table.c.is_flagged == False, table.c.reviewed_at.is_(None)
+            ).values(
+                is_flagged=True,
+                flag_reason=case({transaction_id: reasons[transaction_id] for transaction_id in chunk}, value=table.c.id)
+            ).returning(*rollup_columns(table))
+        )))
+    bump_counters(db, {FLAGGED_TRANSACTIONS: len(flagged)})
+    record_rollup_changes(db, [row._replace(is_flagged=False) for row in flagged], flagged)
+    return len(flagged)
+
+
+def clear_flag(db: Session, transaction_id: int) -> bool:
+    """
+    Clear a transaction's flag as reviewed and count it out of the system
+    counters. Guarded on the flag, so of two concurrent reviews only one
+    goes through; False if it wasn't flagged. The caller commits.
+    """
+    cleared = db.execute(
+        update(Transaction).where(Transaction.id == transaction_id, Transaction.is_flagged == True).values(
+            is_flagged=False, reviewed_at=datetime.utcnow()
+        ),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if cleared:
+        bump_counters(db, {FLAGGED_TRANSACTIONS: -1})
+    return bool(cleared)
+
+
+def flag_for_review(db: Session, transaction_id: int, reason: str) -> bool:
+    """
+    Flag a transaction by hand and count it in the system counters. Unlike
+    flag_transactions it puts a reviewed transaction back up for review.
+    False if it was already flagged; the caller commits.
+    """
+    flagged = db.execute(
+        update(Transaction).where(Transaction.id == transaction_id, Transaction.is_flagged == False).values(
+            is_flagged=True, flag_reason=reason, reviewed_at=None
+        ),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if flagged:
+        bump_counters(db, {FLAGGED_TRANSACTIONS: 1})
+    return bool(flagged)
+
+
+def is_unusual_amount(score: Optional[float]) -> bool:
+    return score is not None and abs(score) > settings.FRAUD_ZSCORE_THRESHOLD
+
+
+def unusual_amounts(db: Session, rows) -> set:
+    """
+    Ids of the rows whose amount is unusual for their sender, scored like
+    check_transaction does but with one UserAmountStats lookup per
+    MAX_SENDER_FILTER senders instead of one per row.
+    """
+    rows = [row for row in rows if row.amount]
+    sender_ids = sorted({row.sender_id for row in rows})
+    stats = {}
+    for start in range(0, len(sender_ids), MAX_SENDER_FILTER):
+        for row in db.query(UserAmountStats).filter(
+            UserAmountStats.user_id.in_(sender_ids[start:start + MAX_SENDER_FILTER])
+        ):
+            stats[(row.user_id, row.currency)] = row
+    return {
+        row.id for row in rows
+        if is_unusual_amount(amount_zscore(stats.get((row.sender_id, row.currency)), row.amount))
+    }
+
+
+def judge_rows(db: Session, rules: RuleSet, rows, now: datetime, party_filter=None) -> list:
+    """
+    Evaluate the rules over a batch of transaction rows.
+
+    The senders' window aggregates come from the rule set's shared aggregate
+    queries (one per distinct window); rows no rule catches have their amount
+    scored against the sender's history. Returns (row, reason) pairs for the
+    suspicious rows.
+    """
+    if not rows:
+        return []
+    aggregates = rules.aggregate_queries(db, now, party_filter)
+
+    reasons = {}
+    for row in rows:
+        reasons[row.id] = rules.evaluate(row, [values.get(row.sender_id, 0) for values in aggregates])
+    for transaction_id in unusual_amounts(db, [row for row in rows if not reasons[row.id]]):
+        reasons[transaction_id] = UNUSUAL_AMOUNT_REASON
+    return [(row, reasons[row.id]) for row in rows if reasons[row.id]]
+
+
+def _senders_filter(rows, after_id: int = None):
+    """Narrow the aggregate queries to the senders being judged on incremental scans"""
+    sender_ids = {row.sender_id for row in rows}
+    if after_id is None or len(sender_ids) > MAX_SENDER_FILTER:
+        return None
+    return lambda column: column.in_(sender_ids)
+
+
+def _new_rows_filter(now: datetime, after_id: int = None, before_id: int = None):
+    """Rows a scan judges: past the checkpoint, or the whole window on a full scan, and below before_id"""
+    criterion = Transaction.id > after_id if after_id is not None else Transaction.created_at >= now - SCAN_WINDOW
+    if before_id is not None:
+        criterion = and_(criterion, Transaction.id < before_id)
+    return criterion
+
+
+def _is_new_row(row, now: datetime, after_id: int = None, before_id: int = None) -> bool:
+    if before_id is not None and row.id >= before_id:
+        return False
+    if after_id is not None:
+        return row.id > after_id
+    return to_epoch(row.created_at) >= to_epoch(now - SCAN_WINDOW)
+
+
+_worker_session = None
+
+
+def _init_scan_worker(database_url: str) -> None:
+    """Give each scan worker process its own engine and SessionLocal"""
+    global _worker_session
+    _worker_session = sessionmaker(autocommit=False, autoflush=False, bind=make_engine(database_url))
+
+
+def _scan_partition(rules: RuleSet, partition: int, partitions: int, now: datetime, after_id: int, upto_id: int) -> list:
+    """Evaluate the rules for the senders whose id hashes to this partition"""
+    db = _worker_session()
+    try:
+        rows = db.query(
+            Transaction.id,
+            Transaction.sender_id,
+            Transaction.receiver_id,
+            Transaction.amount,
+            Transaction.type,
+            Transaction.created_at,
+            Transaction.currency
+        ).filter(
+            Transaction.sender_id % partitions == partition,
+            Transaction.id <= upto_id,
+            _new_rows_filter(now, after_id)
+        ).all()
+        rows.sort(key=attrgetter("id"))
+
+        flagged = judge_rows(db, rules, rows, now, party_filter=lambda column: column % partitions == partition)
+        return [(ScanRow(*row), reason) for row, reason in flagged]
+    finally:
+        db.close()
+
+
 class FraudDetectionService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        engine: SlidingWindowFraudEngine = None,
+        graph: TransferGraph = None,
+        rules: RuleSet = None
+    ):
         self.db = db
+        self.engine = engine or fraud_engine
+        self.graph = graph or transfer_graph
+        # The engine's own rules unless given others, e.g. the scheduled scan's
+        self.rules = rules or self.engine.rules
+
+    def _sender_aggregates(self, transaction) -> list:
+        """The sender's window aggregates, from the engine when it holds this rule set's windows"""
+        if self.rules is self.engine.rules:
+            self.engine.ensure_loaded(self.db)
+            return self.engine.aggregates(transaction.sender_id)
+        aggregates = self.rules.aggregate_queries(
+            self.db, datetime.utcnow(), lambda column: column == transaction.sender_id
+        )
+        return [values.get(transaction.sender_id, 0) for values in aggregates]
 
     def check_transaction(self, transaction: Transaction) -> tuple[bool, str]:
         """Check if a transaction is suspicious"""
         try:
-            # Check for multiple transfers in short period
-            if transaction.type == TransactionType.TRANSFER:
-                recent_transfers = self.db.query(Transaction).filter(
-                    Transaction.sender_id == transaction.sender_id,
-                    Transaction.type == TransactionType.TRANSFER,
-                    Transaction.created_at >= datetime.utcnow() - timedelta(minutes=5)
-                ).count()
-                
-                if recent_transfers >= 3:
-                    return True, "Multiple transfers in short period"
-
-            # Check for large withdrawal
-            if transaction.type == TransactionType.WITHDRAWAL:
-                if transaction.amount > 1000:  # Threshold for large withdrawal
-                    return True, "Large withdrawal amount"
-
-            # Check for sudden large transfer
-            if transaction.type == TransactionType.TRANSFER:
-                if transaction.amount > 500:  # Threshold for large transfer
-                    return True, "Large transfer amount"
-
-            # Check for rapid balance changes
-            recent_transactions = self.db.query(Transaction).filter(
-                (Transaction.sender_id == transaction.sender_id) |
-                (Transaction.receiver_id == transaction.sender_id),
-                Transaction.created_at >= datetime.utcnow() - timedelta(hours=1)
-            ).all()
-
-            total_volume = sum(t.amount for t in recent_transactions)
-            if total_volume > 2000:  # Threshold for rapid balance changes
-                return True, "Rapid balance changes detected"
-
-            return False, ""
+            aggregates = self._sender_aggregates(transaction)
+            reason = self.rules.evaluate(transaction, aggregates)
+            if not reason:
+                if is_unusual_amount(self.score_amount(transaction)):
+                    reason = UNUSUAL_AMOUNT_REASON
+            return bool(reason), reason
 
         except Exception as e:
             logger.error(f"Error in fraud detection: {str(e)}")
             return False, ""
 
-    def scan_recent_transactions(self) -> list[dict]:
+    def score_amount(self, transaction) -> Optional[float]:
+        """z-score of the amount against the sender's running stats in that currency"""
+        stats = self.db.get(UserAmountStats, (transaction.sender_id, transaction.currency))
+        return amount_zscore(stats, transaction.amount)
+
+    def _resolve_engine(self, engine: str = None) -> str:
+        engine = engine or settings.FRAUD_SCAN_ENGINE
+        if engine not in SCAN_ENGINES:
+            raise ValueError(f"Unknown fraud scan engine '{engine}'. Expected one of {', '.join(SCAN_ENGINES)}")
+        return engine
+
+    def scan_recent_transactions(self, engine: str = None) -> list[dict]:
         """Scan recent transactions for fraud patterns"""
+        engine = self._resolve_engine(engine)
+
         try:
+            if engine != "serial":
+                flagged, _ = self._scan_batch(engine, datetime.utcnow())
+                return self._flag(flagged)
+
             suspicious_transactions = []
             recent_transactions = self.db.query(Transaction).filter(
-                Transaction.created_at >= datetime.utcnow() - timedelta(hours=24)
+                Transaction.created_at >= datetime.utcnow() - SCAN_WINDOW
             ).all()
+            recent_transactions.sort(key=attrgetter("id"))
 
             for transaction in recent_transactions:
                 is_suspicious, reason = self.check_transaction(transaction)
@@ -73,16 +271,190 @@ class FraudDetectionService:
                         "created_at": transaction.created_at
                     })
                     # Update transaction status
-                    transaction.is_flagged = True
-                    transaction.flag_reason = reason
+                    flag_transactions(self.db, {transaction.id: reason})
                     self.db.commit()
 
             return suspicious_transactions
 
         except Exception as e:
             logger.error(f"Error scanning transactions: {str(e)}")
+            self.db.rollback()
+            return []
+
+    def scan_new_transactions(
+        self, engine: str = None, checkpoint: str = FRAUD_SCAN_CHECKPOINT, settle: timedelta = None
+    ) -> list[dict]:
+        """
+        Scan only transactions committed since the last run.
+
+        Rows past the persisted high-water mark are judged against the
+        trailing hour the rules look at; the first run falls back to the
+        full 24h window. The mark advances in the same commit as the flags.
+
+        The scan stops at the first transaction younger than settle, so one
+        that took a lower id but commits late isn't passed over.
+        """
+        engine = self._resolve_engine(engine)
+
+        try:
+            return self._scan_new_transactions(engine, checkpoint, settle)
+        except Exception as e:
+            logger.error(f"Error scanning new transactions: {str(e)}")
+            self.db.rollback()
+            return []
+
+    def _scan_new_transactions(self, engine: str, checkpoint: str, settle: timedelta = None) -> list[dict]:
+        """scan_new_transactions without the error handling; the caller rolls back"""
+        settle = timedelta(seconds=settings.FRAUD_SCAN_SETTLE_SECONDS) if settle is None else settle
+        now = datetime.utcnow()
+        mark = get_checkpoint(self.db, checkpoint)
+        after_id = mark.last_transaction_id if mark else None
+        young = self.db.query(func.min(Transaction.id)).filter(
+            _new_rows_filter(now, after_id), Transaction.created_at >= now - settle
+        ).scalar()
+
+        if engine == "serial":
+            new_rows = self._window_rows(_new_rows_filter(now, after_id, young))
+            last = new_rows[-1] if new_rows else None
+            flagged = []
+            for row in new_rows:
+                is_suspicious, reason = self.check_transaction(row)
+                if is_suspicious:
+                    flagged.append((row, reason))
+        else:
+            flagged, last = self._scan_batch(engine, now, after_id, young)
+
+        if last is None:
+            return []
+
+        advance_checkpoint(self.db, checkpoint, last.id, last.created_at)
+        return self._flag(flagged, commit=True)
+
+    def scan_transfer_graph(self) -> list[dict]:
+        """
+        Flag transfers in short cycles or around fan-in/fan-out hubs.
+
+        Runs over the in-memory transfer graph; transfers already flagged by
+        the per-sender rules keep their reason, and ones an admin reviewed are skipped.
+        """
+        try:
+            return self._scan_transfer_graph()
+        except Exception as e:
+            logger.error(f"Error scanning transfer graph: {str(e)}")
+            self.db.rollback()
+            return []
+
+    def _scan_transfer_graph(self) -> list[dict]:
+        """scan_transfer_graph without the error handling; the caller rolls back"""
+        self.graph.ensure_loaded(self.db)
+        findings = self.graph.detect()
+        if not findings:
             return []
 
+        rows = []
+        ids = sorted(findings)
+        for start in range(0, len(ids), MAX_SENDER_FILTER):
+            rows.extend(self._window_rows(
+                Transaction.id.in_(ids[start:start + MAX_SENDER_FILTER]),
+                Transaction.is_flagged == False,
+                # An approved transfer stays in the window, and in the graph, until it ages out
+                Transaction.reviewed_at.is_(None)
+            ))
+        return self._flag([(row, findings[row.id]) for row in rows])
+
+    def _scan_batch(self, engine: str, now: datetime, after_id: int = None, before_id: int = None) -> tuple[list, object]:
+        """
+        Evaluate the scan window with a batch engine, judging rows below before_id.
+        Returns the (row, reason) pairs to flag and the newest row judged.
+        """
+        if engine == "parallel":
+            last = self.db.query(Transaction.id, Transaction.created_at).filter(
+                _new_rows_filter(now, after_id, before_id)
+            ).order_by(Transaction.id.desc()).first()
+            if last is None:
+                return [], None
+            return self._scan_parallel(now, after_id, last.id), last
+
+        if engine == "vectorized":
+            # NumPy is only needed when this engine is selected
+            from app.services.fraud_vectorized import evaluate_columns, load_columns
+            rows, columns = load_columns(self.db, or_(
+                _new_rows_filter(now, after_id, before_id),
+                Transaction.created_at >= now - self.rules.lookback
+            ))
+            mask, codes = evaluate_columns(columns, now, self.rules)
+            judge = [i for i, row in enumerate(rows) if _is_new_row(row, now, after_id, before_id)]
+            unusual = unusual_amounts(self.db, [rows[i] for i in judge if not mask[i]])
+            flagged = [
+                (rows[i], self.rules.rules[codes[i] - 1].reason if mask[i] else UNUSUAL_AMOUNT_REASON)
+                for i in judge if mask[i] or rows[i].id in unusual
+            ]
+            return flagged, (rows[judge[-1]] if judge else None)
+
+        rows = self._window_rows(_new_rows_filter(now, after_id, before_id))
+        flagged = judge_rows(self.db, self.rules, rows, now, _senders_filter(rows, after_id))
+        return flagged, (rows[-1] if rows else None)
+
+    def _scan_parallel(self, now: datetime, after_id: int, upto_id: int) -> list:
+        """Fan the window out to a process pool, one partition of senders per worker"""
+        partitions = max(1, settings.FRAUD_SCAN_WORKERS)
+        database_url = self.db.get_bind().url.render_as_string(hide_password=False)
+
+        with ProcessPoolExecutor(
+            max_workers=partitions,
+            initializer=_init_scan_worker,
+            initargs=(database_url,)
+        ) as pool:
+            results = pool.map(
+                _scan_partition,
+                repeat(self.rules),
+                range(partitions),
+                repeat(partitions),
+                repeat(now),
+                repeat(after_id),
+                repeat(upto_id)
+            )
+            flagged = [item for result in results for item in result]
+
+        # Match the serial scan's order
+        flagged.sort(key=lambda item: item[0].id)
+        return flagged
+
+    def _window_rows(self, *criteria) -> list:
+        """Fetch the columns the rules need, oldest id first"""
+        rows = self.db.query(
+            Transaction.id,
+            Transaction.sender_id,
+            Transaction.receiver_id,
+            Transaction.amount,
+            Transaction.currency,
+            Transaction.type,
+            Transaction.created_at
+        ).filter(*criteria).all()
+        # Sorted here: ORDER BY id would tempt the planner into walking the primary key
+        # instead of seeking the created_at index for the window
+        rows.sort(key=attrgetter("id"))
+        return rows
+
+    def _flag(self, flagged: list, commit: bool = False) -> list[dict]:
+        """Persist (row, reason) pairs in bulk and build the scan payload"""
+        if flagged:
+            flag_transactions(self.db, {row.id: reason for row, reason in flagged})
+        if flagged or commit:
+            self.db.commit()
+
+        return [
+            {
+                "transaction_id": row.id,
+                "user_id": row.sender_id,
+                "amount": row.amount,
+                "type": row.type,
+                "reason": reason,
+                "created_at": row.created_at
+            }
+            for row, reason in flagged
+        ]
+
     def get_fraud_stats(self) -> dict:
         """
         Get statistics about fraudulent transactions.
@@ -102,36 +474,17 @@ class FraudDetectionService:
         }
 
 def scan_for_fraud():
-    """Scan for potentially fraudulent transactions"""
+    """Scan transactions committed since the last run for fraud patterns, the daily rules included"""
     db = SessionLocal()
     try:
-        # Get transactions from the last 24 hours
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        
-        # Check for large transactions
-        large_transactions = db.query(Transaction).filter(
-            Transaction.created_at >= yesterday,
-            Transaction.amount > 10000,  # Threshold for large transactions
-            Transaction.is_flagged == False
-        ).all()
-        
-        # Check for rapid transactions
-        rapid_transactions = db.query(Transaction).filter(
-            Transaction.created_at >= yesterday,
-            Transaction.is_flagged == False
-        ).group_by(Transaction.user_id).having(
-            func.count(Transaction.id) > 10  # More than 10 transactions in 24 hours
-        ).all()
-        
-        # Flag suspicious transactions
-        for transaction in large_transactions + rapid_transactions:
-            transaction.is_flagged = True
-            transaction.flag_reason = "Automated fraud detection"
-            logger.info(f"Flagged transaction {transaction.id} for fraud detection")
-        
-        db.commit()
+        fraud_service = FraudDetectionService(db, rules=scheduled_fraud_rules)
+        engine = fraud_service._resolve_engine()
+        flagged = fraud_service._scan_new_transactions(engine, DAILY_SCAN_CHECKPOINT)
+        flagged += fraud_service._scan_transfer_graph()
+        for item in flagged:
+            logger.info(f"Flagged transaction {item['transaction_id']} for fraud detection: {item['reason']}")
         logger.info("Fraud detection scan completed successfully")
-        
+
     except Exception as e:
         logger.error(f"Error in fraud detection scan: {e}")
         db.rollback()
@@ -141,22 +494,5 @@ def scan_for_fraud():
 
 def check_transaction_fraud(transaction: Transaction, db: SessionLocal) -> bool:
     """Check if a single transaction is potentially fraudulent"""
-    try:
-        # Check for large amount
-        if transaction.amount > 10000:
-            return True
-            
-        # Check for rapid transactions
-        recent_transactions = db.query(Transaction).filter(
-            Transaction.user_id == transaction.user_id,
-            Transaction.created_at >= datetime.utcnow() - timedelta(hours=1)
-        ).count()
-        
-        if recent_transactions > 5:  # More than 5 transactions in an hour
-            return True
-            
-        return False
-        
-    except Exception as e:
-        logger.error(f"Error checking transaction fraud: {e}")
-        return False 
\ No newline at end of file
+    is_suspicious, _ = FraudDetectionService(db).check_transaction(transaction)
+    return is_suspicious
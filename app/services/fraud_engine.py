@@ -0,0 +1,152 @@
+from collections import deque
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+from app.models.models import Transaction
+from app.core.config import settings
+from app.services.fraud_rules import RuleSet, fraud_rules
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def to_epoch(value: datetime) -> float:
+    """Convert a naive-UTC or aware datetime to a POSIX timestamp"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class SlidingWindow:
+    """Running total over a trailing window, kept as ordered time buckets"""
+
+    __slots__ = ("buckets", "total")
+
+    def __init__(self):
+        self.buckets = deque()  # [bucket, value] pairs, oldest first
+        self.total = 0.0
+
+    def add(self, bucket: int, value: float) -> None:
+        if not self.buckets or self.buckets[-1][0] < bucket:
+            self.buckets.append([bucket, value])
+        elif self.buckets[-1][0] == bucket:
+            self.buckets[-1][1] += value
+        else:
+            # Commits can land slightly out of order; walk back to the slot
+            for i in range(len(self.buckets) - 1, -1, -1):
+                if self.buckets[i][0] == bucket:
+                    self.buckets[i][1] += value
+                    break
+                if self.buckets[i][0] < bucket:
+                    self.buckets.insert(i + 1, [bucket, value])
+                    break
+            else:
+                self.buckets.appendleft([bucket, value])
+        self.total += value
+
+    def expire(self, oldest_bucket: int) -> None:
+        while self.buckets and self.buckets[0][0] < oldest_bucket:
+            self.total -= self.buckets.popleft()[1]
+        if not self.buckets:
+            self.total = 0.0
+
+
+class SlidingWindowFraudEngine:
+    """
+    Per-user time-bucketed aggregates behind FraudDetectionService.check_transaction.
+
+    Keeps one sliding window per user for every aggregate the compiled rule
+    set needs (e.g. transfers sent in the last 5 minutes, volume sent or
+    received in the last hour), so a check is a few dictionary lookups
+    instead of queries. Windows are exact to the bucket resolution
+    (FRAUD_WINDOW_BUCKET_SECONDS).
+
+    State is per process: it is fed by transactions committed through this
+    process and rebuilt from the transactions table at startup.
+    """
+
+    def __init__(self, rules: RuleSet = None, bucket_seconds: int = None):
+        self.rules = rules or fraud_rules
+        self.bucket_seconds = bucket_seconds or settings.FRAUD_WINDOW_BUCKET_SECONDS
+        self.loaded = False
+        self._windows = [{} for _ in self.rules.specs]  # per spec: user_id -> SlidingWindow
+        self._lock = threading.Lock()
+
+    def _bucket(self, when: datetime) -> int:
+        return int(to_epoch(when) // self.bucket_seconds)
+
+    def _is_stale(self, when: datetime, now: datetime) -> bool:
+        return to_epoch(when) < to_epoch(now) - self.rules.lookback.total_seconds()
+
+    def _add(self, windows: dict, user_id: int, bucket: int, value: float) -> None:
+        window = windows.get(user_id)
+        if window is None:
+            window = windows[user_id] = SlidingWindow()
+        window.add(bucket, value)
+
+    def _total(self, index: int, user_id: int, now: datetime) -> float:
+        windows = self._windows[index]
+        window = windows.get(user_id)
+        if window is None:
+            return 0
+        window.expire(self._bucket(now - self.rules.specs[index].window))
+        if not window.buckets:
+            del windows[user_id]
+            return 0
+        return window.total
+
+    def _record(self, transaction, now: datetime) -> None:
+        if transaction.created_at is None or self._is_stale(transaction.created_at, now):
+            return
+        bucket = self._bucket(transaction.created_at)
+        for index, spec in enumerate(self.rules.specs):
+            if spec.types and transaction.type not in spec.types:
+                continue
+            value = 1 if spec.aggregate == "count" else (transaction.amount or 0.0)
+            self._add(self._windows[index], transaction.sender_id, bucket, value)
+            if spec.scope == "party" and transaction.receiver_id != transaction.sender_id:
+                self._add(self._windows[index], transaction.receiver_id, bucket, value)
+
+    def record(self, transaction) -> None:
+        """Add a committed transaction (ORM object or row) to the windows"""
+        with self._lock:
+            self._record(transaction, datetime.utcnow())
+
+    def aggregate(self, index: int, user_id: int, now: datetime = None) -> float:
+        """Current value of one compiled aggregate (see RuleSet.specs) for user_id"""
+        with self._lock:
+            return self._total(index, user_id, now or datetime.utcnow())
+
+    def aggregates(self, user_id: int, now: datetime = None) -> list:
+        """Current value of every compiled aggregate for user_id"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            return [self._total(index, user_id, now) for index in range(len(self.rules.specs))]
+
+    def rebuild(self, db: Session, now: datetime = None) -> None:
+        """Reload the windows from the transactions table"""
+        now = now or datetime.utcnow()
+        rows = db.query(
+            Transaction.sender_id,
+            Transaction.receiver_id,
+            Transaction.amount,
+            Transaction.type,
+            Transaction.created_at
+        ).filter(
+            Transaction.created_at >= now - self.rules.lookback
+        ).order_by(Transaction.created_at).all()
+
+        with self._lock:
+            self._windows = [{} for _ in self.rules.specs]
+            for row in rows:
+                self._record(row, now)
+            self.loaded = True
+        logger.info(f"Fraud engine rebuilt from {len(rows)} transactions")
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.rebuild(db)
+
+
+# Shared engine for the API process
+fraud_engine = SlidingWindowFraudEngine()
@@ -0,0 +1,175 @@
+from datetime import datetime
+from typing import Callable
+from sqlalchemy.orm import Session
+from app.models.models import Transaction
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.fraud_detection import FraudDetectionService, flag_transactions
+from app.services.fraud_engine import SlidingWindowFraudEngine
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FraudCheckQueue:
+    """
+    Post-commit fraud checking off the request path.
+
+    Committed transaction ids go onto a bounded in-process queue; worker
+    threads drain it in micro-batches, run the inline checks against the
+    in-memory fraud engine and the per-user amount stats, and write
+    is_flagged/flag_reason in one guarded update per batch. When the queue is full the id is dropped and left to
+    the incremental scheduled scan.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        engine: SlidingWindowFraudEngine = None,
+        maxsize: int = None,
+        workers: int = None,
+        batch_size: int = None,
+        batch_wait: float = None
+    ):
+        self.session_factory = session_factory
+        self.engine = engine
+        self.workers = workers or settings.FRAUD_QUEUE_WORKERS
+        self.batch_size = batch_size or settings.FRAUD_QUEUE_BATCH_SIZE
+        self.batch_wait = batch_wait if batch_wait is not None else settings.FRAUD_QUEUE_BATCH_WAIT_MS / 1000
+        self._queue = queue.Queue(maxsize=maxsize or settings.FRAUD_QUEUE_MAX_SIZE)
+        self._threads = []
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.flagged = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.last_batch_lag = 0.0
+        self.last_batch_at = None
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"fraud-check-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Fraud check queue started with {self.workers} workers")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Fraud check queue stopped")
+
+    def submit(self, transaction_id: int) -> bool:
+        """Enqueue a committed transaction id without blocking the caller"""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((transaction_id, time.monotonic()))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning(f"Fraud check queue full; transaction {transaction_id} left to the scheduled scan")
+            return False
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed_batches += 1
+                logger.error(f"Error processing fraud check batch: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def process_batch(self, batch: list) -> int:
+        """Check a batch of (transaction_id, enqueued_at) items; returns how many were flagged"""
+        ids = [transaction_id for transaction_id, _ in batch]
+        db = self.session_factory()
+        try:
+            fraud_service = FraudDetectionService(db, engine=self.engine)
+            transactions = db.query(
+                Transaction.id,
+                Transaction.sender_id,
+                Transaction.receiver_id,
+                Transaction.amount,
+                Transaction.currency,
+                Transaction.type,
+                Transaction.created_at
+            ).filter(Transaction.id.in_(ids)).all()
+
+            reasons = {}
+            for transaction in transactions:
+                is_suspicious, reason = fraud_service.check_transaction(transaction)
+                if is_suspicious:
+                    reasons[transaction.id] = reason
+            flagged = flag_transactions(db, reasons) if reasons else 0
+            if flagged:
+                db.commit()
+        finally:
+            db.close()
+
+        with self._stats_lock:
+            self.processed += len(batch)
+            self.flagged += flagged
+            self.last_batch_lag = time.monotonic() - min(enqueued_at for _, enqueued_at in batch)
+            self.last_batch_at = datetime.utcnow()
+        return flagged
+
+    def stats(self) -> dict:
+        """Queue depth and lag, to see when the workers fall behind"""
+        with self._queue.mutex:
+            oldest = self._queue.queue[0][1] if self._queue.queue else None
+        with self._stats_lock:
+            return {
+                "running": self.running,
+                "workers": len(self._threads),
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "oldest_pending_seconds": time.monotonic() - oldest if oldest is not None else 0.0,
+                "last_batch_lag_seconds": self.last_batch_lag,
+                "last_batch_at": self.last_batch_at,
+                "processed": self.processed,
+                "flagged": self.flagged,
+                "dropped": self.dropped,
+                "failed_batches": self.failed_batches
+            }
+
+
+# Shared queue for the API process
+fraud_queue = FraudCheckQueue()
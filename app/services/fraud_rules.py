@@ -0,0 +1,222 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Sequence
+from sqlalchemy import and_, case, func, literal, select, union_all
+from sqlalchemy.orm import Session
+from app.models.models import Transaction, TransactionType
+from app.core.config import settings
+
+# A per-user aggregate over a trailing window.
+# aggregate: "count" or "sum" of amounts; scope: "sender" counts what the user
+# sent, "party" what they sent or received; types: transaction types fed in
+AggregateSpec = namedtuple("AggregateSpec", "aggregate window scope types")
+
+
+class FraudRule:
+    """
+    A declarative fraud rule.
+
+    Without a window the rule compares the transaction's own amount with the
+    threshold; with one it compares the sender's aggregate over that window.
+    applies_to limits which transaction types the rule judges.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        reason: str,
+        threshold: float,
+        applies_to: Optional[Sequence[TransactionType]] = None,
+        aggregate: Optional[str] = None,
+        window: Optional[timedelta] = None,
+        scope: str = "sender",
+        counted_types: Optional[Sequence[TransactionType]] = None,
+        inclusive: bool = False
+    ):
+        if aggregate not in (None, "count", "sum"):
+            raise ValueError(f"Unknown aggregate '{aggregate}' for rule '{name}'")
+        if (aggregate is None) != (window is None):
+            raise ValueError(f"Rule '{name}' needs both an aggregate and a window, or neither")
+        if scope not in ("sender", "party"):
+            raise ValueError(f"Unknown scope '{scope}' for rule '{name}'")
+        self.name = name
+        self.reason = reason
+        self.threshold = threshold
+        self.applies_to = tuple(applies_to) if applies_to else None
+        self.inclusive = inclusive
+        self.spec = None
+        if aggregate:
+            self.spec = AggregateSpec(
+                aggregate, window, scope, tuple(counted_types) if counted_types else None
+            )
+
+    def applies(self, transaction_type: TransactionType) -> bool:
+        return self.applies_to is None or transaction_type in self.applies_to
+
+    def exceeds(self, value):
+        """Threshold comparison; also works element-wise on NumPy arrays"""
+        return value >= self.threshold if self.inclusive else value > self.threshold
+
+
+def default_rules() -> list[FraudRule]:
+    """The rule registry, in the order the rules take precedence"""
+    return [
+        FraudRule(
+            "rapid_transfers", "Multiple transfers in short period",
+            settings.FRAUD_RAPID_TRANSFER_COUNT,
+            applies_to=[TransactionType.TRANSFER],
+            aggregate="count",
+            window=timedelta(minutes=settings.FRAUD_RAPID_TRANSFER_WINDOW_MINUTES),
+            counted_types=[TransactionType.TRANSFER],
+            inclusive=True
+        ),
+        FraudRule(
+            "large_withdrawal", "Large withdrawal amount",
+            settings.FRAUD_LARGE_WITHDRAWAL_AMOUNT,
+            applies_to=[TransactionType.WITHDRAWAL]
+        ),
+        FraudRule(
+            "large_transfer", "Large transfer amount",
+            settings.FRAUD_LARGE_TRANSFER_AMOUNT,
+            applies_to=[TransactionType.TRANSFER]
+        ),
+        FraudRule(
+            "rapid_volume", "Rapid balance changes detected",
+            settings.FRAUD_VOLUME_LIMIT,
+            aggregate="sum",
+            window=timedelta(minutes=settings.FRAUD_VOLUME_WINDOW_MINUTES),
+            scope="party"
+        ),
+    ]
+
+
+def daily_rules() -> list[FraudRule]:
+    """
+    Rules only the scheduled scan applies, on top of default_rules. Kept out of
+    the inline rule set so inline verdicts, and the window the in-memory engine
+    holds, don't stretch to a day.
+    """
+    return [
+        FraudRule(
+            "suspicious_amount", "Suspicious transaction amount",
+            settings.SUSPICIOUS_TRANSACTION_THRESHOLD
+        ),
+        FraudRule(
+            "hourly_velocity", "Too many transactions in an hour",
+            settings.MAX_TRANSACTIONS_PER_HOUR,
+            aggregate="count",
+            window=timedelta(hours=1)
+        ),
+        FraudRule(
+            "daily_velocity", "Too many transactions in a day",
+            settings.FRAUD_MAX_DAILY_TRANSACTIONS,
+            aggregate="count",
+            window=timedelta(days=1)
+        ),
+    ]
+
+
+class RuleSet:
+    """
+    Rules compiled down to the distinct aggregates they need.
+
+    Rules declaring the same aggregate share one slot, and all aggregates over
+    the same window share one query, so a new rule over an existing window
+    costs no extra round trip.
+    """
+
+    def __init__(self, rules: Sequence[FraudRule]):
+        self.rules = list(rules)
+        self.specs = []
+        self.rule_specs = []  # index into specs per rule, or None
+        for rule in self.rules:
+            if rule.spec is None:
+                self.rule_specs.append(None)
+                continue
+            if rule.spec not in self.specs:
+                self.specs.append(rule.spec)
+            self.rule_specs.append(self.specs.index(rule.spec))
+
+        self.windows = {}  # window -> spec indexes sharing it
+        for index, spec in enumerate(self.specs):
+            self.windows.setdefault(spec.window, []).append(index)
+        self.lookback = max(self.windows, default=timedelta(0))
+
+    def spec_index(self, rule_name: str) -> int:
+        for rule, index in zip(self.rules, self.rule_specs):
+            if rule.name == rule_name:
+                return index
+        raise KeyError(rule_name)
+
+    def evaluate(self, transaction, aggregates: Sequence[float]) -> str:
+        """Reason of the first rule the transaction breaks, given its sender's aggregates"""
+        for rule, index in zip(self.rules, self.rule_specs):
+            if not rule.applies(transaction.type):
+                continue
+            value = transaction.amount if index is None else aggregates[index]
+            if value is not None and rule.exceeds(value):
+                return rule.reason
+        return ""
+
+    def aggregate_queries(self, db: Session, now: datetime, party_filter: Callable = None) -> list[dict]:
+        """
+        Compute every aggregate per user, one GROUP BY query per distinct window.
+
+        party_filter(column) optionally narrows the users (e.g. an IN list or a
+        hash partition). Returns one {user_id: value} dict per spec.
+        """
+        results = [{} for _ in self.specs]
+        for window, indexes in self.windows.items():
+            start = now - window
+            sent = select(
+                Transaction.sender_id.label("party"),
+                literal(1).label("is_sender"),
+                Transaction.type.label("type"),
+                Transaction.amount.label("amount")
+            ).where(Transaction.created_at >= start)
+            if party_filter is not None:
+                sent = sent.where(party_filter(Transaction.sender_id))
+            legs = sent
+
+            if any(self.specs[index].scope == "party" for index in indexes):
+                received = select(
+                    Transaction.receiver_id.label("party"),
+                    literal(0).label("is_sender"),
+                    Transaction.type.label("type"),
+                    Transaction.amount.label("amount")
+                ).where(
+                    Transaction.created_at >= start,
+                    Transaction.receiver_id != Transaction.sender_id
+                )
+                if party_filter is not None:
+                    received = received.where(party_filter(Transaction.receiver_id))
+                legs = union_all(sent, received)
+            legs = legs.subquery()
+
+            columns = []
+            for index in indexes:
+                spec = self.specs[index]
+                conditions = []
+                if spec.scope == "sender":
+                    conditions.append(legs.c.is_sender == 1)
+                if spec.types:
+                    conditions.append(legs.c.type.in_(spec.types))
+                value = literal(1) if spec.aggregate == "count" else func.coalesce(legs.c.amount, 0)
+                if conditions:
+                    value = case((and_(*conditions), value), else_=0)
+                columns.append(func.sum(value))
+
+            for party, *values in db.execute(select(legs.c.party, *columns).group_by(legs.c.party)):
+                for index, value in zip(indexes, values):
+                    if value:
+                        results[index][party] = value
+        return results
+
+
+def compile_rules(rules: Sequence[FraudRule] = None) -> RuleSet:
+    return RuleSet(default_rules() if rules is None else rules)
+
+
+# Compiled once from Settings at import
+fraud_rules = compile_rules()
+scheduled_fraud_rules = compile_rules(default_rules() + daily_rules())
@@ -0,0 +1,115 @@
+from datetime import datetime
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.models import Transaction, TransactionType
+from app.services.fraud_engine import to_epoch
+from app.services.fraud_rules import RuleSet, fraud_rules
+
+TYPE_CODES = {transaction_type: code for code, transaction_type in enumerate(TransactionType)}
+
+
+def _micros(value: datetime) -> int:
+    return int(round(to_epoch(value) * 1_000_000))
+
+
+def load_columns(db: Session, *criteria) -> tuple[list, dict]:
+    """Fetch the scan window once and split it into NumPy columns"""
+    rows = db.query(
+        Transaction.id,
+        Transaction.sender_id,
+        Transaction.receiver_id,
+        Transaction.amount,
+        Transaction.type,
+        Transaction.created_at,
+        Transaction.currency
+    ).filter(*criteria).order_by(Transaction.id).all()
+
+    count = len(rows)
+    columns = {
+        "id": np.fromiter((row.id for row in rows), dtype=np.int64, count=count),
+        "sender_id": np.fromiter((row.sender_id for row in rows), dtype=np.int64, count=count),
+        "receiver_id": np.fromiter((row.receiver_id for row in rows), dtype=np.int64, count=count),
+        "amount": np.fromiter((row.amount or 0.0 for row in rows), dtype=np.float64, count=count),
+        "type": np.fromiter((TYPE_CODES[row.type] for row in rows), dtype=np.int8, count=count),
+        "created_at": np.fromiter((_micros(row.created_at) for row in rows), dtype=np.int64, count=count),
+    }
+    return rows, columns
+
+
+def window_totals(keys, ts, values, query_keys, starts, ends=None):
+    """
+    For each query, sum values over rows with the same key and starts <= ts <= ends.
+
+    Rows are sorted by (key, ts) into one composite int64 axis so every window
+    becomes a pair of searchsorted bounds over a single prefix-sum array.
+    starts/ends may be scalars or per-query arrays; ends defaults to unbounded.
+    """
+    query_keys = np.asarray(query_keys, dtype=np.int64)
+    totals = np.zeros(len(query_keys), dtype=np.float64)
+    if len(keys) == 0 or len(query_keys) == 0:
+        return totals
+
+    starts = np.broadcast_to(np.asarray(starts, dtype=np.int64), query_keys.shape)
+    ends = np.broadcast_to(
+        np.asarray(ts.max() if ends is None else ends, dtype=np.int64), query_keys.shape
+    )
+    base = min(ts.min(), starts.min())
+    span = max(ts.max(), ends.max()) - base + 1
+
+    unique_keys, rank = np.unique(keys, return_inverse=True)
+    composite = rank.astype(np.int64) * span + (ts - base)
+    order = np.argsort(composite, kind="stable")
+    composite = composite[order]
+    prefix = np.concatenate(([0.0], np.cumsum(values[order], dtype=np.float64)))
+
+    query_rank = np.searchsorted(unique_keys, query_keys)
+    found = query_rank < len(unique_keys)
+    found[found] = unique_keys[query_rank[found]] == query_keys[found]
+    query_rank = query_rank[found].astype(np.int64)
+
+    lo = np.searchsorted(composite, query_rank * span + (starts[found] - base), side="left")
+    hi = np.searchsorted(composite, query_rank * span + (ends[found] - base), side="right")
+    totals[found] = prefix[hi] - prefix[lo]
+    return totals
+
+
+def evaluate_columns(columns: dict, now: datetime, rules: RuleSet = None) -> tuple:
+    """
+    Evaluate the rule set over columnar transactions.
+
+    Returns a boolean mask of suspicious rows and a reason code per row:
+    0 for none, otherwise 1 + the index of the first rule broken in rules.rules.
+    """
+    rules = rules or fraud_rules
+    sender = columns["sender_id"]
+    receiver = columns["receiver_id"]
+    amount = columns["amount"]
+    kind = columns["type"]
+    ts = columns["created_at"]
+
+    aggregates = []
+    for spec in rules.specs:
+        counted = _type_mask(kind, spec.types)
+        values = np.ones(len(sender)) if spec.aggregate == "count" else amount
+        keys, times, weights = sender[counted], ts[counted], values[counted]
+        if spec.scope == "party":
+            # Each transaction counts once for each distinct party
+            received = counted & (receiver != sender)
+            keys = np.concatenate((keys, receiver[received]))
+            times = np.concatenate((times, ts[received]))
+            weights = np.concatenate((weights, values[received]))
+        aggregates.append(window_totals(keys, times, weights, sender, _micros(now - spec.window)))
+
+    # Lowest-priority rule first so earlier rules overwrite later ones
+    codes = np.zeros(len(sender), dtype=np.int16)
+    for position in range(len(rules.rules) - 1, -1, -1):
+        rule, index = rules.rules[position], rules.rule_specs[position]
+        value = amount if index is None else aggregates[index]
+        codes[_type_mask(kind, rule.applies_to) & rule.exceeds(value)] = position + 1
+    return codes > 0, codes
+
+
+def _type_mask(kind, types):
+    if not types:
+        return np.ones(len(kind), dtype=bool)
+    return np.isin(kind, [TYPE_CODES[transaction_type] for transaction_type in types])
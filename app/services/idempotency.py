@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.models.models import IdempotencyKey
+from app.core.cache import KeyedLocks, TTLCache
+from app.core.config import settings
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (user_id, key) -> (request_hash, response)
+response_cache = TTLCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_CACHE_TTL_SECONDS)
+# Concurrent requests with the same key wait here for the first one to finish
+key_locks = KeyedLocks()
+
+
+class IdempotencyKeyReused(ValueError):
+    """The key was already used for a different request body"""
+
+
+def request_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def stored_response(db: Session, user_id: int, key: str, fingerprint: str) -> Optional[dict]:
+    """The response saved for this key, from the front cache or the table; None if the key is new"""
+    entry = response_cache.get((user_id, key))
+    if entry is None:
+        record = db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > datetime.utcnow()
+        ).first()
+        if record is None:
+            return None
+        entry = (record.request_hash, record.response)
+        response_cache.set((user_id, key), entry)
+
+    if entry[0] != fingerprint:
+        raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+    return entry[1]
+
+
+def save_response(db: Session, user_id: int, key: str, fingerprint: str, response: dict, transaction_id: int = None) -> None:
+    """
+    Store the response for a key.
+    The caller commits, so the key lands in the same commit as the work it stands for.
+    """
+    # Clear out an expired record for the same key; a live one committed
+    # meanwhile by a concurrent request stays, and our insert hits its primary key
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.add(IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=fingerprint,
+        transaction_id=transaction_id,
+        response=response,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    ))
+
+
+def cache_response(user_id: int, key: str, fingerprint: str, response: dict) -> None:
+    """Front-cache a committed response"""
+    response_cache.set((user_id, key), (fingerprint, response))
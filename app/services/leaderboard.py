@@ -0,0 +1,173 @@
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+from app.models.models import (
+    CurrencyType, User, Wallet, WalletBalance, from_minor_units, minor_unit_exponent, to_base_minor_units
+)
+from app.core.config import settings
+import argparse
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def top_by_total(db: Session, limit: int) -> List[dict]:
+    """Users with the largest FX-normalized total, read off ix_wallets_total_balance_minor with LIMIT"""
+    rows = db.query(User.id, User.email, Wallet.total_balance_minor).join(
+        Wallet, Wallet.user_id == User.id
+    ).filter(User.is_deleted == False).order_by(
+        Wallet.total_balance_minor.desc(), User.id
+    ).limit(limit).all()
+    return [
+        {
+            "user_id": user_id,
+            "email": email,
+            "total_balance": from_minor_units(total, settings.FX_BASE_CURRENCY),
+            "currency": settings.FX_BASE_CURRENCY
+        }
+        for user_id, email, total in rows
+    ]
+
+
+def top_by_currency(db: Session, currency: CurrencyType, limit: int) -> List[dict]:
+    """Users with the largest balance in one currency, read off ix_wallet_balances_currency_amount with LIMIT"""
+    rows = db.query(User.id, User.email, WalletBalance.amount_minor).join(
+        Wallet, Wallet.user_id == User.id
+    ).join(
+        WalletBalance, WalletBalance.wallet_id == Wallet.id
+    ).filter(
+        WalletBalance.currency == currency, User.is_deleted == False
+    ).order_by(WalletBalance.amount_minor.desc(), User.id).limit(limit).all()
+    return [
+        {
+            "user_id": user_id,
+            "email": email,
+            "total_balance": from_minor_units(amount, currency),
+            "currency": CurrencyType(currency).value
+        }
+        for user_id, email, amount in rows
+    ]
+
+
+def top_k_streamed(
+    db: Session,
+    currencies: List[CurrencyType],
+    limit: int,
+    rates: Optional[Dict[str, float]] = None,
+    batch_size: int = None
+) -> List[dict]:
+    """
+    Users with the largest total over an ad-hoc set of currencies and rates,
+    for combinations no maintained column covers. Balance rows stream off a
+    server-side cursor in wallet order and each wallet's total is pushed
+    through a heap of size limit, so memory stays O(limit) however many
+    wallets there are. Totals are in FX_BASE_CURRENCY.
+    """
+    rates = rates or settings.FX_RATES
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    currencies = [CurrencyType(currency) for currency in currencies]
+    base_unit = Decimal(1).scaleb(-minor_unit_exponent(settings.FX_BASE_CURRENCY))
+    # Minor units of each currency -> base currency major units
+    factors = {
+        currency: Decimal(str(rates.get(currency.value, 0))) / 10 ** minor_unit_exponent(currency)
+        for currency in currencies
+    }
+
+    rows = db.execute(
+        select(WalletBalance.wallet_id, WalletBalance.currency, WalletBalance.amount_minor).join(
+            Wallet, Wallet.id == WalletBalance.wallet_id
+        ).join(
+            User, User.id == Wallet.user_id
+        ).where(
+            WalletBalance.currency.in_(currencies), User.is_deleted == False
+        ).order_by(WalletBalance.wallet_id).execution_options(yield_per=batch_size)
+    )
+    heap = []
+    for wallet_id, wallet_rows in groupby(rows, key=lambda row: row.wallet_id):
+        total = sum((row.amount_minor * factors[row.currency] for row in wallet_rows), Decimal(0))
+        # Ties go to the lower wallet id
+        entry = (total, -wallet_id)
+        if len(heap) < limit:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    leaders = sorted(heap, reverse=True)
+    owners = {
+        wallet_id: (user_id, email)
+        for wallet_id, user_id, email in db.query(Wallet.id, User.id, User.email).join(
+            User, User.id == Wallet.user_id
+        ).filter(Wallet.id.in_([-wallet_id for _, wallet_id in leaders]))
+    }
+    return [
+        {
+            "user_id": owners[-wallet_id][0],
+            "email": owners[-wallet_id][1],
+            "total_balance": float(total.quantize(base_unit)),
+            "currency": settings.FX_BASE_CURRENCY
+        }
+        for total, wallet_id in leaders
+    ]
+
+
+def recompute_totals(db: Session, chunk_size: int = 10000) -> int:
+    """
+    Recompute every wallet's total_balance_minor from its balance rows at the
+    current FX_RATES, chunk_size wallet ids at a time, each chunk committed on
+    its own; returns how many wallets changed. Run it after changing FX_RATES.
+    Each total is written only if it hasn't moved since it was read, so a
+    wallet written to meanwhile is left to the next run.
+    """
+    table = Wallet.__table__
+    changed = skipped = 0
+    upto = db.query(func.max(Wallet.id)).scalar() or 0
+    for start in range(0, upto, chunk_size):
+        # Totals and balances in one statement, so they are read together
+        rows = db.execute(
+            select(Wallet.id, Wallet.total_balance_minor, WalletBalance.currency, WalletBalance.amount_minor).outerjoin(
+                WalletBalance, WalletBalance.wallet_id == Wallet.id
+            ).where(Wallet.id > start, Wallet.id <= min(start + chunk_size, upto)).order_by(Wallet.id)
+        )
+        updates = []
+        for (wallet_id, stored), wallet_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+            total = sum(
+                to_base_minor_units(amount, currency) for _, _, currency, amount in wallet_rows if currency is not None
+            )
+            if total != stored:
+                updates.append({"b_id": wallet_id, "b_stored": stored, "b_total": total})
+        if updates:
+            result = db.execute(
+                update(table).where(
+                    table.c.id == bindparam("b_id"), table.c.total_balance_minor == bindparam("b_stored")
+                ).values(total_balance_minor=bindparam("b_total")),
+                updates
+            )
+            changed += result.rowcount
+            skipped += len(updates) - result.rowcount
+        db.commit()
+        logger.info(f"Recomputed wallet totals up to id {min(start + chunk_size, upto)} of {upto}")
+    if skipped:
+        logger.warning(f"{skipped} wallets changed during the recompute and were left as they were")
+    return changed
+
+
+if __name__ == "__main__":
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the wallet totals behind the balance leaderboard")
+    parser.add_argument("--recompute", action="store_true", help="Recompute every total at the current FX_RATES")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Wallet ids recomputed per commit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.recompute:
+        parser.error("nothing to do; pass --recompute")
+    db = SessionLocal()
+    try:
+        changed = recompute_totals(db, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    logger.info(f"{changed} wallet totals corrected")
@@ -0,0 +1,240 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable
+from sqlalchemy import and_, event, func, insert, or_, select
+from sqlalchemy.orm import Session
+from app.db.session import SessionLocal
+from app.models.models import (
+    CurrencyType, LedgerEntry, Transaction, TransactionStatus, TransactionType, WalletBalance,
+    WalletBalanceSnapshot, from_minor_units, to_minor_units
+)
+from app.core.config import settings
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Wallets per IN list when looking up their previous snapshots
+SNAPSHOT_CHUNK = 1000
+
+
+@event.listens_for(LedgerEntry, "before_update")
+@event.listens_for(LedgerEntry, "before_delete")
+def _append_only(mapper, connection, target):
+    raise ValueError("Ledger entries are append-only; post a correcting entry instead")
+
+
+def entry_pair(transaction) -> list:
+    """The (wallet_id, amount_minor) debit and credit a transaction posts; None is outside the system"""
+    amount_minor = to_minor_units(transaction.amount, transaction.currency, strict=False)
+    source, destination = transaction.sender_wallet_id, transaction.receiver_wallet_id
+    if transaction.type == TransactionType.DEPOSIT:
+        source = None
+    elif transaction.type == TransactionType.WITHDRAWAL:
+        destination = None
+    return [(source, -amount_minor), (destination, amount_minor)]
+
+
+def record_entries(db: Session, transactions: Iterable[Transaction]) -> None:
+    """
+    Post the ledger entries for completed transactions, in one INSERT.
+    The caller commits, so the entries land in the same commit as the transactions.
+    """
+    transactions = [t for t in transactions if t.status == TransactionStatus.COMPLETED]
+    if not transactions:
+        return
+    if any(t.id is None for t in transactions):
+        db.flush()
+    now = datetime.utcnow()
+    # Core insert: the ORM's bulk insert would split rows with a NULL wallet into a second statement
+    db.execute(insert(LedgerEntry.__table__), [
+        {
+            "transaction_id": transaction.id,
+            "wallet_id": wallet_id,
+            "currency": transaction.currency,
+            "amount_minor": amount_minor,
+            "created_at": now
+        }
+        for transaction in transactions
+        for wallet_id, amount_minor in entry_pair(transaction)
+    ])
+
+
+def record_reversal(db: Session, transaction: Transaction) -> None:
+    """Post entries that cancel a transaction's own, leaving its history in place; the caller commits"""
+    now = datetime.utcnow()
+    db.execute(insert(LedgerEntry.__table__), [
+        {
+            "transaction_id": transaction.id,
+            "wallet_id": wallet_id,
+            "currency": transaction.currency,
+            "amount_minor": -amount_minor,
+            "created_at": now
+        }
+        for wallet_id, amount_minor in entry_pair(transaction)
+    ])
+
+
+def open_ledger(db: Session) -> int:
+    """
+    Post opening entries for balances the ledger doesn't account for, i.e.
+    that predate it: per (wallet, currency), the balance less the entries
+    already posted, so a wallet that transacted before the ledger was opened
+    is still opened. Returns the wallets opened; the caller commits.
+    """
+    posted = select(
+        LedgerEntry.wallet_id, LedgerEntry.currency, func.sum(LedgerEntry.amount_minor).label("amount_minor")
+    ).where(LedgerEntry.wallet_id.isnot(None)).group_by(LedgerEntry.wallet_id, LedgerEntry.currency).subquery()
+    unposted = WalletBalance.amount_minor - func.coalesce(posted.c.amount_minor, 0)
+    rows = db.execute(
+        select(WalletBalance.wallet_id, WalletBalance.currency, unposted).outerjoin(
+            posted, and_(posted.c.wallet_id == WalletBalance.wallet_id, posted.c.currency == WalletBalance.currency)
+        ).where(unposted != 0)
+    ).all()
+    if rows:
+        now = datetime.utcnow()
+        db.execute(insert(LedgerEntry), [
+            {"transaction_id": None, "wallet_id": account, "currency": currency, "amount_minor": amount, "created_at": now}
+            for wallet_id, currency, amount_minor in rows
+            for account, amount in ((None, -amount_minor), (wallet_id, amount_minor))
+        ])
+    opened = len({wallet_id for wallet_id, _, _ in rows})
+    logger.info(f"Posted opening ledger entries for {opened} wallets")
+    return opened
+
+
+def take_snapshots(db: Session, now: datetime = None, settle: timedelta = None) -> int:
+    """
+    Snapshot the balances that changed since the previous run: the previous
+    snapshot of each (wallet, currency) plus the entries posted since. Only
+    new entries are read, so a run costs what was posted since the last one.
+    Returns the snapshot rows written; the caller commits.
+
+    The run stops short of the first entry younger than settle, so one that
+    took a lower id but commits late isn't passed over.
+    """
+    now = now or datetime.utcnow()
+    settle = timedelta(seconds=settings.LEDGER_SNAPSHOT_SETTLE_SECONDS) if settle is None else settle
+    cutoff = now - settle
+    previous = db.query(func.max(WalletBalanceSnapshot.last_entry_id)).scalar() or 0
+    young = db.query(func.min(LedgerEntry.id)).filter(
+        LedgerEntry.id > previous, LedgerEntry.created_at >= cutoff
+    ).scalar()
+    settled = db.query(func.max(LedgerEntry.id)).filter(LedgerEntry.id > previous, LedgerEntry.created_at < cutoff)
+    if young is not None:
+        settled = settled.filter(LedgerEntry.id < young)
+    last = settled.scalar() or 0
+    if last <= previous:
+        return 0
+
+    deltas = db.execute(
+        select(LedgerEntry.wallet_id, LedgerEntry.currency, func.sum(LedgerEntry.amount_minor)).where(
+            LedgerEntry.id > previous,
+            LedgerEntry.id <= last,
+            LedgerEntry.wallet_id.isnot(None)
+        ).group_by(LedgerEntry.wallet_id, LedgerEntry.currency)
+    ).all()
+
+    wallet_ids = sorted({wallet_id for wallet_id, _, _ in deltas})
+    prior = {}
+    for start in range(0, len(wallet_ids), SNAPSHOT_CHUNK):
+        chunk = wallet_ids[start:start + SNAPSHOT_CHUNK]
+        latest = select(
+            WalletBalanceSnapshot.wallet_id,
+            WalletBalanceSnapshot.currency,
+            func.max(WalletBalanceSnapshot.last_entry_id).label("last_entry_id")
+        ).where(WalletBalanceSnapshot.wallet_id.in_(chunk)).group_by(
+            WalletBalanceSnapshot.wallet_id, WalletBalanceSnapshot.currency
+        ).subquery()
+        for wallet_id, currency, amount_minor in db.execute(
+            select(WalletBalanceSnapshot.wallet_id, WalletBalanceSnapshot.currency, WalletBalanceSnapshot.amount_minor).join(
+                latest, and_(
+                    WalletBalanceSnapshot.wallet_id == latest.c.wallet_id,
+                    WalletBalanceSnapshot.currency == latest.c.currency,
+                    WalletBalanceSnapshot.last_entry_id == latest.c.last_entry_id
+                )
+            )
+        ):
+            prior[(wallet_id, currency)] = amount_minor
+
+    if deltas:
+        db.execute(insert(WalletBalanceSnapshot), [
+            {
+                "wallet_id": wallet_id,
+                "currency": currency,
+                "amount_minor": prior.get((wallet_id, currency), 0) + delta,
+                "last_entry_id": last,
+                "taken_at": now
+            }
+            for wallet_id, currency, delta in deltas
+        ])
+    logger.info(f"Snapshotted {len(deltas)} wallet balances up to ledger entry {last}")
+    return len(deltas)
+
+
+def balances_as_of(db: Session, wallet_id: int, as_of: datetime) -> Dict[str, float]:
+    """
+    A wallet's balances at a point in time: per currency, the nearest snapshot
+    taken by then plus a replay of the wallet's later entries up to as_of.
+    """
+    latest = select(
+        WalletBalanceSnapshot.currency,
+        func.max(WalletBalanceSnapshot.last_entry_id).label("last_entry_id")
+    ).where(
+        WalletBalanceSnapshot.wallet_id == wallet_id,
+        WalletBalanceSnapshot.taken_at <= as_of
+    ).group_by(WalletBalanceSnapshot.currency).subquery()
+    snapshots = db.execute(
+        select(WalletBalanceSnapshot.currency, WalletBalanceSnapshot.amount_minor, WalletBalanceSnapshot.last_entry_id).join(
+            latest, and_(
+                WalletBalanceSnapshot.currency == latest.c.currency,
+                WalletBalanceSnapshot.last_entry_id == latest.c.last_entry_id
+            )
+        ).where(WalletBalanceSnapshot.wallet_id == wallet_id)
+    ).all()
+
+    balances = {currency: 0 for currency in CurrencyType}
+    marks = {currency: 0 for currency in CurrencyType}
+    for currency, amount_minor, last_entry_id in snapshots:
+        balances[currency] = amount_minor
+        marks[currency] = last_entry_id
+
+    replay = db.execute(
+        select(LedgerEntry.currency, func.sum(LedgerEntry.amount_minor)).where(
+            LedgerEntry.wallet_id == wallet_id,
+            LedgerEntry.created_at <= as_of,
+            or_(*[and_(LedgerEntry.currency == currency, LedgerEntry.id > mark) for currency, mark in marks.items()])
+        ).group_by(LedgerEntry.currency)
+    ).all()
+    for currency, delta in replay:
+        balances[currency] += delta
+
+    return {currency.value: from_minor_units(amount_minor, currency) for currency, amount_minor in balances.items()}
+
+
+def snapshot_balances():
+    """Scheduled job: snapshot the balances that changed since the last run"""
+    db = SessionLocal()
+    try:
+        take_snapshots(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error taking balance snapshots: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Take wallet balance snapshots from the ledger")
+    parser.add_argument("--open", action="store_true", help="First post opening entries for wallets that predate the ledger")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        if args.open:
+            open_ledger(db)
+        take_snapshots(db)
+        db.commit()
+    finally:
+        db.close()
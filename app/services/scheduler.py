@@ -1,6 +1,8 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from app.services.fraud_detection import scan_for_fraud
+from app.services.ledger import snapshot_balances
+from app.services.volume_rollups import rollup_volumes
 from app.core.config import settings
 import logging
 
@@ -14,12 +16,36 @@ scheduler = BackgroundScheduler()
 def setup_scheduler():
     """Setup and configure the scheduler with jobs"""
     try:
-        # Add daily fraud detection job
+        # Add incremental fraud detection job
         scheduler.add_job(
             scan_for_fraud,
-            trigger=CronTrigger(hour=0, minute=0),  # Run at midnight
+            trigger=IntervalTrigger(minutes=settings.FRAUD_SCAN_INTERVAL_MINUTES),
             id='fraud_detection',
-            name='Daily fraud detection scan',
+            name='Incremental fraud detection scan',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+        # Add balance snapshot job, bounding the ledger replay of point-in-time balances
+        scheduler.add_job(
+            snapshot_balances,
+            trigger=IntervalTrigger(minutes=settings.LEDGER_SNAPSHOT_INTERVAL_MINUTES),
+            id='balance_snapshots',
+            name='Wallet balance snapshots',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+        # Add volume rollup job, folding new transactions into the hourly and daily series
+        scheduler.add_job(
+            rollup_volumes,
+            trigger=IntervalTrigger(minutes=settings.VOLUME_ROLLUP_INTERVAL_MINUTES),
+            id='volume_rollups',
+            name='Transaction volume rollups',
+            max_instances=1,
+            coalesce=True,
             replace_existing=True
         )
         
@@ -0,0 +1,168 @@
+from collections import Counter
+from typing import Dict, Tuple
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.models import (
+    CurrencyType, SystemCounter, Transaction, TransactionStatus, User, Wallet, to_minor_units
+)
+from app.core.config import settings
+import argparse
+import logging
+import random
+import sys
+
+logger = logging.getLogger(__name__)
+
+USERS = "users"  # Not deleted
+WALLETS = "wallets"  # Not deleted
+TRANSACTIONS = "transactions"
+FLAGGED_TRANSACTIONS = "flagged_transactions"
+
+
+def volume_counter(currency: CurrencyType) -> str:
+    """Completed volume in a currency, in minor units"""
+    return f"completed_volume_minor:{CurrencyType(currency).value}"
+
+
+def counter_names() -> list:
+    return [USERS, WALLETS, TRANSACTIONS, FLAGGED_TRANSACTIONS] + [volume_counter(c) for c in CurrencyType]
+
+
+def bump_counters(db: Session, deltas: Dict[str, int]) -> None:
+    """
+    Add deltas to the counters on one randomly chosen shard, in one UPDATE
+    with a CASE per name. Rows a shard doesn't have yet are inserted, under a
+    savepoint in case a concurrent writer inserts the same row first.
+    The caller commits.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = SystemCounter.__table__
+    shard = random.randrange(settings.SYSTEM_COUNTER_SHARDS)
+    result = db.execute(
+        update(table).where(table.c.shard == shard, table.c.name.in_(list(deltas))).values(
+            value=table.c.value + case(deltas, value=table.c.name, else_=0)
+        )
+    )
+    if result.rowcount == len(deltas):
+        return
+
+    existing = set(db.execute(
+        select(table.c.name).where(table.c.shard == shard, table.c.name.in_(list(deltas)))
+    ).scalars())
+    missing = {name: delta for name, delta in deltas.items() if name not in existing}
+    try:
+        with db.begin_nested():
+            db.execute(insert(table), [{"name": name, "shard": shard, "value": delta} for name, delta in missing.items()])
+    except IntegrityError:
+        # A concurrent writer created some of the rows first; go again
+        bump_counters(db, missing)
+
+
+def seed_counters(db: Session) -> None:
+    """Create every counter's shard rows at zero, so writers never take the insert path; the caller commits"""
+    table = SystemCounter.__table__
+    existing = set(db.execute(select(table.c.name, table.c.shard)).all())
+    rows = [
+        {"name": name, "shard": shard, "value": 0}
+        for name in counter_names() for shard in range(settings.SYSTEM_COUNTER_SHARDS)
+        if (name, shard) not in existing
+    ]
+    if rows:
+        db.execute(insert(table), rows)
+
+
+def transaction_deltas(transactions) -> Counter:
+    """What new transactions add to the counters"""
+    deltas = Counter()
+    for transaction in transactions:
+        deltas[TRANSACTIONS] += 1
+        if transaction.is_flagged:
+            deltas[FLAGGED_TRANSACTIONS] += 1
+        if transaction.status == TransactionStatus.COMPLETED:
+            deltas[volume_counter(transaction.currency)] += to_minor_units(
+                transaction.amount, transaction.currency, strict=False
+            )
+    return deltas
+
+
+def record_counters(db: Session, transactions) -> None:
+    """Count new transactions; called before they commit"""
+    bump_counters(db, transaction_deltas(transactions))
+
+
+def read_counters(db: Session) -> Dict[str, int]:
+    """Every counter's value, summed over its shards in one small query"""
+    values = dict.fromkeys(counter_names(), 0)
+    values.update(db.query(SystemCounter.name, func.sum(SystemCounter.value)).group_by(SystemCounter.name).all())
+    return values
+
+
+def _id_ranges(db: Session, model, chunk_size: int):
+    upto = db.query(func.max(model.id)).scalar() or 0
+    for start in range(0, upto, chunk_size):
+        yield model.id > start, model.id <= min(start + chunk_size, upto)
+
+
+def count_base_tables(db: Session, chunk_size: int = 10000) -> Dict[str, int]:
+    """What the counters should hold, recomputed from the base tables chunk_size ids at a time"""
+    actual = dict.fromkeys(counter_names(), 0)
+    for model, name in ((User, USERS), (Wallet, WALLETS)):
+        for in_chunk in _id_ranges(db, model, chunk_size):
+            actual[name] += db.query(func.count(model.id)).filter(*in_chunk, model.is_deleted == False).scalar()
+
+    completed_amount = case((Transaction.status == TransactionStatus.COMPLETED, Transaction.amount), else_=0)
+    for in_chunk in _id_ranges(db, Transaction, chunk_size):
+        for currency, count, volume, flagged in db.query(
+            Transaction.currency,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(completed_amount), 0),
+            func.coalesce(func.sum(case((Transaction.is_flagged == True, 1), else_=0)), 0)
+        ).filter(*in_chunk).group_by(Transaction.currency):
+            actual[TRANSACTIONS] += count
+            actual[FLAGGED_TRANSACTIONS] += flagged
+            if currency is not None:
+                actual[volume_counter(currency)] += to_minor_units(volume, currency, strict=False)
+    return actual
+
+
+def verify_counters(db: Session, chunk_size: int = 10000) -> Dict[str, Tuple[int, int]]:
+    """Counters that disagree with the base tables, as name -> (stored, actual)"""
+    actual = count_base_tables(db, chunk_size)
+    stored = read_counters(db)
+    return {name: (stored[name], value) for name, value in actual.items() if stored[name] != value}
+
+
+def repair_counters(db: Session, chunk_size: int = 10000) -> Dict[str, Tuple[int, int]]:
+    """
+    Correct drifted counters by the difference and commit; returns the drift found.
+    Missing shard rows are created along the way. Writes landing while the base tables are counted can still be off by
+    their own amount, so run it when traffic is quiet.
+    """
+    drift = verify_counters(db, chunk_size)
+    seed_counters(db)
+    bump_counters(db, {name: actual - stored for name, (stored, actual) in drift.items()})
+    db.commit()
+    return drift
+
+
+if __name__ == "__main__":
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Check the admin stats counters against the base tables")
+    parser.add_argument("--repair", action="store_true", help="Correct counters that drifted")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Ids counted per query")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        drift = (repair_counters if args.repair else verify_counters)(db, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    for name, (stored, actual) in sorted(drift.items()):
+        logger.info(f"{name}: stored {stored}, actual {actual}")
+    logger.info(f"{len(drift)} counters {'repaired' if args.repair else 'drifted'}")
+    sys.exit(1 if drift and not args.repair else 0)
@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import Iterator, Sequence
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models.models import Transaction
+from app.core.config import settings
+import csv
+import enum
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_COLUMNS = (
+    "id", "sender_id", "receiver_id", "sender_wallet_id", "receiver_wallet_id", "amount", "currency",
+    "type", "status", "description", "is_flagged", "flag_reason", "created_at", "updated_at"
+)
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(rows) -> str:
+    return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, map(_plain, row)))) + "\n" for row in rows)
+
+
+def _csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def export_transactions(bind: Engine, criteria: Sequence, fmt: str, batch_size: int = None) -> Iterator[str]:
+    """
+    Stream matching transactions as NDJSON lines or CSV, oldest id first.
+
+    Rows come off a server-side cursor in batches of batch_size and are
+    written out one batch at a time, so memory stays flat however many rows
+    match. The stream uses its own session, since it outlives the request's.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    write = _csv if fmt == "csv" else _ndjson
+    columns = [Transaction.__table__.c[name] for name in EXPORT_COLUMNS]
+    statement = select(*columns).where(*criteria).order_by(Transaction.id)
+
+    if fmt == "csv":
+        yield _csv([EXPORT_COLUMNS])
+    with Session(bind=bind) as db:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        exported = 0
+        for rows in result.partitions():
+            exported += len(rows)
+            yield write(rows)
+    logger.info(f"Exported {exported} transactions as {fmt}")
@@ -0,0 +1,74 @@
+from app.services.fraud_engine import fraud_engine
+from app.services.fraud_queue import fraud_queue
+from app.services.transfer_graph import transfer_graph
+from app.services.amount_stats import record_amounts
+from app.services.balances import apply_transaction, undo_transaction
+from app.services.ledger import record_entries, record_reversal
+from app.services.system_counters import bump_counters, record_counters, volume_counter
+from app.services.tx_summary import record_summaries, revert_summaries
+from app.models.models import TransactionStatus, to_minor_units
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def on_transactions_pending(db: Session, *transactions) -> None:
+    """Update per-user state and the ledger, which must commit together with the transactions"""
+    record_amounts(db, transactions)
+    record_summaries(db, transactions)
+    record_entries(db, transactions)
+    record_counters(db, transactions)
+
+
+def complete_transaction(db: Session, transaction) -> None:
+    """
+    Set a pending transaction to COMPLETED: its funds move (InsufficientFunds
+    if the paying side can't cover them) and it joins the per-user state,
+    ledger and completed volume it was left out of. The caller commits.
+    """
+    apply_transaction(db, transaction)
+    transaction.status = TransactionStatus.COMPLETED
+    record_amounts(db, [transaction])
+    record_summaries(db, [transaction])
+    record_entries(db, [transaction])
+    bump_counters(db, {
+        volume_counter(transaction.currency): to_minor_units(transaction.amount, transaction.currency, strict=False)
+    })
+
+
+def on_transaction_cancelled(db: Session, transaction) -> None:
+    """
+    Take a completed transaction back out of the summaries, ledger and counters,
+    in the caller's commit. Its balances are the caller's to move back.
+    """
+    if transaction.status != TransactionStatus.COMPLETED:
+        return
+    revert_summaries(db, [transaction])
+    record_reversal(db, transaction)
+    bump_counters(db, {
+        volume_counter(transaction.currency): -to_minor_units(transaction.amount, transaction.currency, strict=False)
+    })
+
+
+def cancel_transaction(db: Session, transaction, status: TransactionStatus = TransactionStatus.CANCELLED) -> None:
+    """
+    Set a transaction to CANCELLED or FAILED. A completed one has its funds
+    moved back (InsufficientFunds if the receiving side has spent them) and
+    is taken out of the summaries, ledger and counters. The caller commits.
+    """
+    if transaction.status == TransactionStatus.COMPLETED:
+        undo_transaction(db, transaction)
+    on_transaction_cancelled(db, transaction)
+    transaction.status = status
+
+
+def on_transactions_committed(*transactions) -> None:
+    """Feed freshly committed transactions to the in-process fraud state and checks"""
+    for transaction in transactions:
+        try:
+            fraud_engine.record(transaction)
+            transfer_graph.record(transaction)
+            fraud_queue.submit(transaction.id)
+        except Exception as e:
+            logger.error(f"Error recording transaction {transaction.id} for fraud checks: {str(e)}")
@@ -0,0 +1,181 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from app.models.models import Transaction, TransactionType
+from app.core.config import settings
+from app.services.fraud_engine import to_epoch
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CYCLE_REASON = "Circular transfer pattern"
+FAN_IN_REASON = "High fan-in transfers"
+FAN_OUT_REASON = "High fan-out transfers"
+
+
+class TransferEdge:
+    """Money moved from one user to another, with an exponentially decaying weight"""
+
+    __slots__ = ("weight", "updated", "transactions")
+
+    def __init__(self):
+        self.weight = 0.0
+        self.updated = 0.0
+        self.transactions = deque()  # (epoch, transaction_id), oldest first
+
+    def decayed(self, now: float, half_life: float) -> float:
+        return self.weight * 0.5 ** (max(0.0, now - self.updated) / half_life)
+
+    def add(self, when: float, amount: float, transaction_id: int, half_life: float) -> None:
+        self.weight = self.decayed(when, half_life) + amount
+        self.updated = max(self.updated, when)
+        self.transactions.append((when, transaction_id))
+
+
+class TransferGraph:
+    """
+    In-memory adjacency index over TRANSFER sender -> receiver pairs.
+
+    Edges carry an exponentially time-decayed amount (FRAUD_GRAPH_HALF_LIFE_MINUTES)
+    and the ids of the transfers behind them within FRAUD_GRAPH_WINDOW_HOURS.
+    detect() finds 2- and 3-cycles (A->B->A, A->B->C->A) and fan-in/fan-out
+    hubs in one pass over the edges; nodes above FRAUD_GRAPH_MAX_DEGREE are
+    not expanded, which keeps cycle search near-linear in the edge count.
+
+    Like the sliding-window engine, state is per process: fed by committed
+    transfers and rebuilt from the transactions table at startup.
+    """
+
+    def __init__(
+        self,
+        half_life: timedelta = None,
+        window: timedelta = None,
+        min_weight: float = None,
+        fan_in: int = None,
+        fan_out: int = None,
+        max_degree: int = None
+    ):
+        self.half_life = (half_life or timedelta(minutes=settings.FRAUD_GRAPH_HALF_LIFE_MINUTES)).total_seconds()
+        self.window = window or timedelta(hours=settings.FRAUD_GRAPH_WINDOW_HOURS)
+        self.min_weight = settings.FRAUD_GRAPH_MIN_EDGE_WEIGHT if min_weight is None else min_weight
+        self.fan_in = fan_in or settings.FRAUD_GRAPH_FAN_IN
+        self.fan_out = fan_out or settings.FRAUD_GRAPH_FAN_OUT
+        self.max_degree = max_degree or settings.FRAUD_GRAPH_MAX_DEGREE
+        self.loaded = False
+        self._out = {}  # sender_id -> {receiver_id: TransferEdge}
+        self._in = {}  # receiver_id -> {sender_id: TransferEdge}
+        self._lock = threading.Lock()
+
+    def _record(self, transaction) -> None:
+        if transaction.type != TransactionType.TRANSFER or transaction.sender_id == transaction.receiver_id:
+            return
+        edge = self._out.setdefault(transaction.sender_id, {}).get(transaction.receiver_id)
+        if edge is None:
+            edge = TransferEdge()
+            self._out[transaction.sender_id][transaction.receiver_id] = edge
+            self._in.setdefault(transaction.receiver_id, {})[transaction.sender_id] = edge
+        edge.add(to_epoch(transaction.created_at), transaction.amount or 0.0, transaction.id, self.half_life)
+
+    def record(self, transaction) -> None:
+        """Add a committed transfer (ORM object or row) to the graph"""
+        with self._lock:
+            self._record(transaction)
+
+    def _prune(self, now: float) -> None:
+        """Forget transfers older than the window and edges left without any"""
+        cutoff = now - self.window.total_seconds()
+        for sender_id in list(self._out):
+            edges = self._out[sender_id]
+            for receiver_id in list(edges):
+                transactions = edges[receiver_id].transactions
+                while transactions and transactions[0][0] < cutoff:
+                    transactions.popleft()
+                if not transactions:
+                    del edges[receiver_id]
+                    del self._in[receiver_id][sender_id]
+                    if not self._in[receiver_id]:
+                        del self._in[receiver_id]
+            if not edges:
+                del self._out[sender_id]
+
+    def _active(self, edges: dict, now: float) -> dict:
+        return {
+            node: edge for node, edge in edges.items()
+            if edge.decayed(now, self.half_life) >= self.min_weight
+        }
+
+    def detect(self, now: datetime = None) -> dict:
+        """Map transaction id -> reason for transfers in cycles or around fan-in/fan-out hubs"""
+        now = to_epoch(now or datetime.utcnow())
+        findings = {}
+
+        def mark(edge, reason):
+            for _, transaction_id in edge.transactions:
+                findings.setdefault(transaction_id, reason)
+
+        with self._lock:
+            self._prune(now)
+            out = {node: self._active(edges, now) for node, edges in self._out.items()}
+            out = {node: edges for node, edges in out.items() if edges}
+
+            # Short cycles: for each edge u->v look for v->u and v->w->u
+            for u, edges in out.items():
+                for v, edge in edges.items():
+                    successors = out.get(v, {})
+                    if u in successors:
+                        mark(edge, CYCLE_REASON)
+                        mark(successors[u], CYCLE_REASON)
+                    if len(successors) > self.max_degree:
+                        continue
+                    for w, second in successors.items():
+                        if w == u:
+                            continue
+                        closing = out.get(w, {}).get(u)
+                        if closing is not None:
+                            for cycle_edge in (edge, second, closing):
+                                mark(cycle_edge, CYCLE_REASON)
+
+            # Hubs: many distinct counterparties within the window
+            for u, edges in out.items():
+                if len(edges) >= self.fan_out:
+                    for edge in edges.values():
+                        mark(edge, FAN_OUT_REASON)
+            for v, edges in self._in.items():
+                incoming = self._active(edges, now)
+                if len(incoming) >= self.fan_in:
+                    for edge in incoming.values():
+                        mark(edge, FAN_IN_REASON)
+
+        return findings
+
+    def rebuild(self, db: Session, now: datetime = None) -> None:
+        """Reload the graph from the transfers within the window"""
+        now = now or datetime.utcnow()
+        rows = db.query(
+            Transaction.id,
+            Transaction.sender_id,
+            Transaction.receiver_id,
+            Transaction.amount,
+            Transaction.type,
+            Transaction.created_at
+        ).filter(
+            Transaction.type == TransactionType.TRANSFER,
+            Transaction.created_at >= now - self.window
+        ).order_by(Transaction.created_at).all()
+
+        with self._lock:
+            self._out = {}
+            self._in = {}
+            for row in rows:
+                self._record(row)
+            self.loaded = True
+        logger.info(f"Transfer graph rebuilt from {len(rows)} transfers")
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.rebuild(db)
+
+
+# Shared graph for the API process
+transfer_graph = TransferGraph()
@@ -0,0 +1,149 @@
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from app.models.models import Transaction, TransactionStatus, TransactionType, UserTxSummary
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = ("sent_count", "sent_volume", "received_count", "received_volume")
+# Users per IN list when looking up which summary rows exist
+USER_CHUNK = 1000
+
+
+def _add(deltas: dict, key, offset: int, amount: float, created_at) -> None:
+    delta = deltas.setdefault(key, [0, 0.0, 0, 0.0, None])
+    delta[offset] += 1
+    delta[offset + 1] += amount or 0.0
+    if created_at is not None and (delta[4] is None or created_at > delta[4]):
+        delta[4] = created_at
+
+
+def summary_deltas(transactions) -> dict:
+    """(user_id, currency) -> [sent_count, sent_volume, received_count, received_volume, last_activity_at]"""
+    deltas = {}
+    for transaction in transactions:
+        if transaction.status != TransactionStatus.COMPLETED:
+            continue
+        if transaction.type != TransactionType.DEPOSIT:
+            _add(deltas, (transaction.sender_id, transaction.currency), 0, transaction.amount, transaction.created_at)
+        if transaction.type != TransactionType.WITHDRAWAL:
+            _add(deltas, (transaction.receiver_id, transaction.currency), 2, transaction.amount, transaction.created_at)
+    return deltas
+
+
+def apply_summary_deltas(db: Session, deltas: dict) -> None:
+    """
+    Add deltas to the summary rows in place: one lookup, one executemany
+    UPDATE ... SET count = count + :d and one INSERT for new rows, however
+    many transactions the deltas cover. The caller commits.
+    """
+    if not deltas:
+        return
+    table = UserTxSummary.__table__
+    user_ids = sorted({user_id for user_id, _ in deltas})
+    existing = set()
+    for start in range(0, len(user_ids), USER_CHUNK):
+        existing.update(db.execute(
+            select(table.c.user_id, table.c.currency).where(table.c.user_id.in_(user_ids[start:start + USER_CHUNK]))
+        ).all())
+
+    rows = [
+        {"b_user_id": user_id, "b_currency": currency, **dict(zip(SUMMARY_COLUMNS, delta)), "b_last": delta[4]}
+        for (user_id, currency), delta in sorted(deltas.items())
+    ]
+    updates = [row for row in rows if (row["b_user_id"], row["b_currency"]) in existing]
+    if updates:
+        last = bindparam("b_last")
+        db.execute(
+            update(table).where(
+                table.c.user_id == bindparam("b_user_id"),
+                table.c.currency == bindparam("b_currency")
+            ).values(
+                **{name: table.c[name] + bindparam(name) for name in SUMMARY_COLUMNS},
+                last_activity_at=case(
+                    (or_(table.c.last_activity_at.is_(None), table.c.last_activity_at < last), last),
+                    else_=table.c.last_activity_at
+                )
+            ),
+            updates
+        )
+    inserts = [row for row in rows if (row["b_user_id"], row["b_currency"]) not in existing]
+    if inserts:
+        db.execute(insert(table), [
+            {
+                "user_id": row["b_user_id"],
+                "currency": row["b_currency"],
+                **{name: row[name] for name in SUMMARY_COLUMNS},
+                "last_activity_at": row["b_last"]
+            }
+            for row in inserts
+        ])
+
+
+def record_summaries(db: Session, transactions) -> None:
+    """Fold transactions into their parties' summaries; called before they commit"""
+    apply_summary_deltas(db, summary_deltas(transactions))
+
+
+def revert_summaries(db: Session, transactions) -> None:
+    """Take completed transactions back out of their parties' summaries; last activity stays"""
+    deltas = {
+        key: [-count_or_volume for count_or_volume in delta[:4]] + [None]
+        for key, delta in summary_deltas(transactions).items()
+    }
+    apply_summary_deltas(db, deltas)
+
+
+def backfill_tx_summary(db: Session, chunk_size: int = 10000) -> int:
+    """
+    Rebuild the summaries from the transactions table, chunk_size ids at a time,
+    each chunk aggregated in the database and committed on its own.
+    Transactions committed after the start are left to the live updates.
+    """
+    db.query(UserTxSummary).delete(synchronize_session=False)
+    upto = db.query(func.max(Transaction.id)).scalar() or 0
+    db.commit()
+
+    for start in range(0, upto, chunk_size):
+        in_chunk = and_(
+            Transaction.id > start,
+            Transaction.id <= min(start + chunk_size, upto),
+            Transaction.status == TransactionStatus.COMPLETED
+        )
+        deltas = {}
+        for party, excluded, offset in (
+            (Transaction.sender_id, TransactionType.DEPOSIT, 0),
+            (Transaction.receiver_id, TransactionType.WITHDRAWAL, 2)
+        ):
+            for user_id, currency, count, volume, last in db.query(
+                party,
+                Transaction.currency,
+                func.count(Transaction.id),
+                func.sum(Transaction.amount),
+                func.max(Transaction.created_at)
+            ).filter(in_chunk, Transaction.type != excluded).group_by(party, Transaction.currency):
+                delta = deltas.setdefault((user_id, currency), [0, 0.0, 0, 0.0, None])
+                delta[offset], delta[offset + 1] = count, volume or 0.0
+                if delta[4] is None or last > delta[4]:
+                    delta[4] = last
+        apply_summary_deltas(db, deltas)
+        db.commit()
+        logger.info(f"Summarised transactions up to id {min(start + chunk_size, upto)} of {upto}")
+
+    return db.query(func.count()).select_from(UserTxSummary).scalar()
+
+
+if __name__ == "__main__":
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the per-user transaction summaries")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Transaction ids aggregated per commit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        backfill_tx_summary(db, chunk_size=args.chunk_size)
+    finally:
+        db.close()
@@ -0,0 +1,96 @@
+from itertools import groupby
+from typing import Iterator, Optional
+from sqlalchemy import and_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.models.models import CurrencyType, User, Wallet, WalletBalance, from_minor_units, to_minor_units
+from app.core.config import settings
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _users(currency: Optional[CurrencyType], min_balance: Optional[float]):
+    """Non-deleted users with a wallet, filtered on their balance in the database"""
+    statement = select(User.id.label("user_id"), User.email, Wallet.id.label("wallet_id")).join(
+        Wallet, Wallet.user_id == User.id
+    ).where(User.is_deleted == False)
+    if min_balance is not None:
+        statement = statement.join(WalletBalance, and_(
+            WalletBalance.wallet_id == Wallet.id,
+            WalletBalance.currency == currency,
+            WalletBalance.amount_minor >= to_minor_units(min_balance, currency, strict=False)
+        ))
+    return statement
+
+
+def _with_balances(users, currency: Optional[CurrencyType]):
+    """Join a users subquery to its balance rows, one row per user and currency"""
+    on = WalletBalance.wallet_id == users.c.wallet_id
+    if currency is not None:
+        on = and_(on, WalletBalance.currency == currency)
+    return select(users.c.user_id, users.c.email, WalletBalance.currency, WalletBalance.amount_minor).outerjoin(
+        WalletBalance, on
+    )
+
+
+def _items(rows, currency: Optional[CurrencyType]) -> Iterator[dict]:
+    """Fold consecutive rows of the same user into one item"""
+    currencies = [currency] if currency is not None else list(CurrencyType)
+    for (user_id, email), user_rows in groupby(rows, key=lambda row: (row.user_id, row.email)):
+        balances = {c.value: 0.0 for c in currencies}
+        for row in user_rows:
+            if row.currency is not None:
+                balances[row.currency.value] = from_minor_units(row.amount_minor, row.currency)
+        yield {"user_id": user_id, "email": email, "balances": balances}
+
+
+def balances_page(
+    db: Session,
+    limit: int,
+    before_user_id: Optional[int] = None,
+    currency: Optional[CurrencyType] = None,
+    min_balance: Optional[float] = None
+) -> list:
+    """
+    Up to limit users and their balances, newest first, from before_user_id on.
+    One query: the page of users is a keyset-limited subquery joined to its balance rows.
+    """
+    users = _users(currency, min_balance)
+    if before_user_id is not None:
+        users = users.where(User.id < before_user_id)
+    page = users.order_by(User.id.desc()).limit(limit).subquery()
+    rows = db.execute(_with_balances(page, currency).order_by(page.c.user_id.desc())).all()
+    return list(_items(rows, currency))
+
+
+def export_balances(
+    bind: Engine,
+    currency: Optional[CurrencyType] = None,
+    min_balance: Optional[float] = None,
+    batch_size: int = None
+) -> Iterator[str]:
+    """
+    Stream every matching user's balances as NDJSON, oldest user first.
+    Rows come off a server-side cursor batch_size at a time; like the
+    transaction export, the stream uses its own session.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    users = _users(currency, min_balance).subquery()
+    statement = _with_balances(users, currency).order_by(users.c.user_id)
+
+    exported = 0
+    with Session(bind=bind) as db:
+        rows = db.execute(statement.execution_options(yield_per=batch_size))
+        lines = []
+        for item in _items(rows, currency):
+            lines.append(json.dumps(item) + "\n")
+            if len(lines) >= batch_size:
+                exported += len(lines)
+                yield "".join(lines)
+                lines = []
+        if lines:
+            exported += len(lines)
+            yield "".join(lines)
+    logger.info(f"Exported balances of {exported} users")
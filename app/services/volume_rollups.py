@@ -0,0 +1,228 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from itertools import takewhile
+from typing import Optional
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+from app.db.session import SessionLocal
+from app.models.models import (
+    CurrencyType, Transaction, TransactionStatus, TransactionType, VolumeRollupDaily, VolumeRollupHourly,
+    from_minor_units, to_minor_units
+)
+from app.core.config import settings
+from app.services.checkpoints import advance_checkpoint, get_checkpoint
+from app.services.fraud_engine import to_epoch
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+VOLUME_ROLLUP_CHECKPOINT = "volume_rollups"
+ROLLUPS = {"hour": VolumeRollupHourly, "day": VolumeRollupDaily}
+ROLLUP_COLUMNS = ("tx_count", "volume_minor", "flagged_count")
+# Buckets per IN list when looking up which rollup rows exist
+BUCKET_CHUNK = 500
+BUCKET_WIDTH = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Range a series covers when none is given, and the most buckets it may span
+DEFAULT_SERIES_SPAN = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+MAX_SERIES_BUCKETS = 2000
+
+RollupRow = namedtuple("RollupRow", "id created_at currency type status amount is_flagged")
+
+
+def rollup_columns(table=Transaction.__table__) -> tuple:
+    """The transaction columns a RollupRow is made of, in order"""
+    return tuple(table.c[name] for name in RollupRow._fields)
+
+
+def rollup_row(transaction) -> RollupRow:
+    """A transaction's current state as the rollups see it"""
+    return RollupRow(*(getattr(transaction, name) for name in RollupRow._fields))
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """The start of the hour or (UTC) day a moment falls in"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+
+def rollup_deltas(rows, sign: int = 1, deltas: dict = None) -> dict:
+    """(granularity, bucket_start, currency, type, status) -> [tx_count, volume_minor, flagged_count]"""
+    deltas = {} if deltas is None else deltas
+    for row in rows:
+        volume = to_minor_units(row.amount, row.currency, strict=False)
+        for granularity in ROLLUPS:
+            key = (granularity, bucket_start(row.created_at, granularity), row.currency, row.type, row.status)
+            delta = deltas.setdefault(key, [0, 0, 0])
+            delta[0] += sign
+            delta[1] += sign * volume
+            delta[2] += sign if row.is_flagged else 0
+    return deltas
+
+
+def apply_rollup_deltas(db: Session, deltas: dict) -> None:
+    """
+    Add deltas to the rollup rows in place: per table, one lookup, one
+    executemany UPDATE ... SET count = count + :d and one INSERT for new
+    rows. The caller commits.
+    """
+    for granularity, model in ROLLUPS.items():
+        table = model.__table__
+        rows = {key[1:]: delta for key, delta in deltas.items() if key[0] == granularity and any(delta)}
+        if not rows:
+            continue
+        key_columns = (table.c.bucket_start, table.c.currency, table.c.type, table.c.status)
+        buckets = sorted({key[0] for key in rows})
+        existing = set()
+        for start in range(0, len(buckets), BUCKET_CHUNK):
+            existing.update(tuple(row) for row in db.execute(
+                select(*key_columns).where(table.c.bucket_start.in_(buckets[start:start + BUCKET_CHUNK]))
+            ))
+
+        params = [
+            {"b_bucket": bucket, "b_currency": currency, "b_type": type_, "b_status": status, **dict(zip(ROLLUP_COLUMNS, delta))}
+            for (bucket, currency, type_, status), delta in sorted(rows.items(), key=lambda item: item[0][0])
+        ]
+        updates = [row for row in params if (row["b_bucket"], row["b_currency"], row["b_type"], row["b_status"]) in existing]
+        if updates:
+            db.execute(
+                update(table).where(
+                    table.c.bucket_start == bindparam("b_bucket"),
+                    table.c.currency == bindparam("b_currency"),
+                    table.c.type == bindparam("b_type"),
+                    table.c.status == bindparam("b_status")
+                ).values(**{name: table.c[name] + bindparam(name) for name in ROLLUP_COLUMNS}),
+                updates
+            )
+        inserts = [row for row in params if (row["b_bucket"], row["b_currency"], row["b_type"], row["b_status"]) not in existing]
+        if inserts:
+            db.execute(insert(table), [
+                {
+                    "bucket_start": row["b_bucket"],
+                    "currency": row["b_currency"],
+                    "type": row["b_type"],
+                    "status": row["b_status"],
+                    **{name: row[name] for name in ROLLUP_COLUMNS}
+                }
+                for row in inserts
+            ])
+
+
+def record_rollup_changes(db: Session, before, after) -> None:
+    """
+    Move transactions the job has already rolled up from their old state
+    (before) to their new one (after), in the caller's commit; later ones
+    are left for the job, which reads them as they stand then.
+    Locks the job's checkpoint until the caller commits, so the job can't
+    read the old state meanwhile and then move past these rows.
+    """
+    if not before and not after:
+        return
+    mark = get_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT, for_update=True)
+    if mark is None:
+        return
+    rolled_up = lambda rows: [row for row in rows if row.id <= mark.last_transaction_id]
+    deltas = rollup_deltas(rolled_up(before), sign=-1)
+    apply_rollup_deltas(db, rollup_deltas(rolled_up(after), deltas=deltas))
+
+
+def roll_up_transactions(db: Session, chunk_size: int = 10000, settle: timedelta = None) -> int:
+    """
+    Fold transactions past the high-water mark into the hourly and daily
+    rollups, chunk_size at a time, each chunk committed together with the
+    mark. Returns how many were rolled up; the first run covers the whole table.
+
+    The job stops at the first transaction younger than settle, so one that
+    took a lower id but commits late isn't passed over.
+    """
+    settle = timedelta(seconds=settings.VOLUME_ROLLUP_SETTLE_SECONDS) if settle is None else settle
+    cutoff = to_epoch(datetime.utcnow() - settle)
+    if get_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT) is None:
+        # Committed up front, so writers changing old transactions see the job has started
+        advance_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT, 0)
+        db.commit()
+
+    rolled_up = 0
+    while True:
+        mark = get_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT, for_update=True)
+        fetched = db.execute(
+            select(*rollup_columns()).where(Transaction.id > mark.last_transaction_id).order_by(Transaction.id).limit(chunk_size)
+        ).all()
+        rows = list(takewhile(lambda row: to_epoch(row.created_at) < cutoff, map(RollupRow._make, fetched)))
+        if rows:
+            apply_rollup_deltas(db, rollup_deltas(rows))
+            advance_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT, rows[-1].id, rows[-1].created_at)
+        db.commit()
+        rolled_up += len(rows)
+        if len(fetched) < chunk_size or len(rows) < len(fetched):
+            return rolled_up
+
+
+def volume_series(
+    db: Session,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    currency: Optional[CurrencyType] = None,
+    type: Optional[TransactionType] = None,
+    status: Optional[TransactionStatus] = None
+) -> list:
+    """
+    Per bucket and currency totals over [start, end), from the rollups alone:
+    a primary key range read, however large the transactions table is.
+    """
+    model = ROLLUPS[granularity]
+    query = db.query(
+        model.bucket_start,
+        model.currency,
+        func.sum(model.tx_count),
+        func.sum(model.volume_minor),
+        func.sum(model.flagged_count)
+    ).filter(model.bucket_start >= bucket_start(start, granularity), model.bucket_start < end)
+    if currency is not None:
+        query = query.filter(model.currency == currency)
+    if type is not None:
+        query = query.filter(model.type == type)
+    if status is not None:
+        query = query.filter(model.status == status)
+    return [
+        {
+            "bucket_start": bucket,
+            "currency": bucket_currency.value,
+            "tx_count": count,
+            "volume": from_minor_units(volume, bucket_currency),
+            "flagged_count": flagged
+        }
+        for bucket, bucket_currency, count, volume, flagged in query.group_by(
+            model.bucket_start, model.currency
+        ).order_by(model.bucket_start, model.currency)
+    ]
+
+
+def rollup_volumes():
+    """Scheduled job: fold transactions committed since the last run into the volume rollups"""
+    db = SessionLocal()
+    try:
+        rolled_up = roll_up_transactions(db)
+        if rolled_up:
+            logger.info(f"Rolled up {rolled_up} transactions")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error rolling up transaction volumes: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new transactions into the hourly and daily volume rollups")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Transactions rolled up per commit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        logger.info(f"Rolled up {roll_up_transactions(db, chunk_size=args.chunk_size)} transactions")
+    finally:
+        db.close()
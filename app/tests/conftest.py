@@ -0,0 +1,104 @@
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api import deps
+from app.db.base_class import Base
+from app.db import session as db_session
+from app.db.session import make_engine
+from app.main import app
+from app.models.models import User, Wallet, Transaction, TransactionType, TransactionStatus, CurrencyType
+
+
+@pytest.fixture
+def engine(request, tmp_path):
+    """In-memory SQLite; parametrize indirectly with "file" for a database other processes can open"""
+    if getattr(request, "param", None) == "file":
+        engine = make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    else:
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def _make_user(email, balances=None):
+        user = User(email=email, hashed_password="x", full_name=email.split("@")[0])
+        db.add(user)
+        db.flush()
+        wallet_balances = {currency.value: 0.0 for currency in CurrencyType}
+        wallet_balances.update(balances or {})
+        db.add(Wallet(user_id=user.id, balances=wallet_balances))
+        db.commit()
+        return user
+    return _make_user
+
+
+@pytest.fixture
+def make_transaction(db):
+    def _make_transaction(sender, receiver, amount, type=TransactionType.TRANSFER,
+                          created_at=None, currency=CurrencyType.USD):
+        transaction = Transaction(
+            sender_id=sender.id,
+            receiver_id=receiver.id,
+            sender_wallet_id=sender.wallet.id,
+            receiver_wallet_id=receiver.wallet.id,
+            amount=amount,
+            currency=currency,
+            type=type,
+            status=TransactionStatus.COMPLETED,
+            created_at=created_at or datetime.utcnow()
+        )
+        db.add(transaction)
+        db.commit()
+        return transaction
+    return _make_transaction
+
+
+@pytest.fixture
+def client(db):
+    """API client on the test session; set client.user to the user making the requests"""
+    saved = dict(app.dependency_overrides)
+    test_client = TestClient(app)
+    test_client.user = None
+    app.dependency_overrides[db_session.get_db] = lambda: db
+    app.dependency_overrides[deps.get_db] = lambda: db
+    app.dependency_overrides[deps.get_current_user] = lambda: test_client.user
+    app.dependency_overrides[deps.get_current_admin_user] = lambda: test_client.user
+    yield test_client
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(saved)
+
+
+@pytest.fixture
+def client_session_per_request(client, engine):
+    """The API client with a fresh session per request, as in the app, so requests can run concurrently"""
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def session_per_request():
+        session = sessions()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[db_session.get_db] = session_per_request
+    app.dependency_overrides[deps.get_db] = session_per_request
+    return client
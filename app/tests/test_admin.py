@@ -0,0 +1,324 @@
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, func, select
+from app.api.api_v1.endpoints.admin import stats_cache
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.models import (
+    CurrencyType, LedgerEntry, Transaction, TransactionStatus, TransactionType, User, UserTxSummary, Wallet
+)
+from app.services.checkpoints import get_checkpoint
+from app.services.fraud_detection import flag_transactions
+from app.services.leaderboard import recompute_totals
+from app.services.system_counters import FLAGGED_TRANSACTIONS, TRANSACTIONS, read_counters, repair_counters, verify_counters
+from app.services.volume_rollups import (
+    ROLLUPS, VOLUME_ROLLUP_CHECKPOINT, RollupRow, roll_up_transactions, rollup_columns, rollup_deltas
+)
+
+
+def test_admin_stats_read_counters_kept_by_every_write_path(client, db, engine, make_user, make_transaction):
+    stats_cache.clear()
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    make_transaction(alice, bob, 2.5)
+    make_transaction(bob, alice, 7, currency=CurrencyType.EUR)
+    pending = make_transaction(bob, alice, 1000)
+    pending.status = TransactionStatus.PENDING
+    db.commit()
+
+    # Rows written around the counters show up as drift until repaired
+    assert verify_counters(db)[TRANSACTIONS] == (0, 3)
+    repair_counters(db)
+    assert verify_counters(db) == {}
+
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+    client.post(url, json={"amount": 100, "currency": "USD", "type": "DEPOSIT"})
+    transfer = client.post(url, json={"amount": 10, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}).json()
+    client.post(f"{settings.API_V1_STR}/auth/register", json={"email": "carol@example.com", "password": "pw", "full_name": "carol"})
+
+    assert flag_transactions(db, {transfer["id"]: "test", pending.id: "test"}) == 2
+    assert flag_transactions(db, {transfer["id"]: "again"}) == 0
+    db.commit()
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    stats = client.get(f"{settings.API_V1_STR}/admin/stats").json()
+    event.remove(engine, "before_cursor_execute", count)
+    # An O(1) read, nothing scans the base tables
+    assert not any(re.search(r"\bFROM (transactions|users|wallets)\b", statement) for statement in statements[1:])
+    assert stats["total_users"] == 3 and stats["active_wallets"] == 3
+    assert stats["total_transactions"] == 5 and stats["flagged_transactions"] == 2
+    assert stats["total_volume"]["USD"] == 112.5 and stats["total_volume"]["EUR"] == 7.0
+
+    # Rejecting a completed transfer moves the funds back and takes it out of the totals
+    review = f"{settings.API_V1_STR}/admin/transactions/{{}}/review"
+    assert client.post(review.format(transfer["id"]), params={"action": "reject"}).status_code == 200
+    assert client.post(review.format(transfer["id"]), params={"action": "reject"}).status_code == 400
+    # Approving the pending transfer would move funds bob doesn't have; it stays flagged
+    assert client.post(review.format(pending.id), params={"action": "approve"}).status_code == 400
+    stats_cache.clear()
+    stats = client.get(f"{settings.API_V1_STR}/admin/stats").json()
+    assert stats["flagged_transactions"] == 1 and stats["total_volume"]["USD"] == 102.5
+
+    db.expire_all()
+    assert alice.wallet.balances["USD"] == 100 and bob.wallet.balances["USD"] == 0
+    cancelled = db.get(Transaction, transfer["id"])
+    assert cancelled.status == TransactionStatus.CANCELLED and cancelled.flag_reason == "test"
+    assert db.query(func.sum(LedgerEntry.amount_minor)).filter(LedgerEntry.wallet_id == bob.wallet.id).scalar() == 0
+    assert verify_counters(db) == {}
+
+
+def test_review_moves_funds_of_approved_and_rejected_transactions(client, db, make_user, make_transaction):
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    bob = make_user("bob@example.com")
+    pending = make_transaction(alice, bob, 30)
+    pending.status = TransactionStatus.PENDING
+    db.commit()
+    repair_counters(db)
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+    spent = client.post(url, json={"amount": 20, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}).json()
+    assert flag_transactions(db, {pending.id: "test", spent["id"]: "test"}) == 2
+    db.commit()
+
+    # Approving completes the pending transfer: its funds move and it joins the totals
+    review = f"{settings.API_V1_STR}/admin/transactions/{{}}/review"
+    assert client.post(review.format(pending.id), params={"action": "approve"}).status_code == 200
+    db.expire_all()
+    assert alice.wallet.balances["USD"] == 50 and bob.wallet.balances["USD"] == 50
+    assert db.get(Transaction, pending.id).status == TransactionStatus.COMPLETED
+    assert db.query(func.sum(LedgerEntry.amount_minor)).filter(LedgerEntry.wallet_id == bob.wallet.id).scalar() == 5000
+
+    # Once bob has spent the transfer, rejecting it can't move the funds back
+    client.user = bob
+    client.post(url, json={"amount": 40, "currency": "USD", "type": "WITHDRAWAL"})
+    rejected = client.post(review.format(spent["id"]), params={"action": "reject"})
+    assert rejected.status_code == 400 and rejected.json()["detail"].startswith("Cannot reject transaction")
+    db.expire_all()
+    assert db.get(Transaction, spent["id"]).is_flagged
+    assert verify_counters(db) == {}
+
+
+def test_admin_transaction_updates_keep_counters_and_ledger(client, db, make_user):
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    bob = make_user("bob@example.com")
+    repair_counters(db)
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+    transfer = client.post(url, json={"amount": 30, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}).json()
+    summaries = lambda: {
+        (row.user_id, row.currency): (row.sent_count, row.sent_volume, row.received_count, row.received_volume)
+        for row in db.query(UserTxSummary) if row.sent_count or row.received_count
+    }
+    update = f"{url}admin/{transfer['id']}"
+    assert len(summaries()) == 2
+    assert roll_up_transactions(db, settle=timedelta(0)) == 1
+
+    # Flagging and clearing by hand move the flagged counter like scans and reviews do
+    flagged = client.put(update, json={"is_flagged": True, "flag_reason": "manual"})
+    assert flagged.status_code == 200 and flagged.json()["flag_reason"] == "manual"
+    assert client.put(update, json={"is_flagged": True}).status_code == 200
+    assert read_counters(db)[FLAGGED_TRANSACTIONS] == 1
+    assert client.put(update, json={"is_flagged": False}).status_code == 200
+    assert read_counters(db)[FLAGGED_TRANSACTIONS] == 0
+
+    # Cancelling moves the funds back and takes the transfer out of every derived total
+    cancelled = client.put(update, json={"status": "CANCELLED"})
+    assert cancelled.status_code == 200 and cancelled.json()["status"] == "CANCELLED"
+    assert client.put(update, json={"status": "COMPLETED"}).status_code == 422
+    assert client.put(update, json={"status": "FAILED"}).json()["status"] == "FAILED"
+
+    db.expire_all()
+    assert alice.wallet.balances["USD"] == 100 and bob.wallet.balances["USD"] == 0
+    assert db.query(func.sum(LedgerEntry.amount_minor)).filter(LedgerEntry.wallet_id == bob.wallet.id).scalar() == 0
+    assert verify_counters(db) == {}
+    assert summaries() == {}
+    for granularity in ROLLUPS:
+        assert _stored_rollups(db, granularity) == _raw_rollups(db, granularity)
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = TTLCache(maxsize=1, ttl=60)
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"total": 42}
+
+    def request(_):
+        start.wait()
+        return cache.get_or_compute("stats", compute)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(request, range(8)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_user_balances_page_in_one_query_and_stream(client, db, engine, make_user):
+    users = [make_user(f"user{i}@example.com", balances={"USD": 10.0 * i, "EUR": 1.5}) for i in range(7)]
+    users[3].is_deleted = True
+    db.add(User(email="nowallet@example.com", hashed_password="x", full_name="nowallet"))
+    db.commit()
+    client.user = users[0]
+    url = f"{settings.API_V1_STR}/admin/user-balances"
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    items, cursor, pages = [], None, 0
+    while True:
+        statements.clear()
+        response = client.get(url, params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        # One joined query per page however many users it holds
+        assert len(statements) == 1
+        page = response.json()
+        items += page["items"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    event.remove(engine, "before_cursor_execute", count)
+
+    assert pages == 3
+    assert [item["email"] for item in items] == [f"user{i}@example.com" for i in (6, 5, 4, 2, 1, 0)]
+    assert items[0]["balances"] == {**{currency.value: 0.0 for currency in CurrencyType}, "USD": 60.0, "EUR": 1.5}
+
+    rich = client.get(url, params={"currency": "USD", "min_balance": 40}).json()["items"]
+    assert [(item["email"], item["balances"]) for item in rich] == [
+        ("user6@example.com", {"USD": 60.0}), ("user5@example.com", {"USD": 50.0}), ("user4@example.com", {"USD": 40.0})
+    ]
+    assert client.get(url, params={"min_balance": 40}).status_code == 422
+
+    response = client.get(url, params={"stream": "true", "currency": "EUR"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["user_id"] for item in streamed] == sorted(item["user_id"] for item in items)
+    assert all(item["balances"] == {"EUR": 1.5} for item in streamed)
+
+
+def test_balance_leaderboard_reads_maintained_totals(client, db, engine, make_user):
+    alice = make_user("alice@example.com", balances={"USD": 10.0, "EUR": 100.0})  # 118.00 USD
+    bob = make_user("bob@example.com", balances={"USD": 50.0, "JPY": 10000})  # 117.00 USD
+    carol = make_user("carol@example.com", balances={"USD": 60.0, "BONUS": 1000.0})  # 60.00 USD
+    make_user("dave@example.com", balances={"USD": 500.0}).is_deleted = True
+    db.commit()
+
+    client.user = alice
+    url = f"{settings.API_V1_STR}/admin/top-users"
+    leaders = lambda **params: [
+        (user["email"], user["total_balance"]) for user in client.get(url, params={"limit": 2, **params}).json()
+    ]
+    assert leaders() == [("alice@example.com", 118.0), ("bob@example.com", 117.0)]
+
+    # Every balance change moves the total with it
+    client.user = carol
+    transactions = f"{settings.API_V1_STR}/transactions/"
+    client.post(transactions, json={"amount": 100, "currency": "EUR", "type": "DEPOSIT"})
+    client.post(transactions, json={"amount": 20, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"})
+    assert leaders() == [("carol@example.com", 148.0), ("bob@example.com", 137.0)]
+    assert leaders(currency="USD") == [("bob@example.com", 70.0), ("carol@example.com", 40.0)]
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    assert leaders(currencies="usd,eur") == [("carol@example.com", 148.0), ("alice@example.com", 118.0)]
+    event.remove(engine, "before_cursor_execute", count)
+    # The streamed top-k runs one pass over the balances and one lookup for the leaders' emails
+    assert len(statements) == 2
+    assert client.get(url, params={"currencies": "USD,XYZ"}).status_code == 422
+
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM wallets ORDER BY total_balance_minor DESC LIMIT 2"
+        )]
+        assert any("ix_wallets_total_balance_minor" in step for step in plan), plan
+
+    # A rate change is applied to every stored total by the recompute
+    expected = {wallet.id: wallet.total_balance_minor for wallet in db.query(Wallet)}
+    db.query(Wallet).update({Wallet.total_balance_minor: 0})
+    db.commit()
+    assert recompute_totals(db, chunk_size=2) == len(expected)
+    db.expire_all()
+    assert {wallet.id: wallet.total_balance_minor for wallet in db.query(Wallet)} == expected
+    assert recompute_totals(db) == 0
+
+
+def _raw_rollups(db, granularity):
+    """What the rollups should hold, grouped from the raw transactions"""
+    return {
+        key: tuple(delta)
+        for key, delta in rollup_deltas(map(RollupRow._make, db.execute(select(*rollup_columns())))).items()
+        if key[0] == granularity
+    }
+
+
+def _stored_rollups(db, granularity):
+    model = ROLLUPS[granularity]
+    return {
+        (granularity, row.bucket_start, row.currency, row.type, row.status): (row.tx_count, row.volume_minor, row.flagged_count)
+        for row in db.query(model) if row.tx_count
+    }
+
+
+def test_volume_series_served_from_rollups_kept_by_the_job(client, db, engine, make_user, make_transaction):
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    bob = make_user("bob@example.com", balances={"USD": 100.0})
+    day = datetime(2026, 10, 5, 22, 0)
+    make_transaction(alice, bob, 10, created_at=day + timedelta(minutes=5))
+    make_transaction(alice, bob, 2.5, created_at=day + timedelta(minutes=50))
+    make_transaction(bob, alice, 7, currency=CurrencyType.EUR, created_at=day + timedelta(minutes=55))
+    rejected = make_transaction(alice, bob, 20, created_at=day + timedelta(hours=1, minutes=30))
+    make_transaction(bob, bob, 40, type=TransactionType.DEPOSIT, created_at=day + timedelta(hours=2, minutes=1))
+    make_transaction(alice, alice, 1, type=TransactionType.WITHDRAWAL, created_at=datetime.utcnow())
+
+    # Chunks of two commit as they go; the newest transaction waits out the settle window
+    assert roll_up_transactions(db, chunk_size=2) == 5
+    assert get_checkpoint(db, VOLUME_ROLLUP_CHECKPOINT).last_transaction_id == rejected.id + 1
+    assert roll_up_transactions(db, chunk_size=2, settle=timedelta(0)) == 1
+    assert roll_up_transactions(db) == 0
+
+    # Changes to rolled-up transactions land in the same commit, without the job
+    assert flag_transactions(db, {rejected.id: "test"}) == 1
+    db.commit()
+    client.user = alice
+    review = f"{settings.API_V1_STR}/admin/transactions/{rejected.id}/review"
+    assert client.post(review, params={"action": "reject"}).status_code == 200
+    db.expire_all()
+    for granularity in ROLLUPS:
+        assert _stored_rollups(db, granularity) == _raw_rollups(db, granularity)
+
+    url = f"{settings.API_V1_STR}/admin/volume-series"
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    series = client.get(url, params={"start": "2026-10-05T22:00:00Z", "end": "2026-10-06T01:00:00Z"}).json()
+    event.remove(engine, "before_cursor_execute", count)
+    # Whatever the size of the transactions table, nothing reads it
+    assert not any(re.search(r"\bFROM transactions\b", statement) for statement in statements)
+    assert series["granularity"] == "hour"
+    assert [(point["bucket_start"], point["currency"], point["tx_count"], point["volume"]) for point in series["points"]] == [
+        ("2026-10-05T22:00:00", "EUR", 1, 7.0),
+        ("2026-10-05T22:00:00", "USD", 2, 12.5),
+        ("2026-10-05T23:00:00", "USD", 1, 20.0),
+        ("2026-10-06T00:00:00", "USD", 1, 40.0),
+    ]
+
+    completed = client.get(url, params={
+        "granularity": "day", "start": "2026-10-05T00:00:00", "end": "2026-10-07T00:00:00",
+        "currency": "USD", "status": "COMPLETED"
+    }).json()["points"]
+    assert [(point["bucket_start"], point["tx_count"], point["volume"]) for point in completed] == [
+        ("2026-10-05T00:00:00", 2, 12.5), ("2026-10-06T00:00:00", 1, 40.0)
+    ]
+    assert client.get(url, params={"granularity": "week"}).status_code == 422
+    assert client.get(url, params={"start": "2026-01-01T00:00:00", "end": "2026-10-01T00:00:00"}).status_code == 422
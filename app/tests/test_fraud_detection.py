@@ -0,0 +1,383 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.orm import sessionmaker
+from app.benchmarks.fraud_replay import SyntheticTraffic, run_benchmark
+from app.core.config import settings
+from app.models.models import CurrencyType, Transaction, TransactionType, UserAmountStats
+from app.services import fraud_detection
+from app.services.amount_stats import amount_zscore, rebuild_amount_stats, record_amount
+from app.services.checkpoints import get_checkpoint
+from app.services.fraud_detection import FraudDetectionService, FRAUD_SCAN_CHECKPOINT, ScanRow, flag_transactions
+from app.services.fraud_engine import SlidingWindowFraudEngine
+from app.services.fraud_queue import FraudCheckQueue
+from app.services.fraud_rules import FraudRule, RuleSet, compile_rules, daily_rules, default_rules
+from app.services.fraud_vectorized import window_totals
+from app.services.transfer_graph import TransferGraph, CYCLE_REASON, FAN_IN_REASON
+
+
+def test_engine_counts_recent_transfers_only(db, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    now = datetime.utcnow()
+    make_transaction(alice, bob, 10, created_at=now - timedelta(minutes=10))
+    for minutes in (4, 3, 1):
+        make_transaction(alice, bob, 10, created_at=now - timedelta(minutes=minutes))
+
+    engine = SlidingWindowFraudEngine()
+    engine.rebuild(db, now=now)
+    transfers = engine.rules.spec_index("rapid_transfers")
+    volume = engine.rules.spec_index("rapid_volume")
+
+    assert engine.aggregate(transfers, alice.id, now) == 3
+    assert engine.aggregate(transfers, bob.id, now) == 0
+    # Volume counts both sides of a transfer
+    assert engine.aggregate(volume, alice.id, now) == 40
+    assert engine.aggregate(volume, bob.id, now) == 40
+    assert engine.aggregate(transfers, alice.id, now + timedelta(minutes=5)) == 0
+
+
+def test_check_transaction_uses_engine_state(db, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    engine = SlidingWindowFraudEngine()
+    engine.rebuild(db)
+    service = FraudDetectionService(db, engine=engine)
+
+    deposit = make_transaction(alice, alice, 1500, type=TransactionType.DEPOSIT)
+    engine.record(deposit)
+    assert service.check_transaction(deposit) == (False, "")
+
+    withdrawal = make_transaction(alice, alice, 1200, type=TransactionType.WITHDRAWAL)
+    engine.record(withdrawal)
+    assert service.check_transaction(withdrawal) == (True, "Large withdrawal amount")
+
+    transfer = make_transaction(bob, alice, 20)
+    engine.record(transfer)
+    # Bob's volume stays low, Alice's includes what she received
+    assert service.check_transaction(transfer) == (False, "")
+    assert engine.aggregate(engine.rules.spec_index("rapid_volume"), alice.id) == 2720
+
+    for _ in range(2):
+        transfer = make_transaction(bob, alice, 20)
+        engine.record(transfer)
+    assert service.check_transaction(transfer) == (True, "Multiple transfers in short period")
+
+
+def _seed_scan_window(make_user, make_transaction):
+    users = [make_user(f"user{i}@example.com") for i in range(4)]
+    now = datetime.utcnow()
+    make_transaction(users[2], users[0], 600, created_at=now - timedelta(hours=3))
+    for minutes in (30, 4, 2, 1):
+        make_transaction(users[0], users[1], 50, created_at=now - timedelta(minutes=minutes))
+    make_transaction(users[2], users[2], 1500, type=TransactionType.WITHDRAWAL, created_at=now - timedelta(minutes=20))
+    make_transaction(users[3], users[3], 1900, type=TransactionType.DEPOSIT, created_at=now - timedelta(minutes=50))
+    make_transaction(users[1], users[3], 200, created_at=now - timedelta(minutes=10))
+    make_transaction(users[3], users[1], 10, created_at=now - timedelta(hours=2))
+    return users
+
+
+def test_sweep_scan_matches_serial_scan(db, make_user, make_transaction):
+    _seed_scan_window(make_user, make_transaction)
+    engine = SlidingWindowFraudEngine()
+    engine.rebuild(db)
+    service = FraudDetectionService(db, engine=engine)
+
+    serial = service.scan_recent_transactions(engine="serial")
+    sweep = service.scan_recent_transactions(engine="sweep")
+
+    assert serial == sweep
+    assert {item["reason"] for item in sweep} == {
+        "Multiple transfers in short period",
+        "Large transfer amount",
+        "Large withdrawal amount",
+        "Rapid balance changes detected",
+    }
+    flagged = {t.id for t in db.query(Transaction).filter(Transaction.is_flagged == True)}
+    assert flagged == {item["transaction_id"] for item in sweep}
+
+
+def test_incremental_scan_only_judges_new_rows(db, make_user, make_transaction):
+    users = _seed_scan_window(make_user, make_transaction)
+    engine = SlidingWindowFraudEngine()
+    service = FraudDetectionService(db, engine=engine)
+
+    first = service.scan_new_transactions(settle=timedelta(0))
+    assert first == service.scan_recent_transactions()
+    checkpoint = get_checkpoint(db, FRAUD_SCAN_CHECKPOINT)
+    assert checkpoint.last_transaction_id == db.query(func.max(Transaction.id)).scalar()
+
+    assert service.scan_new_transactions(settle=timedelta(0)) == []
+
+    # A new transfer is judged with the hour of context before it
+    transfer = make_transaction(users[0], users[2], 5)
+    second = service.scan_new_transactions(settle=timedelta(0))
+    assert [item["transaction_id"] for item in second] == [transfer.id]
+    assert second[0]["reason"] == "Multiple transfers in short period"
+    assert get_checkpoint(db, FRAUD_SCAN_CHECKPOINT).last_transaction_id == transfer.id
+
+
+@pytest.mark.parametrize("engine_name", ["serial", "sweep", "vectorized"])
+def test_incremental_scan_waits_for_rows_to_settle(db, make_user, make_transaction, engine_name):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    now = datetime.utcnow()
+    settled = make_transaction(alice, bob, 10, created_at=now - timedelta(minutes=30))
+    # Took its id before the next row but is still inside the settle window, as if its commit were late
+    late = make_transaction(alice, bob, settings.FRAUD_LARGE_TRANSFER_AMOUNT + 1, created_at=now)
+    after = make_transaction(alice, bob, 10, created_at=now - timedelta(minutes=20))
+    service = FraudDetectionService(db, engine=SlidingWindowFraudEngine())
+
+    assert service.scan_new_transactions(engine=engine_name) == []
+    assert get_checkpoint(db, FRAUD_SCAN_CHECKPOINT).last_transaction_id == settled.id
+
+    flagged = service.scan_new_transactions(engine=engine_name, settle=timedelta(0))
+    assert [item["transaction_id"] for item in flagged] == [late.id]
+    assert get_checkpoint(db, FRAUD_SCAN_CHECKPOINT).last_transaction_id == after.id
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_parallel_scan_matches_sweep_scan(db, make_user, make_transaction, monkeypatch):
+    users = _seed_scan_window(make_user, make_transaction)
+    # Receivers in other partitions still count towards a sender's volume
+    for i in range(6):
+        make_transaction(users[i % 4], users[(i + 1) % 4], 90 * (i + 1))
+    monkeypatch.setattr(settings, "FRAUD_SCAN_WORKERS", 3)
+    service = FraudDetectionService(db, engine=SlidingWindowFraudEngine())
+
+    sweep = service.scan_recent_transactions(engine="sweep")
+    parallel = service.scan_recent_transactions(engine="parallel")
+
+    assert sweep and parallel == sweep
+
+
+def test_vectorized_scan_matches_sweep_scan(db, make_user, make_transaction):
+    users = _seed_scan_window(make_user, make_transaction)
+    make_transaction(users[1], users[0], 1800)
+    service = FraudDetectionService(db, engine=SlidingWindowFraudEngine())
+
+    sweep = service.scan_recent_transactions(engine="sweep")
+    vectorized = service.scan_recent_transactions(engine="vectorized")
+
+    assert sweep and vectorized == sweep
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_every_engine_scores_unusual_amounts(db, make_user, make_transaction, monkeypatch):
+    users = _seed_scan_window(make_user, make_transaction)
+    alice = users[0]
+    start = datetime.utcnow() - timedelta(days=3)
+    for i, amount in enumerate([20, 22, 19, 21, 20, 23, 18, 20, 22, 19, 21]):
+        record_amount(db, make_transaction(alice, alice, amount, type=TransactionType.DEPOSIT, created_at=start + timedelta(hours=5 * i)))
+    outlier = make_transaction(alice, alice, 300, type=TransactionType.DEPOSIT, created_at=datetime.utcnow() - timedelta(hours=5))
+    usual = make_transaction(alice, alice, 21, type=TransactionType.DEPOSIT, created_at=datetime.utcnow() - timedelta(hours=4))
+    for transaction in (outlier, usual):
+        record_amount(db, transaction)
+    db.commit()
+    monkeypatch.setattr(settings, "FRAUD_SCAN_WORKERS", 2)
+    engine = SlidingWindowFraudEngine()
+    engine.rebuild(db)
+    service = FraudDetectionService(db, engine=engine)
+
+    results = {name: service.scan_recent_transactions(engine=name) for name in ("serial", "sweep", "parallel", "vectorized")}
+    assert all(result == results["serial"] for result in results.values())
+    reasons = {item["transaction_id"]: item["reason"] for item in results["serial"]}
+    assert reasons[outlier.id] == "Unusual amount for this user" and usual.id not in reasons
+
+
+def test_window_totals_per_query_windows():
+    keys = np.array([7, 3, 7, 7, 3])
+    ts = np.array([10, 20, 30, 40, 50])
+    values = np.array([1.0, 2.0, 4.0, 8.0, 16.0])
+
+    totals = window_totals(keys, ts, values, [7, 7, 3, 9], starts=[0, 25, 20, 0], ends=[35, 40, 45, 99])
+
+    assert totals.tolist() == [5.0, 12.0, 2.0, 0.0]
+
+
+def test_rules_sharing_a_window_share_one_query(db, engine, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    for amount in (300, 400, 500):
+        make_transaction(alice, bob, amount)
+
+    hour = timedelta(hours=1)
+    rules = RuleSet([
+        FraudRule("busy", "Busy sender", 2, aggregate="count", window=hour),
+        FraudRule("big_volume", "Big volume", 1000, aggregate="sum", window=hour, scope="party"),
+        FraudRule("big_receiver_volume", "Big volume again", 5000, aggregate="sum", window=hour, scope="party"),
+    ])
+    assert len(rules.specs) == 2 and list(rules.windows) == [hour]
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    aggregates = rules.aggregate_queries(db, datetime.utcnow())
+
+    assert len(statements) == 1
+    assert aggregates[rules.spec_index("busy")] == {alice.id: 3}
+    assert aggregates[rules.spec_index("big_volume")] == {alice.id: 1200, bob.id: 1200}
+
+
+def test_default_rules_read_settings(monkeypatch):
+    monkeypatch.setattr(settings, "FRAUD_LARGE_TRANSFER_AMOUNT", 50.0)
+    monkeypatch.setattr(settings, "SUSPICIOUS_TRANSACTION_THRESHOLD", 75.0)
+    rules = compile_rules(default_rules() + daily_rules())
+    transfer = ScanRow(1, 1, 2, 60.0, TransactionType.TRANSFER, datetime.utcnow())
+    deposit = ScanRow(2, 1, 1, 80.0, TransactionType.DEPOSIT, datetime.utcnow())
+
+    assert rules.evaluate(transfer, [0] * len(rules.specs)) == "Large transfer amount"
+    assert rules.evaluate(deposit, [0] * len(rules.specs)) == "Suspicious transaction amount"
+    # The daily rules stay out of the inline set and the engine's window
+    inline = compile_rules()
+    assert inline.evaluate(deposit, [0] * len(inline.specs)) == ""
+    assert inline.lookback == timedelta(minutes=settings.FRAUD_VOLUME_WINDOW_MINUTES)
+
+
+def test_daily_rules_only_in_the_scheduled_scan(db, engine, make_user, make_transaction, monkeypatch):
+    alice = make_user("alice@example.com")
+    now = datetime.utcnow()
+    deposits = [
+        make_transaction(alice, alice, 5, type=TransactionType.DEPOSIT, created_at=now - timedelta(hours=20 - i))
+        for i in range(settings.FRAUD_MAX_DAILY_TRANSACTIONS + 1)
+    ]
+    service = FraudDetectionService(db, engine=SlidingWindowFraudEngine())
+    assert service.scan_recent_transactions() == []
+    assert service.check_transaction(deposits[-1]) == (False, "")
+
+    monkeypatch.setattr(fraud_detection, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(FraudDetectionService, "_scan_transfer_graph", lambda self: [])
+    fraud_detection.scan_for_fraud()
+    db.expire_all()
+    assert {tx.flag_reason for tx in deposits} == {"Too many transactions in a day"}
+
+    # Failures reach the scheduler instead of being logged away
+    def fail(self):
+        raise RuntimeError("graph unavailable")
+    monkeypatch.setattr(FraudDetectionService, "_scan_transfer_graph", fail)
+    with pytest.raises(RuntimeError):
+        fraud_detection.scan_for_fraud()
+
+
+def test_fraud_queue_flags_in_background(engine, db, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    fraud_engine = SlidingWindowFraudEngine()
+    fraud_engine.rebuild(db)
+    checks = FraudCheckQueue(
+        session_factory=sessionmaker(bind=engine),
+        engine=fraud_engine,
+        workers=1,
+        batch_wait=0.01
+    )
+    withdrawal = make_transaction(alice, alice, 5000, type=TransactionType.WITHDRAWAL)
+    deposit = make_transaction(bob, bob, 10, type=TransactionType.DEPOSIT)
+    assert not checks.submit(withdrawal.id)
+
+    checks.start()
+    try:
+        for transaction in (withdrawal, deposit):
+            fraud_engine.record(transaction)
+            assert checks.submit(transaction.id)
+        checks._queue.join()
+    finally:
+        checks.stop()
+
+    db.expire_all()
+    assert withdrawal.is_flagged and withdrawal.flag_reason == "Large withdrawal amount"
+    assert not deposit.is_flagged
+    stats = checks.stats()
+    assert stats["processed"] == 2 and stats["flagged"] == 1 and stats["depth"] == 0
+
+
+def test_transfer_graph_flags_cycles_and_fan_in(db, make_user, make_transaction):
+    users = [make_user(f"user{i}@example.com") for i in range(7)]
+    a, b, c, hub = users[:4]
+    now = datetime.utcnow()
+    cycle = [
+        make_transaction(a, b, 100, created_at=now - timedelta(minutes=30)),
+        make_transaction(b, c, 100, created_at=now - timedelta(minutes=20)),
+        make_transaction(c, a, 100, created_at=now - timedelta(minutes=10)),
+    ]
+    mules = [make_transaction(sender, hub, 100, created_at=now - timedelta(hours=2)) for sender in users[4:]]
+    # Below the edge weight floor, and outside the window
+    small = make_transaction(hub, users[4], 1)
+    stale = make_transaction(b, a, 100, created_at=now - timedelta(days=2))
+    # Already flagged transfers keep their reason
+    mules[0].is_flagged, mules[0].flag_reason = True, "Large transfer amount"
+    db.commit()
+
+    graph = TransferGraph(window=timedelta(hours=24), min_weight=50.0, fan_in=3, fan_out=3)
+    graph.rebuild(db, now=now)
+    findings = graph.detect(now)
+    assert {tx.id: findings.get(tx.id) for tx in cycle} == {tx.id: CYCLE_REASON for tx in cycle}
+    assert all(findings[tx.id] == FAN_IN_REASON for tx in mules)
+    assert small.id not in findings and stale.id not in findings
+
+    flagged = FraudDetectionService(db, graph=graph).scan_transfer_graph()
+    assert {item["transaction_id"] for item in flagged} == {tx.id for tx in cycle + mules[1:]}
+    db.expire_all()
+    assert mules[0].flag_reason == "Large transfer amount"
+    assert cycle[0].is_flagged and cycle[0].flag_reason == CYCLE_REASON
+
+    # An admin approval sticks, though the transfer stays in the graph
+    cycle[0].is_flagged, cycle[0].reviewed_at = False, now
+    db.commit()
+    assert FraudDetectionService(db, graph=graph).scan_transfer_graph() == []
+    assert flag_transactions(db, {cycle[0].id: CYCLE_REASON}) == 0
+    db.expire_all()
+    assert not cycle[0].is_flagged
+
+    # Edges decay below the weight floor well before they leave the window
+    graph.half_life = timedelta(hours=1).total_seconds()
+    assert graph.detect(now + timedelta(hours=20)) == {}
+
+
+def test_amount_stats_match_rebuild_and_score_outliers(db, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    amounts = [20, 22, 19, 21, 20, 23, 18, 20, 22, 19, 21]
+    start = datetime.utcnow() - timedelta(days=3)
+    transactions = [
+        make_transaction(alice, alice, amount, type=TransactionType.DEPOSIT, created_at=start + timedelta(hours=6 * i))
+        for i, amount in enumerate(amounts)
+    ]
+    for transaction in transactions:
+        record_amount(db, transaction)
+    db.commit()
+    stats = db.get(UserAmountStats, (alice.id, CurrencyType.USD))
+    live = (stats.count, stats.mean, stats.m2)
+    assert live[0] == len(amounts) and live[1] == pytest.approx(np.mean(amounts))
+    assert live[2] == pytest.approx(np.var(amounts) * len(amounts))
+
+    assert rebuild_amount_stats(db, batch_size=4) == 1
+    db.expire_all()
+    stats = db.get(UserAmountStats, (alice.id, CurrencyType.USD))
+    assert (stats.count, stats.mean, stats.m2) == pytest.approx(live)
+
+    outlier = make_transaction(alice, alice, 300, type=TransactionType.DEPOSIT)
+    record_amount(db, outlier)
+    db.commit()
+    # Leave-one-out: the outlier does not dilute its own score
+    assert amount_zscore(stats, 300) == pytest.approx((300 - np.mean(amounts)) / np.std(amounts, ddof=1))
+    assert db.get(UserAmountStats, (bob.id, CurrencyType.USD)) is None
+    assert amount_zscore(None, 300) is None
+
+    engine = SlidingWindowFraudEngine()
+    engine.rebuild(db)
+    service = FraudDetectionService(db, engine=engine)
+    assert service.check_transaction(outlier) == (True, "Unusual amount for this user")
+    assert service.check_transaction(transactions[0]) == (False, "")
+
+
+def test_replay_benchmark_scores_engines_against_labels(tmp_path):
+    traffic = SyntheticTraffic(users=200, transactions=1000, fraud_rate=0.05, seed=1)
+    results = run_benchmark(traffic, engines=["sweep", "vectorized", "inline", "graph"], workdir=str(tmp_path))
+
+    by_engine = {result["engine"]: result for result in results}
+    assert by_engine["sweep"]["flagged"] == by_engine["vectorized"]["flagged"]
+    assert by_engine["sweep"]["statements"] < by_engine["inline"]["statements"]
+    assert by_engine["inline"]["latency_unit"] == "check"
+    assert by_engine["graph"]["precision"] > 0.5
+    assert all(0 < result["recall"] <= 1 and result["rows"] >= 1000 for result in results)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,156 @@
+import re
+import pytest
+from datetime import datetime, timedelta
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import (
+    JSON, Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, MetaData, String, Table, event, func, inspect, text
+)
+from app.api.api_v1.endpoints.admin import stats_cache
+from app.core.config import settings
+from app.db.base import Base
+from app.db.migrations import upgrade_database
+from app.db.session import make_engine
+from app.models.models import CurrencyType, Transaction, TransactionStatus, TransactionType
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A database built by the migrations rather than create_all"""
+    engine = make_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    upgrade_database(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_migrations_build_the_models_schema(engine, tmp_path):
+    with engine.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+        assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == "0007"
+
+    # A database create_all built before migrations existed is adopted, not rebuilt
+    legacy = make_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    _pre_series_metadata().create_all(bind=legacy)
+    with legacy.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email, created_at) VALUES (1, 'alice@example.com', '2024-01-01'), (2, 'bob@example.com', '2024-01-01')"))
+        conn.execute(text("""INSERT INTO wallets (id, user_id, balances, created_at) VALUES
+            (1, 1, '{"USD": 12.345, "JPY": 99.6, "BONUS": 1}', '2024-01-01'), (2, 2, NULL, '2024-01-01')"""))
+    upgrade_database(legacy)
+    with legacy.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+        assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == "0007"
+        # Balances come out of the JSON column, rounded to each currency's minor unit
+        rows = {(wallet_id, currency): amount for wallet_id, currency, amount in conn.execute(
+            text("SELECT wallet_id, currency, amount_minor FROM wallet_balances")
+        )}
+    assert rows[(1, "USD")] == 1234 and rows[(1, "JPY")] == 100 and rows[(1, "BONUS")] == 100
+    assert rows[(1, "EUR")] == 0 and rows[(2, "USD")] == 0 and len(rows) == 12
+    assert "ix_transactions_currency_status" in {index["name"] for index in inspect(legacy).get_indexes("transactions")}
+    legacy.dispose()
+
+
+def _pre_series_metadata() -> MetaData:
+    """The tables as create_all built them before the first migration"""
+    metadata = MetaData()
+    common = lambda: [
+        Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+        Column("updated_at", DateTime(timezone=True)),
+        Column("is_deleted", Boolean),
+        Column("deleted_at", DateTime(timezone=True))
+    ]
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("email", String, unique=True, index=True),
+        Column("hashed_password", String),
+        Column("full_name", String),
+        Column("is_active", Boolean),
+        Column("is_admin", Boolean),
+        *common()
+    )
+    Table(
+        "admin_users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("email", String, unique=True, index=True),
+        Column("hashed_password", String),
+        Column("is_active", Boolean),
+        *common()
+    )
+    Table(
+        "wallets", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id"), unique=True),
+        Column("balances", JSON),
+        *common()
+    )
+    Table(
+        "transactions", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("sender_id", Integer, ForeignKey("users.id")),
+        Column("receiver_id", Integer, ForeignKey("users.id")),
+        Column("sender_wallet_id", Integer, ForeignKey("wallets.id")),
+        Column("receiver_wallet_id", Integer, ForeignKey("wallets.id")),
+        Column("amount", Float),
+        Column("currency", Enum(CurrencyType)),
+        Column("type", Enum(TransactionType)),
+        Column("status", Enum(TransactionStatus)),
+        Column("description", String),
+        Column("is_flagged", Boolean),
+        Column("flag_reason", String),
+        *common()
+    )
+    return metadata
+
+
+def _plan(conn, statement, parameters) -> list:
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+def test_hot_transaction_queries_use_indexes(client, db, engine, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    now = datetime.utcnow()
+    for minutes in range(30):
+        make_transaction(alice, bob, 10 + minutes, created_at=now - timedelta(minutes=minutes))
+        make_transaction(bob, alice, 5, type=TransactionType.DEPOSIT, created_at=now - timedelta(minutes=minutes))
+    flagged = db.query(Transaction).first()
+    flagged.is_flagged, flagged.flag_reason = True, "test"
+    db.commit()
+
+    stats_cache.clear()
+    statements = []
+    capture = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(engine, "before_cursor_execute", capture)
+    client.user = alice
+    for url in (
+        "/transactions/",
+        f"/transactions/admin/user/{bob.id}",
+        "/admin/flagged-transactions",
+        "/admin/stats",
+        "/admin/fraud-scan",
+    ):
+        client.get(f"{settings.API_V1_STR}{url}", params={"limit": 10} if "transactions/" in url else None)
+    event.remove(engine, "before_cursor_execute", capture)
+
+    reads = [(statement, parameters) for statement, parameters in statements
+             if statement.lstrip().startswith("SELECT") and re.search(r"\btransactions\b", statement)]
+    assert len(reads) >= 8
+    with engine.connect() as conn:
+        for statement, parameters in reads:
+            plan = _plan(conn, statement, parameters)
+            scans = [step for step in plan if re.match(r"SCAN transactions$", step)]
+            assert not scans, f"{statement}\n{plan}"
+
+        # The index each hot access path is meant to use
+        expected = {
+            "SELECT id FROM transactions WHERE sender_id = 1 ORDER BY created_at DESC, id DESC LIMIT 10":
+                "ix_transactions_sender_created_at_id",
+            "SELECT id FROM transactions WHERE receiver_id = 1 ORDER BY created_at DESC, id DESC LIMIT 10":
+                "ix_transactions_receiver_created_at_id",
+            "SELECT id FROM transactions WHERE is_flagged = 1 ORDER BY created_at DESC":
+                "ix_transactions_flagged_created_at",
+            "SELECT sum(amount) FROM transactions WHERE currency = 'USD' AND status = 'COMPLETED'":
+                "ix_transactions_currency_status",
+        }
+        for statement, index in expected.items():
+            assert any(index in step for step in _plan(conn, statement, ())), statement
@@ -0,0 +1,440 @@
+import csv
+import io
+import json
+import time
+import re
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.core.config import settings
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app.api.api_v1.endpoints import transactions as transactions_endpoint
+from app.models.models import CurrencyType, IdempotencyKey, LedgerEntry, Transaction, TransactionType, User, UserTxSummary, WalletBalance
+from app.services import balances as balances_service
+from app.services.balances import InsufficientFunds, withdraw
+from app.services.idempotency import request_hash, response_cache, save_response, stored_response
+from app.services.ledger import open_ledger, take_snapshots
+from app.services.transaction_export import export_transactions
+from app.services.system_counters import seed_counters
+from app.services.tx_summary import backfill_tx_summary
+
+
+def _walk(client, url, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page["items"]) <= limit
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_transaction_listings_page_by_cursor(client, db, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    now = datetime.utcnow()
+    same_time = now - timedelta(minutes=5)
+    mine = [
+        make_transaction(alice, bob, 10, created_at=now - timedelta(hours=2)),
+        make_transaction(bob, alice, 20, created_at=now - timedelta(hours=1)),
+        make_transaction(alice, alice, 30, type=TransactionType.DEPOSIT, created_at=same_time),
+        make_transaction(alice, bob, 40, created_at=same_time),
+        make_transaction(bob, alice, 50, created_at=same_time),
+        make_transaction(alice, alice, 60, type=TransactionType.WITHDRAWAL, created_at=now),
+    ]
+    other = make_transaction(bob, bob, 70, type=TransactionType.DEPOSIT, created_at=now - timedelta(minutes=1))
+    newest_first = [t.id for t in sorted(mine, key=lambda t: (t.created_at, t.id), reverse=True)]
+
+    client.user = alice
+    for limit in (1, 2, 4, 10):
+        assert _walk(client, f"{settings.API_V1_STR}/transactions/", limit) == newest_first
+        assert _walk(client, f"{settings.API_V1_STR}/transactions/admin/user/{alice.id}", limit) == newest_first
+
+    everything = sorted(mine + [other], key=lambda t: (t.created_at, t.id), reverse=True)
+    assert _walk(client, f"{settings.API_V1_STR}/transactions/admin/all", 3) == [t.id for t in everything]
+
+    assert client.get(f"{settings.API_V1_STR}/transactions/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get(
+        f"{settings.API_V1_STR}/transactions/", params={"limit": settings.MAX_PAGE_SIZE + 1}
+    ).status_code == 422
+
+
+def test_admin_export_streams_filtered_rows(client, db, engine, make_user, make_transaction):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    now = datetime.utcnow()
+    old = make_transaction(alice, bob, 10, created_at=now - timedelta(days=3))
+    recent = [make_transaction(alice, bob, amount, created_at=now - timedelta(minutes=amount)) for amount in (1, 2, 3)]
+    make_transaction(alice, alice, 99, type=TransactionType.DEPOSIT, currency=CurrencyType.EUR)
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/admin/export"
+
+    response = client.get(url, params={"start": (now - timedelta(days=1)).isoformat(), "type": "TRANSFER"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [t.id for t in recent]
+    assert rows[0]["type"] == "TRANSFER" and rows[0]["currency"] == "USD"
+
+    response = client.get(url, params={"format": "csv", "currency": "USD"})
+    records = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(record["id"]) for record in records] == [old.id] + [t.id for t in recent]
+    assert client.get(url, params={"format": "xml"}).status_code == 422
+
+    # One chunk per fetched batch, after the CSV header
+    chunks = list(export_transactions(engine, [], "csv", batch_size=2))
+    assert len(chunks) == 1 + 3
+
+
+def test_batch_creates_valid_items_in_one_commit(client, db, engine, make_user):
+    alice = make_user("alice@example.com", balances={"USD": 300.0})
+    bob = make_user("bob@example.com")
+    carol = User(email="carol@example.com", hashed_password="x", full_name="carol")
+    db.add(carol)
+    seed_counters(db)
+    db.commit()
+    client.user = alice
+
+    transfers = [{"amount": 1, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}] * 200
+    items = [
+        {"amount": 50, "currency": "USD", "type": "DEPOSIT"},
+        *transfers,
+        {"amount": 10, "currency": "USD", "type": "TRANSFER", "receiver_email": "carol@example.com"},
+        {"amount": 5, "currency": "USD", "type": "TRANSFER", "receiver_email": "nobody@example.com"},
+        {"amount": 1000, "currency": "USD", "type": "WITHDRAWAL"},
+        {"amount": -1, "currency": "USD", "type": "DEPOSIT"},
+    ]
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    response = client.post(f"{settings.API_V1_STR}/transactions/batch", json={"transactions": items})
+    event.remove(engine, "before_cursor_execute", count)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (202, 3)
+    errors = {result["index"]: result["error"] for result in body["results"] if not result["success"]}
+    assert errors == {
+        202: "Receiver with email nobody@example.com not found",
+        203: "Insufficient USD balance. Current balance: 140.0",
+        204: "Transaction amount must be greater than 0",
+    }
+    # Lookups and balance updates don't grow with the batch
+    other = [statement for statement in statements if not statement.startswith("INSERT INTO transactions")]
+    assert len(other) < 25
+
+    db.expire_all()
+    assert db.query(Transaction).count() == 202
+    assert alice.wallet.balances["USD"] == 300 + 50 - 200 - 10
+    assert bob.wallet.balances["USD"] == 200
+    assert carol.wallet is not None and carol.wallet.balances["USD"] == 10
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_idempotency_key_replays_first_response(client_session_per_request, db, engine, make_user, monkeypatch):
+    client = client_session_per_request
+    response_cache.clear()
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    make_user("bob@example.com")
+    client.user = alice
+    pending = transactions_endpoint.on_transactions_pending
+    monkeypatch.setattr(transactions_endpoint, "on_transactions_pending", lambda *args: (time.sleep(0.2), pending(*args)))
+
+    url = f"{settings.API_V1_STR}/transactions/"
+    payload = {"amount": 30, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}
+    headers = {"Idempotency-Key": "payroll-42"}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first, second = pool.map(lambda _: client.post(url, json=payload, headers=headers), range(2))
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+
+    # A later retry is served from the front cache without touching the database
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    retry = client.post(url, json=payload, headers=headers)
+    event.remove(engine, "before_cursor_execute", count)
+    assert retry.json() == first.json() and statements == []
+
+    # After a restart the stored copy is used
+    response_cache.clear()
+    assert client.post(url, json=payload, headers=headers).json() == first.json()
+    assert client.post(url, json={**payload, "amount": 31}, headers=headers).status_code == 422
+
+    db.expire_all()
+    assert db.query(Transaction).count() == 1
+    assert client.post(url, json=payload, headers={"Idempotency-Key": "payroll-43"}).json()["id"] != first.json()["id"]
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_saving_a_key_keeps_a_live_record_committed_meanwhile(db, engine, make_user):
+    response_cache.clear()
+    alice = make_user("alice@example.com")
+    other = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    fingerprint = request_hash({"amount": 30})
+
+    # An expired record for the key is cleared and replaced
+    db.add(IdempotencyKey(
+        user_id=alice.id, key="payroll-42", request_hash="stale", response={"id": 0},
+        expires_at=datetime.utcnow() - timedelta(hours=1)
+    ))
+    db.commit()
+    assert stored_response(db, alice.id, "payroll-42", fingerprint) is None
+    save_response(db, alice.id, "payroll-42", fingerprint, {"id": 1})
+    db.commit()
+    assert stored_response(db, alice.id, "payroll-42", fingerprint) == {"id": 1}
+
+    # A live record another request commits between our lookup and our save is kept
+    assert stored_response(db, alice.id, "payroll-43", fingerprint) is None
+    save_response(other, alice.id, "payroll-43", fingerprint, {"id": 2})
+    other.commit()
+    other.close()
+    save_response(db, alice.id, "payroll-43", fingerprint, {"id": 3})
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    response_cache.clear()
+    assert stored_response(db, alice.id, "payroll-43", fingerprint) == {"id": 2}
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_idempotency_key_lost_race_with_another_body_is_refused(client, db, engine, make_user, monkeypatch):
+    response_cache.clear()
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    make_user("bob@example.com")
+    client.user = alice
+    other = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # Another process commits the same key for a different body between our lookup and our commit
+    lookups = []
+    def racing_lookup(*args):
+        lookups.append(args)
+        replay = stored_response(*args)
+        if len(lookups) == 1:
+            session = other()
+            save_response(session, alice.id, "payroll-42", request_hash({"amount": 31}), {"id": 0})
+            session.commit()
+            session.close()
+        return replay
+    monkeypatch.setattr(transactions_endpoint, "stored_response", racing_lookup)
+
+    url = f"{settings.API_V1_STR}/transactions/"
+    payload = {"amount": 30, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}
+    response = client.post(url, json=payload, headers={"Idempotency-Key": "payroll-42"})
+    assert response.status_code == 422 and len(lookups) == 2
+    db.expire_all()
+    assert db.query(Transaction).count() == 0
+
+
+def test_balances_move_by_guarded_minor_unit_updates(client, db, engine, make_user):
+    alice = make_user("alice@example.com", balances={"USD": 10.05, "JPY": 500})
+    bob = make_user("bob@example.com")
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    for _ in range(3):
+        response = client.post(url, json={"amount": 0.1, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"})
+        assert response.status_code == 200, response.text
+    event.remove(engine, "before_cursor_execute", count)
+    # Balances change in place in the database, never by writing back a value read earlier
+    assert any("amount_minor >= " in statement for statement in statements)
+
+    response = client.post(url, json={"amount": 9.76, "currency": "USD", "type": "WITHDRAWAL"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient USD balance. Current balance: 9.75"
+    assert client.post(url, json={"amount": 0.5, "currency": "JPY", "type": "DEPOSIT"}).status_code == 400
+    assert client.post(url, json={"amount": 0.001, "currency": "USD", "type": "DEPOSIT"}).status_code == 400
+
+    db.expire_all()
+    assert alice.wallet.balances["USD"] == 9.75 and alice.wallet.balances["JPY"] == 500
+    assert bob.wallet.balances["USD"] == 0.3
+    rows = {(row.wallet_id, row.currency): row.amount_minor for row in db.query(WalletBalance)}
+    assert rows[(alice.wallet.id, CurrencyType.USD)] == 975
+    assert rows[(alice.wallet.id, CurrencyType.JPY)] == 500
+
+    # A debit decided on a stale read is refused by the database, not applied
+    with pytest.raises(InsufficientFunds):
+        withdraw(db, bob.wallet.id, CurrencyType.USD, 0.31)
+    db.rollback()
+
+
+@pytest.mark.parametrize("engine", ["file"], indirect=True)
+def test_concurrent_transfers_never_overdraw_one_wallet(client_session_per_request, db, make_user, monkeypatch):
+    client = client_session_per_request
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    receivers = [make_user(f"user{i}@example.com") for i in range(4)]
+    client.user = alice
+    # Widen the window between reading the wallet and claiming it, so requests collide
+    snapshot = balances_service.wallet_snapshot
+    retries = []
+    monkeypatch.setattr(balances_service, "wallet_snapshot", lambda *args: (time.sleep(0.005), snapshot(*args))[1])
+    monkeypatch.setattr(balances_service.logger, "info", lambda message: retries.append(message))
+
+    url = f"{settings.API_V1_STR}/transactions/"
+    payloads = [
+        {"amount": 3, "currency": "USD", "type": "TRANSFER", "receiver_email": receivers[i % 4].email}
+        for i in range(60)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda payload: client.post(url, json=payload), payloads))
+
+    codes = [response.status_code for response in responses]
+    assert set(codes) <= {200, 400, 409}
+    succeeded = codes.count(200)
+    assert succeeded >= 20 and retries
+
+    db.expire_all()
+    assert alice.wallet.balances["USD"] == 100 - 3 * succeeded >= 0
+    assert sum(user.wallet.balances["USD"] for user in receivers) == 3 * succeeded
+    assert db.query(Transaction).count() == succeeded
+    # Every debit claimed one version and every credit bumped one
+    assert alice.wallet.version == succeeded
+    assert sum(user.wallet.version for user in receivers) == succeeded
+
+
+def test_ledger_balances_every_transaction_and_answers_as_of(client, db, make_user):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    carol = make_user("carol@example.com", balances={"EUR": 50.0})
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+    wallet_url = f"{settings.API_V1_STR}/wallet/"
+
+    moments = [datetime.utcnow()]
+    client.post(url, json={"amount": 100, "currency": "USD", "type": "DEPOSIT"})
+    moments.append(datetime.utcnow())
+    client.post(url, json={"amount": 30, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"})
+    # Entries still inside the settle window wait for a later run
+    assert take_snapshots(db) == 0
+    assert take_snapshots(db, settle=timedelta(0)) == 2
+    db.commit()
+    assert take_snapshots(db, settle=timedelta(0)) == 0
+    moments.append(datetime.utcnow())
+    client.post(url, json={"amount": 20, "currency": "USD", "type": "WITHDRAWAL"})
+    transfers = [{"amount": 5, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}] * 2
+    client.post(f"{url}batch", json={"transactions": transfers})
+    moments.append(datetime.utcnow())
+
+    # One debit and one credit per transaction, summing to zero
+    legs = db.query(LedgerEntry.transaction_id, func.count(), func.sum(LedgerEntry.amount_minor)).group_by(LedgerEntry.transaction_id).all()
+    assert len(legs) == db.query(Transaction).count() == 5
+    assert all(count == 2 and total == 0 for _, count, total in legs)
+
+    expected = [0, 100, 70, 40]
+    for moment, usd in zip(moments, expected):
+        response = client.get(wallet_url, params={"as_of": moment.isoformat() + "Z"})
+        assert response.status_code == 200, response.text
+        assert response.json()["balances"]["USD"] == usd
+    client.user = bob
+    assert client.get(wallet_url, params={"as_of": moments[-1].isoformat()}).json()["balances"]["USD"] == 40
+
+    # Wallets that predate the ledger get opening entries, once, even if they transacted first
+    client.user = carol
+    client.post(url, json={"amount": 10, "currency": "EUR", "type": "TRANSFER", "receiver_email": "bob@example.com"})
+    assert open_ledger(db) == 1 and open_ledger(db) == 0
+    db.commit()
+    assert client.get(wallet_url, params={"as_of": datetime.utcnow().isoformat()}).json()["balances"]["EUR"] == 40
+
+    db.expire_all()
+    ledger = dict(db.query(LedgerEntry.wallet_id, func.sum(LedgerEntry.amount_minor)).group_by(LedgerEntry.wallet_id).all())
+    for user in (alice, bob, carol):
+        assert ledger[user.wallet.id] == sum(row.amount_minor for row in user.wallet.balance_rows)
+
+    entry = db.query(LedgerEntry).first()
+    entry.amount_minor += 1
+    with pytest.raises(ValueError, match="append-only"):
+        db.commit()
+    db.rollback()
+
+
+def test_tx_summary_tracks_transactions_and_matches_backfill(client, db, make_user):
+    alice = make_user("alice@example.com")
+    bob = make_user("bob@example.com")
+    carol = make_user("carol@example.com")
+    url = f"{settings.API_V1_STR}/transactions/"
+
+    client.user = alice
+    client.post(url, json={"amount": 100, "currency": "USD", "type": "DEPOSIT"})
+    client.post(url, json={"amount": 30, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"})
+    client.post(url, json={"amount": 500, "currency": "USD", "type": "WITHDRAWAL"})  # rejected, not counted
+    transfers = [{"amount": 5, "currency": "USD", "type": "TRANSFER", "receiver_email": "carol@example.com"}] * 3
+    client.post(f"{url}batch", json={"transactions": transfers})
+    client.user = bob
+    client.post(url, json={"amount": 10, "currency": "USD", "type": "WITHDRAWAL"})
+
+    def summaries():
+        db.expire_all()
+        return {
+            (row.user_id, row.currency): (row.sent_count, row.sent_volume, row.received_count, row.received_volume)
+            for row in db.query(UserTxSummary)
+        }
+
+    live = summaries()
+    usd = CurrencyType.USD
+    assert live == {
+        (alice.id, usd): (4, 45.0, 1, 100.0),
+        (bob.id, usd): (1, 10.0, 1, 30.0),
+        (carol.id, usd): (0, 0.0, 3, 15.0),
+    }
+    last_activity = db.query(UserTxSummary.last_activity_at).filter_by(user_id=alice.id).scalar()
+    assert last_activity == db.query(func.max(Transaction.created_at)).filter(Transaction.sender_id == alice.id).scalar()
+
+    assert backfill_tx_summary(db, chunk_size=2) == 3
+    assert summaries() == live
+
+    client.user = alice
+    leaders = client.get(f"{settings.API_V1_STR}/admin/top-users", params={"by": "volume", "limit": 2}).json()
+    assert [(user["email"], user["transaction_count"]) for user in leaders] == [
+        ("alice@example.com", 5), ("carol@example.com", 3)
+    ]
+
+
+def test_transfer_makes_a_fixed_number_of_round_trips(client, db, engine, make_user):
+    alice = make_user("alice@example.com", balances={"USD": 100.0})
+    bob = make_user("bob@example.com")
+    carol = User(email="carol@example.com", hashed_password="x", full_name="carol")
+    db.add(carol)
+    db.commit()
+    seed_counters(db)
+    db.commit()
+    client.user = alice
+    url = f"{settings.API_V1_STR}/transactions/"
+
+    def post(body):
+        statements = []
+        count = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", count)
+        response = client.post(url, json=body)
+        event.remove(engine, "before_cursor_execute", count)
+        assert response.status_code == 200, response.text
+        return response.json(), statements
+
+    transfer = {"amount": 1, "currency": "USD", "type": "TRANSFER", "receiver_email": "bob@example.com"}
+    post(transfer)  # first activity creates the per-user stats rows
+    body, statements = post(transfer)
+    assert body["receiver_wallet_id"] == bob.wallet.id and body["created_at"]
+    # Authentication, then the sender's wallet, receiver and receiver's wallet in one joined query
+    assert len([statement for statement in statements if "FROM users" in statement]) == 2
+    # The new row comes back from the INSERT rather than a reload after the commit
+    assert not any(re.match(r"\s*SELECT\b.*\bFROM transactions\b", statement, re.S) for statement in statements)
+    assert any(statement.startswith("INSERT INTO transactions") and "RETURNING" in statement for statement in statements)
+    assert len(statements) <= 16
+
+    # A receiver without a wallet gets one in the same commit, at the cost of its INSERTs only
+    body, statements = post({**transfer, "receiver_email": "carol@example.com"})
+    db.expire_all()
+    assert body["receiver_wallet_id"] == carol.wallet.id
+    assert carol.wallet.balances["USD"] == 1
+    assert len(statements) <= 20
+
+    body, statements = post({"amount": 5, "currency": "USD", "type": "DEPOSIT"})
+    assert len(statements) <= 12
@@ -2,7 +2,9 @@ from app.db.session import SessionLocal, engine
 from app.models.models import Base, User, AdminUser, Wallet
 from app.core.security import get_password_hash
 from app.core.config import settings
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
+from app.db.migrations import upgrade_database
+from app.services.system_counters import USERS, WALLETS, bump_counters, seed_counters
 from datetime import datetime
 import os
 import logging
@@ -17,13 +19,17 @@ def init_db():
         # Drop all tables first
         logger.info("Dropping all existing tables...")
         Base.metadata.drop_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
         
         # Create all tables
         logger.info("Creating database tables...")
-        Base.metadata.create_all(bind=engine)
+        upgrade_database(engine)
         
         db = SessionLocal()
         try:
+            seed_counters(db)
+
             # Create admin user
             admin = db.query(User).filter(User.email == "admin@example.com").first()
             if not admin:
@@ -36,6 +42,7 @@ def init_db():
                     created_at=datetime.utcnow()
                 )
                 db.add(admin)
+                bump_counters(db, {USERS: 1})
                 db.commit()
                 logger.info("Admin user created successfully")
             else:
@@ -52,6 +59,7 @@ def init_db():
                     created_at=datetime.utcnow()
                 )
                 db.add(test_user)
+                bump_counters(db, {USERS: 1})
                 db.commit()
                 db.refresh(test_user)
                 
@@ -61,6 +69,7 @@ def init_db():
                     created_at=datetime.utcnow()
                 )
                 db.add(test_wallet)
+                bump_counters(db, {WALLETS: 1})
                 db.commit()
                 logger.info("Test user and wallet created successfully")
             
@@ -0,0 +1,175 @@
+"""tables before migrations
+
+What the schema gained between the baseline and the first migration: the
+fraud scan checkpoints and per-user amount statistics, Idempotency-Key
+responses, balances as per-currency wallet_balances rows with a wallet
+version to compare-and-swap on, and the ledger with its snapshots.
+
+Balances are copied out of the wallets.balances JSON column, rounded to
+each currency's minor unit, and the column is dropped. Every step is
+skipped where it has already been done, so databases create_all built
+part way through the series, or whose balances were already copied into
+wallet_balances, upgrade through it too. Give the migrated wallets opening
+ledger entries afterwards with python -m app.services.ledger --open.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-17 11:02:37.915204
+
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Sequence, Union
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001a'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+currency_type = postgresql.ENUM('USD', 'EUR', 'GBP', 'JPY', 'INR', 'BONUS', name='currencytype', create_type=False)
+# Decimal places per currency as the JSON balances were rounded to when copied
+MINOR_UNIT_EXPONENTS = {'USD': 2, 'EUR': 2, 'GBP': 2, 'JPY': 0, 'INR': 2, 'BONUS': 2}
+
+
+def _columns(table: str) -> set:
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _copy_json_balances() -> None:
+    """One wallet_balances row per wallet and currency from wallets.balances, leaving rows already there alone"""
+    bind = op.get_bind()
+    wallet_balances = sa.table('wallet_balances', sa.column('wallet_id'), sa.column('currency'), sa.column('amount_minor'))
+    existing = {(wallet_id, currency) for wallet_id, currency in bind.execute(
+        sa.select(wallet_balances.c.wallet_id, wallet_balances.c.currency)
+    )}
+    rows = []
+    for wallet_id, balances in bind.execute(sa.text('SELECT id, balances FROM wallets')):
+        if isinstance(balances, str):
+            balances = json.loads(balances)
+        balances = balances or {}
+        for currency, exponent in MINOR_UNIT_EXPONENTS.items():
+            if (wallet_id, currency) in existing:
+                continue
+            amount = Decimal(str(balances.get(currency) or 0)).quantize(Decimal(1).scaleb(-exponent), rounding=ROUND_HALF_EVEN)
+            amount_minor = int(amount.scaleb(exponent))
+            if amount_minor < 0:
+                raise ValueError(f"Wallet {wallet_id} has a negative {currency} balance; fix it before migrating")
+            rows.append({'wallet_id': wallet_id, 'currency': currency, 'amount_minor': amount_minor})
+    if rows:
+        op.bulk_insert(wallet_balances, rows)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('job_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_transaction_id', sa.Integer(), nullable=False),
+    sa.Column('last_created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('name'),
+    if_not_exists=True
+    )
+
+    op.create_table('user_amount_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('currency', currency_type, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('m2', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'currency'),
+    if_not_exists=True
+    )
+
+    op.create_table('idempotency_keys',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('request_hash', sa.String(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('response', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'key'),
+    if_not_exists=True
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False, if_not_exists=True)
+
+    op.create_table('wallet_balances',
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('currency', currency_type, nullable=False),
+    sa.Column('amount_minor', sa.BigInteger(), nullable=False),
+    sa.CheckConstraint('amount_minor >= 0', name='ck_wallet_balances_non_negative'),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ),
+    sa.PrimaryKeyConstraint('wallet_id', 'currency'),
+    if_not_exists=True
+    )
+
+    columns = _columns('wallets')
+    if 'balances' in columns:
+        _copy_json_balances()
+    with op.batch_alter_table('wallets') as batch_op:
+        if 'version' not in columns:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+        if 'balances' in columns:
+            batch_op.drop_column('balances')
+
+    op.create_table('ledger_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('wallet_id', sa.Integer(), nullable=True),
+    sa.Column('currency', currency_type, nullable=False),
+    sa.Column('amount_minor', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    op.create_index('ix_ledger_entries_transaction_id', 'ledger_entries', ['transaction_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_ledger_entries_wallet_currency_id', 'ledger_entries', ['wallet_id', 'currency', 'id'], unique=False, if_not_exists=True)
+
+    op.create_table('wallet_balance_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('currency', currency_type, nullable=False),
+    sa.Column('amount_minor', sa.BigInteger(), nullable=False),
+    sa.Column('last_entry_id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    op.create_index('ix_wallet_balance_snapshots_wallet_taken_at', 'wallet_balance_snapshots', ['wallet_id', 'taken_at'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('wallet_balance_snapshots')
+    op.drop_table('ledger_entries')
+
+    # Balances go back into the JSON column, in major units
+    bind = op.get_bind()
+    with op.batch_alter_table('wallets') as batch_op:
+        batch_op.add_column(sa.Column('balances', sa.JSON(), nullable=True))
+        batch_op.drop_column('version')
+    balances = {}
+    for wallet_id, currency, amount_minor in bind.execute(sa.text('SELECT wallet_id, currency, amount_minor FROM wallet_balances')):
+        balances.setdefault(wallet_id, {})[currency] = amount_minor / 10 ** MINOR_UNIT_EXPONENTS[currency]
+    wallets = sa.table('wallets', sa.column('id'), sa.column('balances', sa.JSON()))
+    for wallet_id, wallet_balances in balances.items():
+        bind.execute(wallets.update().where(wallets.c.id == wallet_id).values(balances=wallet_balances))
+    op.drop_table('wallet_balances')
+
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
+    op.drop_table('user_amount_stats')
+    op.drop_table('job_checkpoints')
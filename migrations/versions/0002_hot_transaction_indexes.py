@@ -0,0 +1,47 @@
+"""hot transaction indexes
+
+Composite indexes for the per-party history and fraud windows, a partial
+index over flagged transactions and (currency, status) for admin volume.
+The keyset indexes end in id so they also serve cursor pagination; they
+cover the plain (sender_id, created_at) and (receiver_id, created_at)
+lookups as prefixes. IF NOT EXISTS because create_all already built some
+of them on databases stamped at the baseline.
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-16 23:20:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_transactions_created_at_id', 'transactions', ['created_at', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_transactions_sender_created_at_id', 'transactions', ['sender_id', 'created_at', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_transactions_receiver_created_at_id', 'transactions', ['receiver_id', 'created_at', 'id'], unique=False, if_not_exists=True)
+    op.create_index(
+        'ix_transactions_flagged_created_at', 'transactions', ['created_at'], unique=False, if_not_exists=True,
+        sqlite_where=sa.text('is_flagged = 1'),
+        postgresql_where=sa.text('is_flagged')
+    )
+    op.create_index('ix_transactions_currency_status', 'transactions', ['currency', 'status'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in (
+        'ix_transactions_currency_status', 'ix_transactions_flagged_created_at', 'ix_transactions_receiver_created_at_id',
+        'ix_transactions_sender_created_at_id', 'ix_transactions_created_at_id'
+    ):
+        op.drop_index(name, table_name='transactions')
@@ -0,0 +1,47 @@
+"""user tx summary
+
+Per-user, per-currency sent/received counts and volume, maintained with each
+transaction. Starts empty; fill it from existing transactions with
+python -m app.services.tx_summary. IF NOT EXISTS because create_all already
+built it on databases stamped at the baseline.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 23:48:12.602114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+currency_type = postgresql.ENUM('USD', 'EUR', 'GBP', 'JPY', 'INR', 'BONUS', name='currencytype', create_type=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_tx_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('currency', currency_type, nullable=False),
+    sa.Column('sent_count', sa.Integer(), nullable=False),
+    sa.Column('sent_volume', sa.Float(), nullable=False),
+    sa.Column('received_count', sa.Integer(), nullable=False),
+    sa.Column('received_volume', sa.Float(), nullable=False),
+    sa.Column('last_activity_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'currency'),
+    if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_tx_summary')
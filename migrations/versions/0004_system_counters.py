@@ -0,0 +1,39 @@
+"""system counters
+
+Sharded system-wide totals behind GET /admin/stats, maintained with each
+write. Starts empty; fill it from the base tables with
+python -m app.services.system_counters --repair. IF NOT EXISTS because
+create_all already built it on databases stamped at the baseline.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:21:37.480316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('system_counters',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name', 'shard'),
+    if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('system_counters')
@@ -0,0 +1,43 @@
+"""wallet total balance
+
+A maintained FX-normalized total per wallet, indexed for the balance
+leaderboard, and a (currency, amount_minor) index for the per-currency
+one. Totals start at zero; fill them with
+python -m app.services.leaderboard --recompute. The column and indexes
+are only added where create_all hasn't already built them on databases
+stamped at the baseline.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 01:12:08.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('wallets')}
+    if 'total_balance_minor' not in columns:
+        with op.batch_alter_table('wallets') as batch_op:
+            batch_op.add_column(sa.Column('total_balance_minor', sa.BigInteger(), server_default=sa.text('0'), nullable=False))
+    op.create_index('ix_wallets_total_balance_minor', 'wallets', ['total_balance_minor'], unique=False, if_not_exists=True)
+    op.create_index('ix_wallet_balances_currency_amount', 'wallet_balances', ['currency', 'amount_minor'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_wallet_balances_currency_amount', table_name='wallet_balances')
+    op.drop_index('ix_wallets_total_balance_minor', table_name='wallets')
+    with op.batch_alter_table('wallets') as batch_op:
+        batch_op.drop_column('total_balance_minor')
@@ -0,0 +1,52 @@
+"""volume rollups
+
+Hourly and daily transaction count, volume and flagged count per currency,
+type and status, behind GET /admin/volume-series. Kept current by the
+volume rollup job past its job_checkpoints mark; the job's first run (or
+python -m app.services.volume_rollups) fills them from existing
+transactions. IF NOT EXISTS because create_all already built them on
+databases stamped at the baseline.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 01:47:55.218930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+currency_type = postgresql.ENUM('USD', 'EUR', 'GBP', 'JPY', 'INR', 'BONUS', name='currencytype', create_type=False)
+transaction_type = postgresql.ENUM('DEPOSIT', 'WITHDRAWAL', 'TRANSFER', name='transactiontype', create_type=False)
+transaction_status = postgresql.ENUM('PENDING', 'COMPLETED', 'FAILED', 'CANCELLED', name='transactionstatus', create_type=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('volume_rollup_hourly', 'volume_rollup_daily'):
+        op.create_table(table,
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('currency', currency_type, nullable=False),
+        sa.Column('type', transaction_type, nullable=False),
+        sa.Column('status', transaction_status, nullable=False),
+        sa.Column('tx_count', sa.BigInteger(), nullable=False),
+        sa.Column('volume_minor', sa.BigInteger(), nullable=False),
+        sa.Column('flagged_count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket_start', 'currency', 'type', 'status'),
+        if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('volume_rollup_daily')
+    op.drop_table('volume_rollup_hourly')
@@ -0,0 +1,37 @@
+"""transaction reviewed_at
+
+When an admin reviewed a flagged transaction, so automated scans don't
+flag it again while it is still inside their windows. The column is only
+added where create_all hasn't already built it on databases stamped at
+the baseline.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 09:14:52.380611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, Sequence[str], None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('transactions')}
+    if 'reviewed_at' not in columns:
+        with op.batch_alter_table('transactions') as batch_op:
+            batch_op.add_column(sa.Column('reviewed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('reviewed_at')